@@ -0,0 +1,393 @@
+# access_tokens.py - טוקני גישה חתומים (HMAC) שמאומתים בלי מסד נתונים, טוקני רענון בשרת ורשימת ביטולים
+import os
+import hmac
+import json
+import math
+import time
+import base64
+import hashlib
+import secrets
+import datetime
+import sqlite3
+import threading
+from sqlite_pool import connect_db
+
+# טוקן גישה קצר - אחרי שפג, הלקוח מבקש חדש עם טוקן הרענון
+ACCESS_TOKEN_TTL_SECONDS = 15 * 60
+REFRESH_TOKEN_TTL_DAYS = 7
+ACCESS_TOKEN_PREFIX = 'at1.'
+
+# מסנן bloom לביטולים: 2^20 ביטים (128KB) ו-7 פונקציות hash - פחות מ-1% התאמות שגויות עד ~100 אלף ביטולים
+REVOCATION_FILTER_BITS = 1 << 20
+REVOCATION_FILTER_HASHES = 7
+# כל כמה זמן תהליך קורא ביטולים שנרשמו ע"י תהליכים אחרים
+REVOCATION_SYNC_SECONDS = 1.0
+
+# כמה כניסות פעילות (טוקני רענון) למשתמש - מעבר לזה נמחקת זו שלא נעשה בה שימוש הכי הרבה זמן
+MAX_TOKENS_PER_USER = 10
+# ניקוי טוקנים שפג תוקפם בקבוצות קטנות - כל קבוצה בטרנזקציה קצרה, כך שכניסות לא מחכות לניקוי
+PURGE_INTERVAL_SECONDS = 3600
+PURGE_BATCH_SIZE = 500
+PURGE_BATCH_PAUSE_SECONDS = 0.05
+# טבלאות עם expires_at שמנוקות, אם קיימות במסד הנתונים
+EXPIRING_TABLES = ('sessions', 'refresh_tokens', 'password_resets', 'password_reset_tokens')
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _hash_token(token):
+    """טוקני רענון נשמרים כ-hash בלבד"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def load_secret_key(secret_key_path='auth_secret.key'):
+    """מפתח החתימה - מ-AUTH_TOKEN_SECRET, או מקובץ משותף לכל ה-workers (נוצר פעם אחת)"""
+    key = os.getenv('AUTH_TOKEN_SECRET')
+    if key:
+        return key.encode('utf-8')
+    
+    if not os.path.exists(secret_key_path):
+        # כתיבה לקובץ זמני ו-link אטומי - רק התהליך הראשון יוצר מפתח, השאר קוראים אותו
+        temp_path = f"{secret_key_path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temp_path, secret_key_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+    with open(secret_key_path, 'rb') as f:
+        return f.read().strip()
+
+
+class RevocationFilter:
+    """מסנן bloom בזיכרון: "לא בוטל" בוודאות, או "אולי בוטל" - ואז בודקים בטבלה"""
+    
+    def __init__(self, bits=REVOCATION_FILTER_BITS, hashes=REVOCATION_FILTER_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray(bits // 8)
+    
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[4 * i:4 * i + 4], 'big') % self.bits
+    
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+    
+    def __contains__(self, key):
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class AccessTokens:
+    """טוקני גישה חתומים (משתמש, תפוגה, סוג מנוי) + טוקני רענון בטבלה + ביטולים (יציאה, איפוס סיסמה)"""
+    
+    def __init__(self, db_path, audience, secret_key_path='auth_secret.key',
+                 access_ttl_seconds=ACCESS_TOKEN_TTL_SECONDS, refresh_ttl_days=REFRESH_TOKEN_TTL_DAYS,
+                 max_tokens_per_user=MAX_TOKENS_PER_USER):
+        self.db_path = db_path
+        # טוקן של מערכת משתמשים אחת לא תקף באחרת (user_id שונים בכל מסד נתונים)
+        self.audience = audience
+        self.access_ttl_seconds = access_ttl_seconds
+        self.refresh_ttl_days = refresh_ttl_days
+        self.max_tokens_per_user = max_tokens_per_user
+        self._secret = load_secret_key(secret_key_path)
+        self._filter = RevocationFilter()
+        self._filter_lock = threading.Lock()
+        self._last_revocation_id = 0
+        self._last_sync = 0
+        self._last_purge = 0
+        self._purger = None
+        self._purger_pid = None
+        self._purger_stop = threading.Event()
+        self._purger_lock = threading.Lock()
+        self.init_database()
+        self._sync_revocations()
+    
+    def init_database(self):
+        """טבלאות טוקני רענון וביטולים"""
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS refresh_tokens (
+                token_hash TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                expires_at TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens (user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires ON refresh_tokens (expires_at)')
+        
+        # ביטולים נשמרים רק עד שכל טוקן גישה שהם חלים עליו פג - הטבלה נשארת קטנה
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS revoked_tokens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                token_key TEXT NOT NULL,
+                revoked_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_revoked_tokens_key ON revoked_tokens (token_key)')
+        
+        conn.commit()
+        conn.close()
+    
+    # --- טוקני גישה ---
+    
+    @staticmethod
+    def is_access_token(token):
+        """טוקן חתום (לעומת session token ישן שנבדק בטבלת sessions)"""
+        return bool(token) and token.startswith(ACCESS_TOKEN_PREFIX)
+    
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._secret, payload.encode('ascii'), hashlib.sha256).digest())
+    
+    def create_access_token(self, user_id, subscription_type):
+        now = time.time()
+        claims = {
+            'sub': user_id,
+            'aud': self.audience,
+            'tier': subscription_type,
+            # באלפיות שנייה - כניסה מיד אחרי איפוס סיסמה לא נחשבת כטוקן ישן. מעגלים כלפי מטה:
+            # טוקן שהונפק באותה אלפית שנייה לפני ביטול לא יכול לקבל זמן מאוחר מהביטול
+            'iat': math.floor(now * 1000) / 1000,
+            'exp': int(now) + self.access_ttl_seconds,
+            'jti': secrets.token_urlsafe(9)
+        }
+        payload = ACCESS_TOKEN_PREFIX + _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        return f"{payload}.{self._sign(payload)}"
+    
+    def verify(self, token):
+        """אימות חתימה, תפוגה וביטול - בלי מסד נתונים (חוץ מסנכרון ביטולים פעם בשנייה)"""
+        if not self.is_access_token(token):
+            return False, 'טוקן לא תקין'
+        payload, _, signature = token.rpartition('.')
+        if not payload or not token.isascii() or not hmac.compare_digest(signature, self._sign(payload)):
+            return False, 'טוקן לא תקין'
+        
+        try:
+            claims = json.loads(_b64decode(payload[len(ACCESS_TOKEN_PREFIX):]))
+        except ValueError:
+            return False, 'טוקן לא תקין'
+        
+        if claims.get('aud') != self.audience:
+            return False, 'טוקן לא תקין'
+        if claims['exp'] <= time.time():
+            return False, 'טוקן פג תוקף'
+        if self._is_revoked(claims):
+            return False, 'טוקן בוטל'
+        return True, claims
+    
+    def issue(self, user_id, subscription_type):
+        """טוקן גישה וטוקן רענון חדשים (בכניסה)"""
+        refresh_token = secrets.token_urlsafe(32)
+        expires_at = datetime.datetime.now() + datetime.timedelta(days=self.refresh_ttl_days)
+        
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO refresh_tokens (token_hash, user_id, expires_at)
+            VALUES (?, ?, ?)
+        ''', (_hash_token(refresh_token), user_id, expires_at.isoformat()))
+        # מגבלת כניסות למשתמש - רענון מחליף את הטוקן בחדש, כך שהוותיק ביותר הוא זה שלא היה בשימוש הכי הרבה זמן
+        cursor.execute('''
+            DELETE FROM refresh_tokens WHERE user_id = ? AND rowid NOT IN (
+                SELECT rowid FROM refresh_tokens WHERE user_id = ? ORDER BY rowid DESC LIMIT ?
+            )
+        ''', (user_id, user_id, self.max_tokens_per_user))
+        conn.commit()
+        conn.close()
+        
+        return {
+            'access_token': self.create_access_token(user_id, subscription_type),
+            'refresh_token': refresh_token,
+            'expires_in': self.access_ttl_seconds
+        }
+    
+    def use_refresh_token(self, refresh_token):
+        """טוקן רענון חד-פעמי: נמחק ומחזיר את המשתמש - (True, user_id) או (False, סיבה)"""
+        if not refresh_token:
+            return False, 'חסר טוקן רענון'
+        
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        token_hash = _hash_token(refresh_token)
+        cursor.execute('SELECT user_id, expires_at FROM refresh_tokens WHERE token_hash = ?', (token_hash,))
+        result = cursor.fetchone()
+        if not result:
+            conn.close()
+            return False, 'טוקן רענון לא תקין'
+        
+        user_id, expires_at = result
+        # רק אחת משתי בקשות רענון במקביל מוחקת את השורה
+        cursor.execute('DELETE FROM refresh_tokens WHERE token_hash = ?', (token_hash,))
+        used = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+        
+        if not used:
+            return False, 'טוקן רענון לא תקין'
+        if datetime.datetime.fromisoformat(expires_at) < datetime.datetime.now():
+            return False, 'טוקן רענון פג תוקף'
+        return True, user_id
+    
+    # --- ביטולים ---
+    
+    def revoke(self, claims, refresh_token=None):
+        """יציאה - ביטול טוקן הגישה עד שהוא פג, ומחיקת טוקן הרענון שלו"""
+        self._add_revocation(f"jti:{claims['jti']}", claims['exp'])
+        if refresh_token:
+            conn = connect_db(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM refresh_tokens WHERE token_hash = ? AND user_id = ?',
+                           (_hash_token(refresh_token), claims['sub']))
+            conn.commit()
+            conn.close()
+    
+    def revoke_user(self, user_id):
+        """איפוס סיסמה / השבתה - כל טוקני הגישה שהונפקו עד עכשיו בטלים, וכל טוקני הרענון נמחקים"""
+        self._add_revocation(f"user:{user_id}", time.time() + self.access_ttl_seconds)
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM refresh_tokens WHERE user_id = ?', (user_id,))
+        conn.commit()
+        conn.close()
+    
+    def _add_revocation(self, token_key, expires_at):
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO revoked_tokens (token_key, revoked_at, expires_at) VALUES (?, ?, ?)
+        ''', (token_key, time.time(), expires_at))
+        conn.commit()
+        conn.close()
+        # בתהליך הנוכחי הביטול תקף מיד
+        with self._filter_lock:
+            self._filter.add(token_key)
+    
+    def _sync_revocations(self):
+        """ביטולים חדשים מתהליכים אחרים לתוך המסנן. פעם בתקופת טוקן - ניקוי ביטולים שפגו ובנייה מחדש"""
+        now = time.time()
+        rebuild = now - self._last_purge >= self.access_ttl_seconds
+        
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        if rebuild:
+            cursor.execute('DELETE FROM revoked_tokens WHERE expires_at < ?', (now,))
+            conn.commit()
+            cursor.execute('SELECT id, token_key FROM revoked_tokens')
+        else:
+            cursor.execute('SELECT id, token_key FROM revoked_tokens WHERE id > ?', (self._last_revocation_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        with self._filter_lock:
+            if rebuild:
+                self._filter = RevocationFilter()
+                self._last_purge = now
+            for revocation_id, token_key in rows:
+                self._filter.add(token_key)
+                self._last_revocation_id = max(self._last_revocation_id, revocation_id)
+            self._last_sync = time.monotonic()
+    
+    def _is_revoked(self, claims):
+        if time.monotonic() - self._last_sync >= REVOCATION_SYNC_SECONDS:
+            self._sync_revocations()
+        
+        jti_key = f"jti:{claims['jti']}"
+        user_key = f"user:{claims['sub']}"
+        with self._filter_lock:
+            maybe_revoked = jti_key in self._filter or user_key in self._filter
+        if not maybe_revoked:
+            return False
+        
+        # המסנן אמר "אולי" - בדיקה מדויקת בטבלה
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT 1 FROM revoked_tokens
+            WHERE token_key = ? OR (token_key = ? AND revoked_at >= ?)
+            LIMIT 1
+        ''', (jti_key, user_key, claims['iat']))
+        revoked = cursor.fetchone() is not None
+        conn.close()
+        return revoked
+    
+    # --- ניקוי ---
+    
+    def purge_expired(self, batch_size=PURGE_BATCH_SIZE):
+        """מחיקת session tokens, טוקני רענון וטוקני איפוס שפג תוקפם, בקבוצות - מחזיר כמה נמחקו"""
+        conn = connect_db(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({','.join('?' * len(EXPIRING_TABLES))})
+        ''', EXPIRING_TABLES)
+        tables = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        deleted = 0
+        now = datetime.datetime.now().isoformat()
+        for table in tables:
+            while True:
+                conn = connect_db(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    DELETE FROM {table} WHERE rowid IN (
+                        SELECT rowid FROM {table} WHERE expires_at < ? LIMIT ?
+                    )
+                ''', (now, batch_size))
+                count = cursor.rowcount
+                conn.commit()
+                conn.close()
+                
+                deleted += count
+                if count < batch_size:
+                    break
+                # הפסקה קצרה בין קבוצות - כותבים אחרים מקבלים את הנעילה
+                time.sleep(PURGE_BATCH_PAUSE_SECONDS)
+        return deleted
+    
+    def start_purger(self, interval=PURGE_INTERVAL_SECONDS):
+        """ניקוי טוקנים שפג תוקפם ברקע - מיד ואז כל interval שניות"""
+        with self._purger_lock:
+            if self._purger_pid == os.getpid() and self._purger and self._purger.is_alive():
+                return True
+            
+            self._purger_stop = threading.Event()
+            self._purger = threading.Thread(target=self._purge_loop, args=(interval, self._purger_stop),
+                                            daemon=True, name='token-purger')
+            self._purger.start()
+            self._purger_pid = os.getpid()
+        
+        print(f"🧹 ניקוי טוקנים שפג תוקפם ברקע הופעל (כל {interval} שניות)")
+        return True
+    
+    def stop_purger(self):
+        with self._purger_lock:
+            self._purger_stop.set()
+            if self._purger:
+                self._purger.join(timeout=5)
+                self._purger = None
+    
+    def _purge_loop(self, interval, stop_event):
+        while True:
+            try:
+                deleted = self.purge_expired()
+                if deleted:
+                    print(f"🧹 נוקו {deleted} טוקנים שפג תוקפם ({self.db_path})")
+            except sqlite3.Error as e:
+                print(f"⚠️ שגיאה בניקוי טוקנים: {e}")
+            if stop_event.wait(interval):
+                break
@@ -1,26 +1,53 @@
 # app_simple.py - מערכת תמלול פשוטה למטפלים
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context
 import os
+import time
 import datetime
 import json
-import sqlite3
 import hashlib
 import secrets
-import shutil
+import threading
 from werkzeug.utils import secure_filename
-import tempfile
 from dotenv import load_dotenv
 import assemblyai as aai
+from job_queue import (JobQueue, JobWorkerPool, JOB_QUEUED, JOB_COMPLETED, JOB_FAILED, STAGE_PERCENT,
+                       STAGE_PREPROCESSING, STAGE_SUBMITTED, STAGE_PROVIDER_PROCESSING, STAGE_ENCRYPTING,
+                       STAGE_SAVED)
+from chunked_upload import ChunkedUploadManager
+from sqlite_pool import connect_db
+from token_cache import TokenCache, TOKEN_CACHE_TTL_SECONDS
+from access_tokens import AccessTokens
+from password_hashing import get_password_hasher
+from session_index import SessionIndex, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT
+from session_format import new_session_file
+from hebrew_search import blind_index, blind_query
+from session_export import EXPORT_FORMATS, iter_zip, iter_ndjson
+from urllib.parse import quote
+from transcript_cache import TranscriptCache, sha256_file, HASH_BLOCK_SIZE
+from segmented_transcription import SegmentedTranscriber
+from audio_preprocessing import AudioPreprocessor, map_to_original
+from transcription_backends import (AssemblyAIBackend, IvritAIBackend, LocalStandInBackend,
+                                    register_backend, get_backend, available_backends)
 
 # ייבוא מותנה של המערכת המאובטחת
 try:
-    from secure_assemblyai import SecureAssemblyAI
+    from secure_assemblyai import SecureAssemblyAI, secure_delete
     SECURE_ASSEMBLYAI_AVAILABLE = True
     print("✅ מערכת תמלול מאובטח זמינה")
 except ImportError as e:
     print(f"⚠️ מערכת תמלול מאובטח לא זמינה: {e}")
     SECURE_ASSEMBLYAI_AVAILABLE = False
     SecureAssemblyAI = None
+    secure_delete = None
+
+# טופסי טיפול ביצוא (treatment_form_generator.py דורש Python 3.12 ומעלה)
+try:
+    from treatment_form_generator import TreatmentFormGenerator
+    TREATMENT_FORMS_AVAILABLE = True
+except (ImportError, SyntaxError) as e:
+    print(f"⚠️ יצירת טופסי טיפול לא זמינה: {e}")
+    TREATMENT_FORMS_AVAILABLE = False
+    TreatmentFormGenerator = None
 
 # טעינת משתני סביבה
 load_dotenv()
@@ -46,16 +73,75 @@ app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['TRANSCRIPTS_FOLDER'], exist_ok=True)
 
+# אחסון סשנים חדשים - files: קובץ לכל סשן, segments: קבצי מקטע לכל משתמש עם דחיסה ברקע,
+# local/sqlite/s3: אחסון אובייקטים שכמה שרתים חולקים (הגדרות ב-session_storage.create_storage)
+SESSION_STORAGE = os.getenv('SESSION_STORAGE', 'files').lower()
+
+# אינדקס מטופלים וסשנים - ספירות ובדיקות קיום בלי לסרוק את תיקיית התמלולים
+session_index = SessionIndex(app.config['TRANSCRIPTS_FOLDER'], storage=SESSION_STORAGE)
+# מעקב אחרי שינויים ידניים בתיקייה (דורש watchdog)
+SESSION_INDEX_WATCH = os.getenv('SESSION_INDEX_WATCH', 'False').lower() == 'true'
+
 # מגבלות פשוטות מה-ENV
 MAX_PATIENTS = int(os.getenv('FREE_MAX_PATIENTS', '1'))
 MAX_SESSIONS = int(os.getenv('FREE_MAX_SESSIONS', '5'))
 
 print(f"🔧 מגבלות: {MAX_PATIENTS} מטופלים, {MAX_SESSIONS} סשנים")
 
+# תור עבודות תמלול משותף לכל ה-workers
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+job_queue = JobQueue()
+
+# שדות מתוצאת עבודה שהושלמה שנשמרים בתור - בלי טקסט התמלול
+JOB_RESULT_FIELDS = ('success', 'session_id', 'needs_decryption')
+
+# שידור התקדמות (SSE) - keep-alive לפרוקסי, וחיבור שנסגר אחרי זמן קצר כדי לא להחזיק thread
+# (הדפדפן מתחבר מחדש אוטומטית וממשיך מ-Last-Event-ID)
+SSE_KEEPALIVE_SECONDS = 15
+SSE_STREAM_SECONDS = int(os.getenv('SSE_STREAM_SECONDS', '60'))
+# כל שידור פתוח תופס thread של gunicorn - מעל התקרה מחזירים 503 והדפדפן עובר לשאילתות /jobs/<id>
+# (חייב להיות קטן מ-threads ב-gunicorn_config.py כדי שיישארו threads לשאר הבקשות)
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '16'))
+SSE_RETRY_AFTER_SECONDS = 5
+sse_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+# מנועי תמלול - נבחרים לפי quality_mode בכל בקשה
+register_backend('ivrit-ai', IvritAIBackend)
+if ASSEMBLYAI_API_KEY:
+    register_backend('assemblyai', lambda: AssemblyAIBackend(ASSEMBLYAI_API_KEY))
+# מנוע מקומי דטרמיניסטי לבדיקות עומס ולפיתוח בלי רשת
+if os.getenv('ENABLE_LOCAL_BACKEND', 'False').lower() == 'true':
+    register_backend('local', lambda: LocalStandInBackend(float(os.getenv('LOCAL_BACKEND_LATENCY', '0'))))
+    print("🧪 מנוע תמלול מקומי (local) זמין")
+
+# מטמון תמלולים - העלאה חוזרת של אותה הקלטה לא נשלחת (ומחויבת) שוב
+TRANSCRIPT_CACHE_SIZE = int(os.getenv('TRANSCRIPT_CACHE_MB', '100')) * 1024 * 1024
+transcript_cache = TranscriptCache(max_size_bytes=TRANSCRIPT_CACHE_SIZE)
+
+# תמלול בחלקים של הקלטות ארוכות - כמה חלקים נשלחים במקביל ואורך כל חלק בשניות
+SEGMENT_WORKERS = int(os.getenv('SEGMENT_WORKERS', '4'))
+SEGMENT_SECONDS = int(os.getenv('SEGMENT_SECONDS', '300'))
+
+# נרמול שמע לפני שליחה - רק למנועים שברשימה, בתהליכים נפרדים
+NORMALIZE_AUDIO_BACKENDS = {name.strip() for name in os.getenv('NORMALIZE_AUDIO_BACKENDS', 'assemblyai').split(',')
+                            if name.strip()}
+audio_preprocessor = AudioPreprocessor(max_workers=int(os.getenv('PREPROCESS_WORKERS', '2')))
+# חיתוך שקט (לפי בקשה) - שקט ארוך מ-MIN שניות מקוצר ל-KEEP שניות
+SILENCE_MIN_SECONDS = float(os.getenv('SILENCE_MIN_SECONDS', '2.0'))
+SILENCE_KEEP_SECONDS = float(os.getenv('SILENCE_KEEP_SECONDS', '0.5'))
+
+# העלאה בחלקים - כל בקשה קטנה, לכן תקרת הקובץ הכוללת יכולה להיות גבוהה מ-MAX_CONTENT_LENGTH
+MAX_CHUNKED_UPLOAD_SIZE = int(os.getenv('MAX_CHUNKED_UPLOAD_MB', '1024')) * 1024 * 1024
+chunked_uploads = ChunkedUploadManager(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'spool'),
+    max_upload_size=MAX_CHUNKED_UPLOAD_SIZE,
+    max_chunk_size=app.config['MAX_CONTENT_LENGTH']
+)
+
 # מערכת אימות פשוטה
 def init_auth_db():
     """יצירת בסיס נתונים פשוט לאימות"""
-    conn = sqlite3.connect('simple_users.db')
+    conn = connect_db('simple_users.db')
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -79,23 +165,134 @@ def init_auth_db():
         )
     ''')
     
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS password_resets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            reset_token TEXT UNIQUE,
+            expires_at TEXT,
+            used BOOLEAN DEFAULT FALSE,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # אינדקסים לניקוי לפי תפוגה ולמחיקה לפי משתמש - הטבלאות לא נסרקות כשהן גדלות
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_password_resets_expires ON password_resets (expires_at)')
+    
     conn.commit()
     conn.close()
 
 def hash_password(password):
-    """הצפנת סיסמה פשוטה"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """גיבוב סיסמה - אלגוריתם ועלות מכוילים (password_hashing.py)"""
+    return get_password_hasher().hash(password)
 
 def verify_password(password, password_hash):
-    """אימות סיסמה"""
-    return hashlib.sha256(password.encode()).hexdigest() == password_hash
+    """אימות סיסמה - גם מול גיבובי sha256 ישנים"""
+    return get_password_hasher().verify(password, password_hash)
 
 def create_session_token():
     """יצירת session token"""
     return secrets.token_urlsafe(32)
 
+def get_user_info(user_id):
+    """פרטי המשתמש שמוחזרים ללקוח (user_info)"""
+    conn = connect_db('simple_users.db')
+    cursor = conn.cursor()
+    cursor.execute('SELECT email, full_name FROM users WHERE id = ?', (user_id,))
+    result = cursor.fetchone()
+    conn.close()
+    
+    if not result:
+        return None
+    
+    email, full_name = result
+    return {
+        'user_id': user_id,
+        'email': email,
+        'full_name': full_name
+    }
+
 # אתחול בסיס נתונים
 init_auth_db()
+# כיול עלות גיבוב הסיסמאות בהפעלה - לא בכניסה הראשונה
+get_password_hasher()
+
+# טוקנים שאומתו לאחרונה - /auth/verify לא פונה למסד הנתונים בכל קריאה
+verified_tokens = TokenCache(int(os.getenv('TOKEN_CACHE_TTL_SECONDS', str(TOKEN_CACHE_TTL_SECONDS))))
+# טוקני גישה חתומים (נבדקים בלי מסד נתונים) וטוקני רענון - במערכת הפשוטה אין מנויים, כולם trial
+access_tokens = AccessTokens('simple_users.db', audience='simple_users',
+                             max_tokens_per_user=int(os.getenv('MAX_TOKENS_PER_USER', '10')))
+
+def authenticate_token(session_token):
+    """אימות טוקן גישה חתום או session token ישן - מחזיר (פרטי משתמש, None) או (None, שגיאה)"""
+    if access_tokens.is_access_token(session_token):
+        # טוקן חתום - חתימה, תפוגה וביטול נבדקים בזיכרון
+        is_valid, claims = access_tokens.verify(session_token)
+        if not is_valid:
+            return None, claims
+        
+        user_info = verified_tokens.get(session_token)
+        if not user_info:
+            user_info = get_user_info(claims['sub'])
+            if not user_info:
+                return None, 'Session לא תקין'
+            verified_tokens.put(session_token, user_info, claims['exp'] - time.time())
+        return user_info, None
+    
+    # session token ישן (לפני טוקני הגישה) - נבדק בטבלת sessions
+    user_info = verified_tokens.get(session_token)
+    if user_info:
+        return user_info, None
+    
+    conn = connect_db('simple_users.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT s.user_id, u.email, u.full_name, s.expires_at
+        FROM sessions s
+        JOIN users u ON s.user_id = u.id
+        WHERE s.session_token = ?
+    ''', (session_token,))
+    
+    result = cursor.fetchone()
+    conn.close()
+    
+    if not result:
+        return None, 'Session לא תקין'
+    
+    user_id, email, full_name, expires_at = result
+    
+    # בדיקת תוקף
+    expires_in = (datetime.datetime.fromisoformat(expires_at) - datetime.datetime.now()).total_seconds()
+    if expires_in < 0:
+        return None, 'Session פג תוקף'
+    
+    user_info = {
+        'user_id': user_id,
+        'email': email,
+        'full_name': full_name
+    }
+    verified_tokens.put(session_token, user_info, expires_in)
+    return user_info, None
+
+def request_user(allow_query_token=False):
+    """המשתמש המחובר לפי כותרת Authorization - None אם אין טוקן תקף"""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        session_token = auth_header[7:]
+    elif allow_query_token:
+        # EventSource בדפדפן לא שולח כותרות - הטוקן מגיע בפרמטר access_token
+        session_token = request.args.get('access_token', '')
+    else:
+        return None
+    
+    if not session_token:
+        return None
+    user_info, _ = authenticate_token(session_token)
+    return user_info
 
 # פונקציות עזר פשוטות
 def get_patient_folder(patient_name):
@@ -107,26 +304,13 @@ def get_patient_folder(patient_name):
     # יצירת תיקיית המטופל תחת user_1
     patient_folder = os.path.join(user_folder, safe_name)
     os.makedirs(patient_folder, exist_ok=True)
+    session_index.add_patient(patient_folder)
     return patient_folder
 
 def count_patients():
-    """ספירת מטופלים (תיקיות מטופלים בתוך user_X)"""
+    """ספירת מטופלים (תיקיות מטופלים בתוך user_X) - מהאינדקס"""
     try:
-        if not os.path.exists(app.config['TRANSCRIPTS_FOLDER']):
-            return 0
-        
-        count = 0
-        # חיפוש בתיקיות user_X
-        for item in os.listdir(app.config['TRANSCRIPTS_FOLDER']):
-            if item.startswith('user_'):
-                user_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], item)
-                if os.path.isdir(user_path):
-                    # ספירת תיקיות מטופלים בתוך user_X
-                    for patient_item in os.listdir(user_path):
-                        patient_path = os.path.join(user_path, patient_item)
-                        if os.path.isdir(patient_path):
-                            count += 1
-        
+        count = session_index.count_patients()
         print(f"👥 נמצאו {count} מטופלים")
         return count
     except Exception as e:
@@ -134,17 +318,9 @@ def count_patients():
         return 0
 
 def count_sessions():
-    """ספירת סשנים (קבצי JSON)"""
+    """ספירת סשנים (קבצי JSON) - מהאינדקס"""
     try:
-        if not os.path.exists(app.config['TRANSCRIPTS_FOLDER']):
-            return 0
-        
-        count = 0
-        for root, dirs, files in os.walk(app.config['TRANSCRIPTS_FOLDER']):
-            for file in files:
-                if file.endswith('.json'):
-                    count += 1
-        
+        count = session_index.count_sessions()
         print(f"📝 נמצאו {count} סשנים")
         return count
     except Exception as e:
@@ -155,15 +331,10 @@ def is_new_patient(patient_name):
     """בדיקה אם מטופל חדש (חיפוש בתוך user_X)"""
     patient_name = patient_name.strip()
     
-    # חיפוש בתיקיות user_X
-    for item in os.listdir(app.config['TRANSCRIPTS_FOLDER']):
-        if item.startswith('user_'):
-            user_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], item)
-            if os.path.isdir(user_path):
-                patient_path = os.path.join(user_path, patient_name)
-                if os.path.exists(patient_path):
-                    print(f"🆕 מטופל {patient_name} קיים ב-{item}")
-                    return False
+    user_folder = session_index.patient_exists(patient_name)
+    if user_folder:
+        print(f"🆕 מטופל {patient_name} קיים ב-{user_folder}")
+        return False
     
     print(f"🆕 מטופל {patient_name} חדש")
     return True
@@ -268,24 +439,24 @@ def save_session():
         
         # שמירת הסשן
         patient_folder = get_patient_folder(patient_name)
-        session_date = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        session_file = os.path.join(patient_folder, f"session_{session_date}.json")
+        session_file, session_id = new_session_file(patient_folder)
         
         session_data = {
+            'session_id': session_id,
             'patient_name': patient_name,
             'transcript_text': transcript_text,
             'created_at': datetime.datetime.now().isoformat(),
             'word_count': len(transcript_text.split())
         }
         
-        with open(session_file, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, ensure_ascii=False, indent=2)
+        session_id = session_index.save_session(session_file, session_data)
         
         print(f"✅ סשן נשמר: {session_file}")
         
         return jsonify({
             'success': True,
             'message': 'סשן נשמר בהצלחה',
+            'session_id': session_id,
             'current_patients': count_patients(),
             'current_sessions': count_sessions()
         })
@@ -300,22 +471,16 @@ def get_patients():
     try:
         patients = []
         
-        if os.path.exists(app.config['TRANSCRIPTS_FOLDER']):
-            # חיפוש בתיקיות user_X
-            for item in os.listdir(app.config['TRANSCRIPTS_FOLDER']):
-                if item.startswith('user_'):
-                    user_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], item)
-                    if os.path.isdir(user_path):
-                        # חיפוש מטופלים בתוך תיקיית המשתמש
-                        for patient_name in os.listdir(user_path):
-                            patient_path = os.path.join(user_path, patient_name)
-                            if os.path.isdir(patient_path) and not patient_name.startswith('.') and not patient_name.startswith('privacy'):
-                                # ספירת סשנים של המטופל
-                                session_count = len([f for f in os.listdir(patient_path) if f.endswith('.json')])
-                                patients.append({
-                                    'name': patient_name,  # שם המטופל האמיתי
-                                    'session_count': session_count
-                                })
+        # מטופלים ומספר הסשנים של כל אחד - מהאינדקס
+        for patient in session_index.list_patients():
+            if not patient['user_folder'].startswith('user_'):
+                continue
+            if patient['name'].startswith('.') or patient['name'].startswith('privacy'):
+                continue
+            patients.append({
+                'name': patient['name'],  # שם המטופל האמיתי
+                'session_count': patient['session_count']
+            })
         
         return jsonify({
             'success': True,
@@ -329,75 +494,280 @@ def get_patients():
 
 @app.route('/patients/<patient_name>/sessions')
 def get_patient_sessions(patient_name):
-    """קבלת סשנים של מטופל ספציפי"""
+    """רשימת הסשנים של מטופל - מטא-דאטה בלבד, בעמודים (התוכן נטען ב-/patients/<name>/session/<file>)"""
     try:
-        sessions = []
-        
-        if os.path.exists(app.config['TRANSCRIPTS_FOLDER']):
-            # חיפוש בתיקיות user_X
-            for item in os.listdir(app.config['TRANSCRIPTS_FOLDER']):
-                if item.startswith('user_'):
-                    user_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], item)
-                    patient_path = os.path.join(user_path, patient_name)
-                    
-                    if os.path.exists(patient_path) and os.path.isdir(patient_path):
-                        # קריאת כל קבצי הסשנים
-                        for filename in os.listdir(patient_path):
-                            if filename.endswith('.json'):
-                                session_file = os.path.join(patient_path, filename)
-                                try:
-                                    with open(session_file, 'r', encoding='utf-8') as f:
-                                        session_data = json.load(f)
-                                    
-                                    # הוספת מידע נוסף על הסשן
-                                    session_info = {
-                                        'filename': filename,
-                                        'session_date': session_data.get('session_date', ''),
-                                        'created_at': session_data.get('created_at', ''),
-                                        'word_count': session_data.get('word_count', 0),
-                                        'original_transcript': session_data.get('original_transcript', ''),
-                                        'corrected_transcript': session_data.get('corrected_transcript', ''),
-                                        'audio_filename': session_data.get('audio_filename', ''),
-                                        'quality_mode': session_data.get('quality_mode', 'whisper')
-                                    }
-                                    
-                                    # עיצוב תאריך יפה
-                                    if session_info['created_at']:
-                                        try:
-                                            dt = datetime.datetime.fromisoformat(session_info['created_at'].replace('Z', '+00:00'))
-                                            session_info['formatted_date'] = dt.strftime('%d/%m/%Y')
-                                            session_info['formatted_time'] = dt.strftime('%H:%M')
-                                            session_info['formatted_datetime'] = dt.strftime('%d/%m/%Y %H:%M')
-                                        except:
-                                            session_info['formatted_date'] = session_info['session_date'] or 'לא ידוע'
-                                            session_info['formatted_time'] = ''
-                                            session_info['formatted_datetime'] = session_info['created_at']
-                                    else:
-                                        session_info['formatted_date'] = session_info['session_date'] or 'לא ידוע'
-                                        session_info['formatted_time'] = ''
-                                        session_info['formatted_datetime'] = 'לא ידוע'
-                                    
-                                    sessions.append(session_info)
-                                    
-                                except Exception as e:
-                                    print(f"❌ שגיאה בקריאת סשן {filename}: {e}")
-                                    continue
-                        break
-        
-        # מיון הסשנים לפי תאריך (החדשים ראשונים)
-        sessions.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        # ?limit=&cursor= לעמודים, ?from=&to= (YYYY-MM-DD) לטווח תאריכים
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        cursor = request.args.get('cursor') or None
+        date_from = request.args.get('from') or None
+        date_to = request.args.get('to') or None
+        
+        sessions, next_cursor = [], None
+        total_sessions = 0
+        
+        user_folder = session_index.patient_exists(patient_name)
+        if user_folder:
+            try:
+                sessions, next_cursor = session_index.list_sessions(user_folder, patient_name, limit=limit,
+                                                                    cursor=cursor, date_from=date_from,
+                                                                    date_to=date_to)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            total_sessions = session_index.count_patient_sessions(user_folder, patient_name)
+        
+        for session_info in sessions:
+            session_info['quality_mode'] = session_info['quality_mode'] or 'whisper'
+            session_info.update(format_session_dates(session_info['created_at'], session_info['session_date']))
         
         return jsonify({
             'success': True,
             'patient_name': patient_name,
             'sessions': sessions,
-            'total_sessions': len(sessions)
+            'total_sessions': total_sessions,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
         print(f"❌ שגיאה בקבלת סשנים למטופל {patient_name}: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/search')
+def search_sessions():
+    """חיפוש מלא בתמלולים (?q=, אפשר לצמצם ל-?patient=) - הסשנים המתאימים ביותר עם קטע סביב ההתאמות"""
+    try:
+        # בדיקת אימות - החיפוש רק בסשנים שהמשתמש עצמו תמלל
+        user_info = request_user()
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        query = (request.args.get('q') or '').strip()
+        patient_name = request.args.get('patient') or None
+        limit = request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int)
+        
+        if not query:
+            return jsonify({'error': 'חסר טקסט לחיפוש (q)'}), 400
+        if not session_index.search_available:
+            return jsonify({'error': 'חיפוש בתמלולים לא זמין בשרת זה'}), 503
+        
+        start_time = time.time()
+        results = session_index.search(query, user_id=user_info['user_id'], patient_name=patient_name,
+                                       limit=limit)
+        for result in results:
+            result.update(format_session_dates(result['created_at'], result['session_date']))
+        
+        print(f"🔍 חיפוש '{query}': {len(results)} תוצאות ב-{(time.time() - start_time) * 1000:.1f}ms")
+        
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results
+        })
+        
+    except Exception as e:
+        print(f"❌ שגיאה בחיפוש: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search/secure', methods=['POST'])
+def search_secure_sessions():
+    """חיפוש בסשנים מוצפנים דרך האינדקס העיוור - השאילתה עוברת HMAC עם מפתח שנגזר מהסיסמה, בלי לפענח סשנים"""
+    try:
+        # בדיקת אימות - החיפוש רק בסשנים שהמשתמש עצמו תמלל
+        user_info = request_user()
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        data = request.json or {}
+        query = (data.get('query') or '').strip()
+        password = (data.get('password') or '').strip()
+        patient_name = (data.get('patient_name') or '').strip() or None
+        limit = int(data.get('limit') or DEFAULT_SEARCH_LIMIT)
+        
+        if not query or not password:
+            return jsonify({'error': 'חסרים נתונים נדרשים'}), 400
+        
+        if not SECURE_ASSEMBLYAI_AVAILABLE or SecureAssemblyAI is None:
+            return jsonify({
+                'error': 'מערכת הצפנה לא זמינה',
+                'message': 'חסרה ספריית ההצפנה'
+            }), 503
+        
+        start_time = time.time()
+        # סיסמה שגויה נותנת טוקנים אחרים - פשוט אין תוצאות
+        secure_ai = SecureAssemblyAI(ASSEMBLYAI_API_KEY, password)
+        results = session_index.blind_search(blind_query(query, secure_ai.search_key),
+                                             user_id=user_info['user_id'], patient_name=patient_name,
+                                             limit=limit)
+        for result in results:
+            result.update(format_session_dates(result['created_at'], result['session_date']))
+        
+        print(f"🔍 חיפוש עיוור: {len(results)} סשנים מוצפנים ב-{(time.time() - start_time) * 1000:.1f}ms")
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'unindexed_sessions': len(session_index.sessions_without_blind_index(user_info['user_id']))
+        })
+        
+    except Exception as e:
+        print(f"❌ שגיאה בחיפוש בסשנים מוצפנים: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search/secure/backfill', methods=['POST'])
+def backfill_blind_index():
+    """בניית אינדקס עיוור לסשנים מוצפנים ישנים - כל סשן מפוענח פעם אחת בזיכרון, והטקסט לא נשמר"""
+    try:
+        # בדיקת אימות - רק הסשנים שהמשתמש עצמו תמלל
+        user_info = request_user()
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        data = request.json or {}
+        password = (data.get('password') or '').strip()
+        if not password:
+            return jsonify({'error': 'חסרים נתונים נדרשים'}), 400
+        
+        if not SECURE_ASSEMBLYAI_AVAILABLE or SecureAssemblyAI is None:
+            return jsonify({
+                'error': 'מערכת הצפנה לא זמינה',
+                'message': 'חסרה ספריית ההצפנה'
+            }), 503
+        
+        secure_ai = SecureAssemblyAI(ASSEMBLYAI_API_KEY, password)
+        indexed, skipped = 0, 0
+        for session_file in session_index.sessions_without_blind_index(user_info['user_id']):
+            session_data = session_index.read_session(session_file)
+            try:
+                text = secure_ai.decrypt_transcript(session_data['encrypted_transcript'])
+            except Exception:
+                # סשן שהוצפן בסיסמה אחרת
+                skipped += 1
+                continue
+            session_data['blind_index'] = blind_index(text, secure_ai.search_key)
+            del text
+            session_index.save_session(session_file, session_data)
+            indexed += 1
+        
+        print(f"🔐 אינדקס עיוור: {indexed} סשנים נוספו, {skipped} דולגו (סיסמה אחרת)")
+        
+        return jsonify({
+            'success': True,
+            'indexed_sessions': indexed,
+            'skipped_sessions': skipped
+        })
+        
+    except Exception as e:
+        print(f"❌ שגיאה בבניית אינדקס עיוור: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/patients/<patient_name>/export')
+def export_patient_sessions(patient_name):
+    """יצוא כל הסשנים של מטופל בזרימה (?format=zip|ndjson, ?render=word לטופס טיפול לכל סשן)"""
+    try:
+        # בדיקת אימות - יוצאים רק הסשנים שהמשתמש עצמו תמלל
+        user_info = request_user()
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        export_format = request.args.get('format', 'zip')
+        render_word = request.args.get('render') == 'word'
+        
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"פורמט לא נתמך - {', '.join(EXPORT_FORMATS)}"}), 400
+        if render_word and not TREATMENT_FORMS_AVAILABLE:
+            return jsonify({'error': 'יצירת טופסי טיפול לא זמינה בשרת זה'}), 503
+        
+        user_folder = session_index.patient_exists(patient_name, user_id=user_info['user_id'])
+        if not user_folder:
+            return jsonify({'error': 'מטופל לא נמצא'}), 404
+        
+        records = iter_export_records(user_folder, patient_name,
+                                      TreatmentFormGenerator() if render_word else None,
+                                      user_id=user_info['user_id'])
+        if export_format == 'zip':
+            body = iter_zip(export_zip_entries(records))
+            mimetype = 'application/zip'
+        else:
+            body = iter_ndjson(record for record, _ in records)
+            mimetype = 'application/x-ndjson'
+        
+        download_name = f"{patient_name}_sessions.{export_format}"
+        return Response(stream_with_context(body), mimetype=mimetype, headers={
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}",
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except Exception as e:
+        print(f"❌ שגיאה ביצוא סשנים של {patient_name}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def iter_export_records(user_folder, patient_name, form_generator=None, user_id=None):
+    """הסשנים של המטופל אחד-אחד, עמוד אחרי עמוד מהאינדקס - מניב (סשן, טופס טיפול או None)"""
+    patient_folder = os.path.join(app.config['TRANSCRIPTS_FOLDER'], user_folder, patient_name)
+    exported = 0
+    cursor = None
+    while True:
+        sessions, cursor = session_index.list_sessions(user_folder, patient_name, cursor=cursor, user_id=user_id)
+        for session_info in sessions:
+            try:
+                session_data = session_index.read_session(os.path.join(patient_folder, session_info['filename']))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ סשן לא נכלל ביצוא {session_info['filename']}: {e}")
+                continue
+            
+            # סשן מוצפן יוצא כמו שהוא - בלי פענוח
+            session_data.pop('blind_index', None)
+            session_data['session_id'] = session_info['session_id']
+            session_data['session_filename'] = session_info['filename']
+            
+            form_text = None
+            text = (session_data.get('corrected_transcript') or session_data.get('transcript_text')
+                    or session_data.get('original_transcript'))
+            if form_generator and text and not session_data.get('is_encrypted'):
+                form = form_generator.generate_treatment_form(text, patient_name,
+                                                              session_data.get('session_date', ''))
+                form_text = form_generator.export_to_word_format(form)
+                session_data['treatment_form'] = form_text
+            
+            exported += 1
+            yield session_data, form_text
+        
+        if not cursor:
+            break
+    
+    print(f"📦 יוצאו {exported} סשנים של {patient_name}")
+
+def export_zip_entries(records):
+    """קבצי הארכיון - JSON לכל סשן, וטופס טיפול לצידו אם נוצר"""
+    for session_data, form_text in records:
+        base_name = os.path.splitext(session_data['session_filename'])[0]
+        created_at = session_data.get('created_at')
+        yield (f"{base_name}.json", json.dumps(session_data, ensure_ascii=False, indent=2).encode('utf-8'),
+               created_at)
+        if form_text:
+            yield f"{base_name}_treatment_form.txt", form_text.encode('utf-8'), created_at
+
+def format_session_dates(created_at, session_date):
+    """עיצוב תאריך יפה לתצוגה"""
+    if created_at:
+        try:
+            dt = datetime.datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+            return {
+                'formatted_date': dt.strftime('%d/%m/%Y'),
+                'formatted_time': dt.strftime('%H:%M'),
+                'formatted_datetime': dt.strftime('%d/%m/%Y %H:%M')
+            }
+        except ValueError:
+            return {
+                'formatted_date': session_date or 'לא ידוע',
+                'formatted_time': '',
+                'formatted_datetime': created_at
+            }
+    return {
+        'formatted_date': session_date or 'לא ידוע',
+        'formatted_time': '',
+        'formatted_datetime': 'לא ידוע'
+    }
+
 # נתיבי אימות פשוטים
 @app.route('/auth/register', methods=['POST'])
 def register():
@@ -414,7 +784,7 @@ def register():
         if len(password) < 6:
             return jsonify({'error': 'הסיסמה חייבת להכיל לפחות 6 תווים'}), 400
         
-        conn = sqlite3.connect('simple_users.db')
+        conn = connect_db('simple_users.db')
         cursor = conn.cursor()
         
         # בדיקה אם המשתמש כבר קיים
@@ -451,7 +821,7 @@ def login():
         if not email or not password:
             return jsonify({'error': 'חסרים נתונים'}), 400
         
-        conn = sqlite3.connect('simple_users.db')
+        conn = connect_db('simple_users.db')
         cursor = conn.cursor()
         
         # בדיקת משתמש
@@ -462,24 +832,23 @@ def login():
             conn.close()
             return jsonify({'error': 'אימייל או סיסמה שגויים'}), 401
         
-        user_id, _, full_name = user
+        user_id, password_hash, full_name = user
         
-        # יצירת session token
-        session_token = create_session_token()
-        expires_at = (datetime.datetime.now() + datetime.timedelta(days=7)).isoformat()
-        
-        cursor.execute('''
-            INSERT INTO sessions (user_id, session_token, expires_at)
-            VALUES (?, ?, ?)
-        ''', (user_id, session_token, expires_at))
-        
-        conn.commit()
+        # גיבוב ישן (sha256) או בעלות נמוכה מהמכוילת - גיבוב מחדש עכשיו כשהסיסמה ידועה
+        if get_password_hasher().needs_rehash(password_hash):
+            cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (hash_password(password), user_id))
+            conn.commit()
         conn.close()
         
+        # טוקן גישה חתום + טוקן רענון (session_token נשאר השם שהלקוח מכיר)
+        tokens = access_tokens.issue(user_id, 'trial')
+        
         print(f"✅ משתמש נכנס: {email}")
         return jsonify({
             'success': True,
-            'session_token': session_token,
+            'session_token': tokens['access_token'],
+            'refresh_token': tokens['refresh_token'],
+            'expires_in': tokens['expires_in'],
             'user_info': {
                 'email': email,
                 'full_name': full_name,
@@ -502,40 +871,40 @@ def verify_session():
         
         session_token = auth_header[7:]  # הסרת "Bearer "
         
-        conn = sqlite3.connect('simple_users.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT s.user_id, u.email, u.full_name, s.expires_at
-            FROM sessions s
-            JOIN users u ON s.user_id = u.id
-            WHERE s.session_token = ?
-        ''', (session_token,))
-        
-        result = cursor.fetchone()
-        conn.close()
+        user_info, error = authenticate_token(session_token)
+        if not user_info:
+            return jsonify({'error': error}), 401
         
-        if not result:
-            return jsonify({'error': 'Session לא תקין'}), 401
+        return jsonify({
+            'success': True,
+            'user_info': user_info
+        })
         
-        user_id, email, full_name, expires_at = result
+    except Exception as e:
+        print(f"❌ שגיאה באימות: {e}")
+        return jsonify({'error': 'שגיאה באימות'}), 500
+
+@app.route('/auth/refresh', methods=['POST'])
+def refresh_session():
+    """טוקן גישה חדש תמורת טוקן רענון - טוקן הרענון חד-פעמי ומוחלף בחדש"""
+    try:
+        data = request.get_json(silent=True) or {}
         
-        # בדיקת תוקף
-        if datetime.datetime.fromisoformat(expires_at) < datetime.datetime.now():
-            return jsonify({'error': 'Session פג תוקף'}), 401
+        is_valid, user_id = access_tokens.use_refresh_token(data.get('refresh_token', ''))
+        if not is_valid:
+            return jsonify({'error': user_id}), 401
         
+        tokens = access_tokens.issue(user_id, 'trial')
         return jsonify({
             'success': True,
-            'user_info': {
-                'user_id': user_id,
-                'email': email,
-                'full_name': full_name
-            }
+            'session_token': tokens['access_token'],
+            'refresh_token': tokens['refresh_token'],
+            'expires_in': tokens['expires_in']
         })
         
     except Exception as e:
-        print(f"❌ שגיאה באימות: {e}")
-        return jsonify({'error': 'שגיאה באימות'}), 500
+        print(f"❌ שגיאה ברענון טוקן: {e}")
+        return jsonify({'error': 'שגיאה ברענון טוקן'}), 500
 
 @app.route('/auth/logout', methods=['POST'])
 def logout():
@@ -545,11 +914,19 @@ def logout():
         if auth_header and auth_header.startswith('Bearer '):
             session_token = auth_header[7:]
             
-            conn = sqlite3.connect('simple_users.db')
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM sessions WHERE session_token = ?', (session_token,))
-            conn.commit()
-            conn.close()
+            if access_tokens.is_access_token(session_token):
+                # ביטול טוקן הגישה (לכל ה-workers) ומחיקת טוקן הרענון שנשלח איתו
+                is_valid, claims = access_tokens.verify(session_token)
+                if is_valid:
+                    data = request.get_json(silent=True) or {}
+                    access_tokens.revoke(claims, data.get('refresh_token'))
+            else:
+                conn = connect_db('simple_users.db')
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM sessions WHERE session_token = ?', (session_token,))
+                conn.commit()
+                conn.close()
+            verified_tokens.invalidate(session_token)
         
         return jsonify({'success': True, 'message': 'יציאה בהצלחה'})
         
@@ -567,7 +944,7 @@ def forgot_password():
         if not email:
             return jsonify({'error': 'חסר אימייל'}), 400
         
-        conn = sqlite3.connect('simple_users.db')
+        conn = connect_db('simple_users.db')
         cursor = conn.cursor()
         
         # בדיקה אם המשתמש קיים
@@ -587,19 +964,7 @@ def forgot_password():
         reset_token = secrets.token_urlsafe(32)
         expires_at = (datetime.datetime.now() + datetime.timedelta(hours=1)).isoformat()
         
-        # שמירת טוקן איפוס (נוסיף טבלה אם לא קיימת)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS password_resets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                reset_token TEXT UNIQUE,
-                expires_at TEXT,
-                used BOOLEAN DEFAULT FALSE,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
+        # שמירת טוקן איפוס
         cursor.execute('''
             INSERT INTO password_resets (user_id, reset_token, expires_at)
             VALUES (?, ?, ?)
@@ -641,7 +1006,7 @@ def reset_password():
         if len(new_password) < 6:
             return jsonify({'error': 'הסיסמה חייבת להכיל לפחות 6 תווים'}), 400
         
-        conn = sqlite3.connect('simple_users.db')
+        conn = connect_db('simple_users.db')
         cursor = conn.cursor()
         
         # בדיקת טוקן
@@ -682,6 +1047,8 @@ def reset_password():
         
         conn.commit()
         conn.close()
+        access_tokens.revoke_user(user_id)
+        verified_tokens.invalidate_user(user_id)
         
         print(f"✅ סיסמה אופסה בהצלחה למשתמש: {email}")
         
@@ -728,19 +1095,133 @@ def check_session_limit():
         'sessions_remaining': MAX_SESSIONS - current_sessions
     })
 
+def save_upload_for_job(audio_file):
+    """שמירת קובץ השמע בתיקיית ההעלאות עד שה-worker יעבד אותו"""
+    filename = secure_filename(audio_file.filename) or 'audio'
+    # קידומת ייחודית - שתי העלאות עם אותו שם קובץ לא ידרסו זו את זו
+    stored_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{secrets.token_hex(8)}_{filename}")
+    
+    # hash מחושב תוך כדי שמירה - מפתח למטמון התמלולים בלי לקרוא את הקובץ שוב
+    audio_hash = hashlib.sha256()
+    with open(stored_path, 'wb') as f:
+        for block in iter(lambda: audio_file.stream.read(HASH_BLOCK_SIZE), b''):
+            audio_hash.update(block)
+            f.write(block)
+    
+    return filename, stored_path, audio_hash.hexdigest()
+
+def check_transcription_limits(patient_name):
+    """בדיקת מגבלות מטופלים וסשנים לפני תמלול - מחזיר תשובת שגיאה או None"""
+    can_add_patient, patient_message = check_patient_limit(patient_name)
+    if not can_add_patient:
+        return jsonify({
+            'error': 'הגעת למגבלת המטופלים',
+            'message': patient_message
+        }), 402
+    
+    current_sessions = count_sessions()
+    if current_sessions >= MAX_SESSIONS:
+        return jsonify({
+            'error': 'הגעת למגבלת הסשנים',
+            'message': f'מותרים {MAX_SESSIONS} סשנים בלבד'
+        }), 402
+    
+    return None
+
+def check_backend_available(backend_name):
+    """בדיקה שמנוע התמלול רשום ומוגדר - מחזיר תשובת שגיאה או None"""
+    if backend_name == 'assemblyai' and not ASSEMBLYAI_API_KEY:
+        print("❌ חסר ASSEMBLYAI_API_KEY - לא ניתן לבצע תמלול")
+        return jsonify({
+            'error': 'שירות התמלול לא זמין',
+            'message': 'לא הוגדר API key לשירות התמלול. אנא פנה למנהל המערכת.'
+        }), 503
+    
+    if backend_name not in available_backends():
+        return jsonify({
+            'error': 'שירות תמלול לא נתמך',
+            'message': f'שירות התמלול {backend_name} לא נתמך'
+        }), 400
+    
+    return None
+
+def enqueue_transcription_job(user_id, patient_name, session_date, quality_mode, filename, stored_path,
+                              audio_sha256, encryption_password=None, backend='assemblyai',
+                              segmented=False, trim_silence=False):
+    """הכנסת עבודת תמלול לתור - מחזיר מזהה עבודה"""
+    payload = {
+        # רק מי ששלח את העבודה יכול לקרוא את מצבה ב-/jobs/<id>
+        'user_id': user_id,
+        'patient_name': patient_name,
+        'session_date': session_date,
+        'audio_filename': filename,
+        'audio_path': stored_path,
+        'audio_sha256': audio_sha256,
+        'segmented': segmented,
+        'trim_silence': trim_silence
+    }
+    
+    if quality_mode == 'secure-assemblyai':
+        # סיסמת ההצפנה נשמרת בתור רק מוצפנת במפתח השרת ונמחקת בסיום העבודה
+        payload['sealed_encryption_password'] = job_queue.seal_secret(encryption_password)
+        payload['backend'] = backend
+        return job_queue.enqueue('transcribe-secure', payload)
+    
+    payload['quality_mode'] = quality_mode
+    return job_queue.enqueue('transcribe', payload)
+
+def cached_transcription_response(user_id, patient_name, session_date, quality_mode, filename, stored_path,
+                                  audio_sha256, encryption_password=None, backend='assemblyai'):
+    """תשובה מיידית אם הקובץ כבר תומלל עם אותן הגדרות - מחזיר תשובה או None"""
+    backend_name = backend if quality_mode == 'secure-assemblyai' else quality_mode
+    text = transcript_cache.get(audio_sha256, get_backend(backend_name))
+    if text is None:
+        return None
+    
+    print(f"⚡ תמלול נמצא במטמון: {filename}")
+    
+    stand_in = get_backend(backend_name).stand_in
+    if quality_mode == 'secure-assemblyai':
+        secure_ai = SecureAssemblyAI(ASSEMBLYAI_API_KEY, encryption_password, backend=get_backend(backend_name))
+        response = save_secure_session(user_id, patient_name, session_date, filename,
+                                       secure_ai.build_result(text, patient_name), stand_in=stand_in)
+    else:
+        response = save_transcription_session(user_id, patient_name, session_date, quality_mode, filename, text,
+                                              stand_in=stand_in)
+    
+    if os.path.exists(stored_path):
+        if quality_mode == 'secure-assemblyai':
+            secure_delete(stored_path)
+        else:
+            os.remove(stored_path)
+    
+    response['cached'] = True
+    return jsonify(response)
+
+def job_accepted_response(job_id):
+    """תשובה מיידית ללקוח - העבודה בתור"""
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': JOB_QUEUED,
+        'status_url': f'/jobs/{job_id}'
+    }), 202
+
 @app.route('/transcribe', methods=['POST'])
 def transcribe_audio():
-    """תמלול שמע - תמיכה רק ב-AssemblyAI ו-ivrit.ai"""
+    """תמלול שמע במנוע שנבחר ב-quality_mode (מתבצע ברקע)"""
     try:
-        # בדיקת אימות
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
+        # בדיקת אימות - העבודה נרשמת על שם המשתמש
+        user_info = request_user()
+        if not user_info:
             return jsonify({'error': 'נדרש אימות'}), 401
         
         # קבלת נתונים מהבקשה
         patient_name = request.form.get('patient_name', '').strip()
         session_date = request.form.get('session_date', '')
         quality_mode = request.form.get('quality_mode', 'assemblyai')
+        segmented = request.form.get('segmented', 'false').lower() == 'true'
+        trim_silence = request.form.get('trim_silence', 'false').lower() == 'true'
         
         if not patient_name:
             return jsonify({'error': 'חסר שם מטופל'}), 400
@@ -753,118 +1234,248 @@ def transcribe_audio():
         if audio_file.filename == '':
             return jsonify({'error': 'לא נבחר קובץ'}), 400
         
+        # בדיקת סוג התמלול לפני שמכניסים לתור
+        backend_error = check_backend_available(quality_mode)
+        if backend_error:
+            return backend_error
+        
         # בדיקת מגבלות
-        can_add_patient, patient_message = check_patient_limit(patient_name)
-        if not can_add_patient:
-            return jsonify({
-                'error': 'הגעת למגבלת המטופלים',
-                'message': patient_message
-            }), 402
+        limit_error = check_transcription_limits(patient_name)
+        if limit_error:
+            return limit_error
         
-        current_sessions = count_sessions()
-        if current_sessions >= MAX_SESSIONS:
-            return jsonify({
-                'error': 'הגעת למגבלת הסשנים',
-                'message': f'מותרים {MAX_SESSIONS} סשנים בלבד'
-            }), 402
+        # שמירת קובץ השמע - אם כבר תומלל מחזירים מיד, אחרת מכניסים עבודה לתור
+        filename, stored_path, audio_sha256 = save_upload_for_job(audio_file)
+        
+        cached_response = cached_transcription_response(user_info['user_id'], patient_name, session_date,
+                                                        quality_mode, filename, stored_path, audio_sha256)
+        if cached_response:
+            return cached_response
+        
+        job_id = enqueue_transcription_job(user_info['user_id'], patient_name, session_date, quality_mode,
+                                           filename, stored_path, audio_sha256,
+                                           segmented=segmented, trim_silence=trim_silence)
+        
+        return job_accepted_response(job_id)
         
-        # שמירת קובץ שמע זמני
-        filename = secure_filename(audio_file.filename)
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
-        audio_file.save(temp_path)
+    except Exception as e:
+        print(f"❌ שגיאה בתמלול: {e}")
+        return jsonify({'error': f'שגיאה בתמלול: {str(e)}'}), 500
+
+def process_transcription_job(job_id, payload):
+    """עיבוד עבודת תמלול ב-worker - מחזיר (הצלחה, תוצאה)"""
+    patient_name = payload['patient_name']
+    session_date = payload.get('session_date', '')
+    quality_mode = payload['quality_mode']
+    filename = payload['audio_filename']
+    temp_path = payload['audio_path']
+    
+    # בחירת מנוע התמלול
+    backend = get_backend(quality_mode)
+    if backend is None:
+        return False, {
+            'error': 'שירות תמלול לא נתמך',
+            'message': f'שירות התמלול {quality_mode} לא נתמך'
+        }
+    
+    # אותו קובץ יכול להגיע שוב בזמן שהעבודה הראשונה עוד בתור
+    audio_sha256 = payload.get('audio_sha256')
+    text = transcript_cache.get(audio_sha256, backend)
+    segments = None
+    preprocessing = None
+    
+    if text is not None:
+        print(f"⚡ תמלול נמצא במטמון: {filename}")
+    else:
+        provider_ref = job_queue.get_provider_ref(job_id)
+        segmented = None
+        on_submitted = job_submitted_callback(job_id)
+        
+        # נרמול השמע (מונו 16kHz) - לא צריך אם הקובץ השלם כבר נשלח בניסיון קודם
+        if provider_ref and not payload.get('segmented'):
+            send_path, preprocessing = temp_path, None
+        else:
+            job_queue.add_event(job_id, STAGE_PREPROCESSING)
+            send_path, preprocessing = preprocess_job_audio(backend, temp_path, payload.get('trim_silence'))
+        if provider_ref:
+            job_queue.add_event(job_id, STAGE_PROVIDER_PROCESSING)
         
         try:
-            # בדיקת סוג התמלול
-            if quality_mode == 'assemblyai':
-                # תמלול עם AssemblyAI
-                if not ASSEMBLYAI_API_KEY:
-                    print("❌ חסר ASSEMBLYAI_API_KEY - לא ניתן לבצע תמלול")
-                    return jsonify({
-                        'error': 'שירות התמלול לא זמין',
-                        'message': 'לא הוגדר API key לשירות התמלול. אנא פנה למנהל המערכת.'
-                    }), 503
-                
-                print(f"🎯 מתחיל תמלול עם AssemblyAI: {filename}")
-                
-                # יצירת transcriber
-                transcriber = aai.Transcriber()
-                
-                # הגדרות תמלול
-                config = aai.TranscriptionConfig(
-                    language_code="he",  # עברית
-                    punctuate=True,
-                    format_text=True
-                )
-                
-                # תמלול הקובץ
-                transcript = transcriber.transcribe(temp_path, config=config)
-                
-                if transcript.status == aai.TranscriptStatus.error:
-                    print(f"❌ שגיאה בתמלול AssemblyAI: {transcript.error}")
-                    return jsonify({
-                        'error': 'שגיאה בשירות התמלול',
-                        'message': f'שירות התמלול נתקל בשגיאה: {transcript.error}'
-                    }), 503
+            if payload.get('segmented'):
+                # הקלטה ארוכה - החלקים מתומללים במקביל, וקובץ שאי אפשר לחלק מתומלל בשלמותו
+                segmenter = SegmentedTranscriber(backend, max_workers=SEGMENT_WORKERS, segment_seconds=SEGMENT_SECONDS,
+                                                 on_progress=segment_progress_callback(job_id))
+                segmented = segmenter.transcribe(send_path, provider_refs=provider_ref, on_submitted=on_submitted)
+            
+            if segmented is not None:
+                success, text, segments = segmented
+                segments = map_segments_to_original(segments, preprocessing)
+            else:
+                if provider_ref:
+                    # הקובץ כבר נשלח לפני שה-worker הקודם נקטע - ממשיכים לפי המזהה בלי להעלות (ולשלם) שוב
+                    print(f"🔁 ממשיך תמלול {quality_mode} קיים: {provider_ref}")
                 else:
-                    original_transcript = transcript.text or "לא נמצא תוכן לתמלול"
-                    corrected_transcript = original_transcript
-                    print(f"✅ תמלול AssemblyAI הושלם: {len(original_transcript)} תווים")
+                    print(f"🎯 מתחיל תמלול עם {quality_mode}: {filename}")
                     
-            elif quality_mode == 'ivrit-ai':
-                # תמלול עם ivrit.ai (סימולציה - יש להוסיף API אמיתי)
-                print(f"🏆 מתחיל תמלול עם ivrit.ai: {filename}")
-                
-                # כרגע סימולציה - בעתיד יש להוסיף API אמיתי של ivrit.ai
-                original_transcript = f"תמלול דמה עם ivrit.ai עבור קובץ {filename}"
-                corrected_transcript = original_transcript
-                print(f"✅ תמלול ivrit.ai הושלם (דמה): {len(original_transcript)} תווים")
+                    # שליחת הקובץ ושמירת מזהה התמלול מיד - לפני ההמתנה לתוצאה
+                    provider_ref = backend.submit(send_path)
+                    on_submitted(provider_ref)
                 
-            else:
-                return jsonify({
-                    'error': 'שירות תמלול לא נתמך',
-                    'message': f'שירות התמלול {quality_mode} לא נתמך'
-                }), 400
-            
-            # שמירת התמלול
-            patient_folder = get_patient_folder(patient_name)
-            session_timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            session_file = os.path.join(patient_folder, f"session_{session_timestamp}.json")
-            
-            session_data = {
-                'patient_name': patient_name,
-                'session_date': session_date or datetime.datetime.now().strftime("%Y-%m-%d"),
-                'audio_filename': filename,
-                'quality_mode': quality_mode,
-                'original_transcript': original_transcript,
-                'corrected_transcript': corrected_transcript,
-                'word_count': len(corrected_transcript.split()),
-                'created_at': datetime.datetime.now().isoformat()
-            }
-            
-            with open(session_file, 'w', encoding='utf-8') as f:
-                json.dump(session_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"✅ תמלול נשמר: {session_file}")
-            
-            return jsonify({
-                'success': True,
-                'original_transcript': original_transcript,
-                'corrected_transcript': corrected_transcript,
-                'session_info': {
-                    'sessions_used': count_sessions(),
-                    'sessions_limit': MAX_SESSIONS,
-                    'sessions_remaining': MAX_SESSIONS - count_sessions()
-                }
-            })
-            
+                backend.wait(provider_ref)
+                success, text = backend.result(provider_ref)
         finally:
-            # ניקוי קובץ זמני
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            if send_path != temp_path and os.path.exists(send_path):
+                os.remove(send_path)
+        
+        if not success:
+            print(f"❌ שגיאה בתמלול {quality_mode}: {text}")
+            return False, {
+                'error': 'שגיאה בשירות התמלול',
+                'message': f'שירות התמלול נתקל בשגיאה: {text}'
+            }
         
-    except Exception as e:
-        print(f"❌ שגיאה בתמלול: {e}")
-        return jsonify({'error': f'שגיאה בתמלול: {str(e)}'}), 500
+        print(f"✅ תמלול {quality_mode} הושלם: {len(text)} תווים")
+        transcript_cache.put(audio_sha256, backend, text)
+    
+    response = save_transcription_session(payload.get('user_id'), patient_name, session_date, quality_mode,
+                                          filename, text, segments=segments, preprocessing=preprocessing,
+                                          stand_in=backend.stand_in)
+    job_queue.add_event(job_id, STAGE_SAVED)
+    return True, job_result(response)
+
+def job_submitted_callback(job_id):
+    """on_submitted לעבודה - שומר את מזהה התמלול ומדווח פעם אחת שהשמע נשלח למנוע"""
+    reported = []
+    lock = threading.Lock()
+    
+    def on_submitted(provider_ref):
+        job_queue.set_provider_ref(job_id, provider_ref)
+        # בתמלול בחלקים נקרא אחרי כל חלק - מדווחים רק על הראשון
+        with lock:
+            first = not reported
+            reported.append(provider_ref)
+        if first:
+            job_queue.add_event(job_id, STAGE_SUBMITTED)
+            job_queue.add_event(job_id, STAGE_PROVIDER_PROCESSING)
+    
+    return on_submitted
+
+def segment_progress_callback(job_id):
+    """on_progress לתמלול בחלקים - אחוז וזמן משוער לסיום לפי קצב החלקים שהסתיימו"""
+    started = time.monotonic()
+    low, high = STAGE_PERCENT[STAGE_PROVIDER_PROCESSING], STAGE_PERCENT[STAGE_ENCRYPTING]
+    
+    def on_progress(done, total):
+        elapsed = time.monotonic() - started
+        job_queue.add_event(job_id, STAGE_PROVIDER_PROCESSING,
+                            percent=round(low + (high - low) * done / total, 1),
+                            eta_seconds=round(elapsed / done * (total - done), 1))
+    
+    return on_progress
+
+def preprocess_job_audio(backend, audio_path, trim_silence=False):
+    """נרמול השמע וחיתוך שקט לפני השליחה - מחזיר (נתיב לשליחה, סטטיסטיקה)"""
+    send_path, preprocessing = audio_path, {}
+    
+    # נרמול (מונו 16kHz) - רק אם מופעל למנוע הזה
+    if backend.name in NORMALIZE_AUDIO_BACKENDS:
+        normalized_path = f"{audio_path}.normalized.wav"
+        stats = audio_preprocessor.normalize(audio_path, normalized_path)
+        if stats:
+            print(f"🎚️ שמע נורמל: {stats['original_format']} ← {stats['normalized_format']}, "
+                  f"נחסכו {stats['bytes_saved'] // 1024}KB")
+            send_path = normalized_path
+            preprocessing['normalization'] = stats
+    
+    # חיתוך שקט ארוך - משלמים רק על דקות עם דיבור
+    if trim_silence:
+        trimmed_path = f"{audio_path}.trimmed.wav"
+        stats = audio_preprocessor.trim_silence(send_path, trimmed_path,
+                                                min_silence_seconds=SILENCE_MIN_SECONDS,
+                                                keep_silence_seconds=SILENCE_KEEP_SECONDS)
+        if stats:
+            print(f"🔇 נחתכו {stats['trimmed_seconds']} שניות שקט ({stats['trimmed_percent']}%)")
+            if send_path != audio_path:
+                os.remove(send_path)
+            send_path = trimmed_path
+            preprocessing['silence_trimming'] = stats
+    
+    return send_path, preprocessing or None
+
+def map_segments_to_original(segments, preprocessing):
+    """offset של כל חלק לפי ההקלטה המקורית, גם אם נחתך ממנה שקט"""
+    offset_map = ((preprocessing or {}).get('silence_trimming') or {}).get('offset_map')
+    if not segments or not offset_map:
+        return segments
+    return [dict(segment, offset=map_to_original(offset_map, segment['offset'])) for segment in segments]
+
+def save_transcription_session(user_id, patient_name, session_date, quality_mode, filename, text, segments=None,
+                               preprocessing=None, stand_in=False):
+    """שמירת סשן תמלול רגיל - מחזיר את תשובת התמלול ללקוח"""
+    original_transcript = text or "לא נמצא תוכן לתמלול"
+    if stand_in:
+        # מנוע דמה - טקסט קבוע שמזהה את הקובץ, לא תמלול
+        original_transcript = f"{text} עבור קובץ {filename}"
+    corrected_transcript = original_transcript
+    
+    # שמירת התמלול
+    patient_folder = get_patient_folder(patient_name)
+    session_file, session_id = new_session_file(patient_folder)
+    
+    session_data = {
+        'session_id': session_id,
+        'user_id': user_id,
+        'patient_name': patient_name,
+        'session_date': session_date or datetime.datetime.now().strftime("%Y-%m-%d"),
+        'audio_filename': filename,
+        'quality_mode': quality_mode,
+        'original_transcript': original_transcript,
+        'corrected_transcript': corrected_transcript,
+        'word_count': len(corrected_transcript.split()),
+        'created_at': datetime.datetime.now().isoformat()
+    }
+    
+    # מיקום כל חלק בהקלטה המקורית (רק בתמלול בחלקים)
+    if segments:
+        session_data['segments'] = segment_offsets(segments)
+    # מפת ה-offsets אחרי חיתוך שקט - להמרת זמנים בתמלול לזמנים בהקלטה המקורית
+    if preprocessing:
+        session_data['preprocessing'] = preprocessing
+    # סשן ממנוע דמה לא נכנס לאינדקס החיפוש
+    if stand_in:
+        session_data['stand_in'] = True
+    
+    session_id = session_index.save_session(session_file, session_data)
+    
+    print(f"✅ תמלול נשמר: {session_file}")
+    
+    response = {
+        'success': True,
+        'session_id': session_id,
+        'original_transcript': original_transcript,
+        'corrected_transcript': corrected_transcript,
+        'session_info': {
+            'sessions_used': count_sessions(),
+            'sessions_limit': MAX_SESSIONS,
+            'sessions_remaining': MAX_SESSIONS - count_sessions()
+        }
+    }
+    if segments:
+        response['segments'] = session_data['segments']
+    if preprocessing:
+        response['preprocessing'] = preprocessing
+    if stand_in:
+        response['stand_in'] = True
+    return response
+
+def segment_offsets(segments):
+    """מפת החלקים לשמירה - מספר חלק, התחלה ואורך בשניות"""
+    return [{
+        'index': segment['index'],
+        'offset': segment['offset'],
+        'duration': segment['duration']
+    } for segment in segments]
+
 
 @app.route('/transcribe-encrypted', methods=['POST'])
 def transcribe_encrypted():
@@ -904,24 +1515,25 @@ def transcribe_encrypted():
 
 @app.route('/transcribe-secure-assemblyai', methods=['POST'])
 def transcribe_secure_assemblyai():
-    """תמלול מאובטח עם AssemblyAI - הצפנה מקסימלית"""
+    """תמלול מאובטח עם AssemblyAI - הצפנה מקסימלית (מתבצע ברקע)"""
     try:
-        # בדיקת אימות
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
+        # בדיקת אימות - העבודה נרשמת על שם המשתמש
+        user_info = request_user()
+        if not user_info:
             return jsonify({'error': 'נדרש אימות'}), 401
         
-        # בדיקת AssemblyAI API Key
-        if not ASSEMBLYAI_API_KEY:
-            return jsonify({
-                'error': 'שירות התמלול המאובטח לא זמין',
-                'message': 'לא הוגדר API key לשירות התמלול.'
-            }), 503
-        
         # קבלת נתונים מהבקשה
         patient_name = request.form.get('patient_name', '').strip()
         session_date = request.form.get('session_date', '')
         encryption_password = request.form.get('encryption_key', '').strip()
+        backend_name = request.form.get('backend', 'assemblyai')
+        segmented = request.form.get('segmented', 'false').lower() == 'true'
+        trim_silence = request.form.get('trim_silence', 'false').lower() == 'true'
+        
+        # בדיקת מנוע התמלול (ברירת מחדל AssemblyAI)
+        backend_error = check_backend_available(backend_name)
+        if backend_error:
+            return backend_error
         
         if not patient_name or not encryption_password:
             return jsonify({'error': 'חסרים נתונים נדרשים'}), 400
@@ -937,177 +1549,535 @@ def transcribe_secure_assemblyai():
         if audio_file.filename == '':
             return jsonify({'error': 'לא נבחר קובץ'}), 400
         
-        # בדיקת מגבלות
-        can_add_patient, patient_message = check_patient_limit(patient_name)
-        if not can_add_patient:
+        # בדיקה אם המערכת המאובטחת זמינה
+        if not SECURE_ASSEMBLYAI_AVAILABLE or SecureAssemblyAI is None:
+            print("❌ מערכת תמלול מאובטח לא זמינה")
             return jsonify({
-                'error': 'הגעת למגבלת המטופלים',
-                'message': patient_message
-            }), 402
+                'error': 'מערכת תמלול מאובטח לא זמינה',
+                'message': 'חסרה ספריית ההצפנה. הרץ: pip install cryptography'
+            }), 503
         
-        current_sessions = count_sessions()
-        if current_sessions >= MAX_SESSIONS:
-            return jsonify({
-                'error': 'הגעת למגבלת הסשנים',
-                'message': f'מותרים {MAX_SESSIONS} סשנים בלבד'
-            }), 402
+        # בדיקת מגבלות
+        limit_error = check_transcription_limits(patient_name)
+        if limit_error:
+            return limit_error
         
-        # שמירת קובץ שמע זמני
-        filename = secure_filename(audio_file.filename)
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
-        audio_file.save(temp_path)
+        # שמירת קובץ השמע - אם כבר תומלל מחזירים מיד, אחרת מכניסים עבודה לתור
+        filename, stored_path, audio_sha256 = save_upload_for_job(audio_file)
         
-        try:
-            print(f"🔐 מתחיל תמלול מאובטח עם AssemblyAI: {filename}")
+        cached_response = cached_transcription_response(user_info['user_id'], patient_name, session_date,
+                                                        'secure-assemblyai', filename, stored_path, audio_sha256,
+                                                        encryption_password=encryption_password,
+                                                        backend=backend_name)
+        if cached_response:
+            return cached_response
+        
+        job_id = enqueue_transcription_job(user_info['user_id'], patient_name, session_date, 'secure-assemblyai',
+                                           filename, stored_path, audio_sha256, encryption_password=encryption_password,
+                                           backend=backend_name, segmented=segmented,
+                                           trim_silence=trim_silence)
+        
+        return job_accepted_response(job_id)
+        
+    except Exception as e:
+        print(f"❌ שגיאה בתמלול מאובטח: {e}")
+        return jsonify({'error': f'שגיאה בתמלול מאובטח: {str(e)}'}), 500
+
+def process_secure_transcription_job(job_id, payload):
+    """עיבוד עבודת תמלול מאובטח ב-worker - מחזיר (הצלחה, תוצאה)"""
+    patient_name = payload['patient_name']
+    session_date = payload.get('session_date', '')
+    filename = payload['audio_filename']
+    temp_path = payload['audio_path']
+    
+    backend_name = payload.get('backend', 'assemblyai')
+    
+    backend = get_backend(backend_name)
+    if backend is None:
+        return False, {
+            'error': 'שירות תמלול לא נתמך',
+            'message': f'שירות התמלול {backend_name} לא נתמך'
+        }
+    
+    print(f"🔐 מתחיל תמלול מאובטח עם {backend_name}: {filename}")
+    
+    encryption_password = job_queue.unseal_secret(payload['sealed_encryption_password'])
+    
+    # יצירת מערכת תמלול מאובטחת
+    secure_ai = SecureAssemblyAI(ASSEMBLYAI_API_KEY, encryption_password, backend=backend)
+    
+    provider_ref = job_queue.get_provider_ref(job_id)
+    
+    # נרמול השמע (מונו 16kHz) - לא צריך אם הקובץ השלם כבר נשלח בניסיון קודם
+    if provider_ref and not payload.get('segmented'):
+        send_path, preprocessing = temp_path, None
+    else:
+        job_queue.add_event(job_id, STAGE_PREPROCESSING)
+        send_path, preprocessing = preprocess_job_audio(backend, temp_path, payload.get('trim_silence'))
+    if provider_ref:
+        job_queue.add_event(job_id, STAGE_PROVIDER_PROCESSING)
+    
+    try:
+        # תמלול מאובטח - אם הקובץ כבר נשלח בניסיון קודם ממשיכים לפי מזהה התמלול
+        result = secure_ai.secure_transcribe(
+            send_path, patient_name,
+            transcript_id=provider_ref,
+            on_submitted=job_submitted_callback(job_id),
+            cache=transcript_cache,
+            audio_sha256=payload.get('audio_sha256'),
+            segmenter=SegmentedTranscriber(backend, max_workers=SEGMENT_WORKERS, segment_seconds=SEGMENT_SECONDS,
+                                           on_progress=segment_progress_callback(job_id))
+            if payload.get('segmented') else None,
+            on_transcribed=lambda: job_queue.add_event(job_id, STAGE_ENCRYPTING)
+        )
+    finally:
+        if send_path != temp_path and os.path.exists(send_path):
+            secure_delete(send_path)
+    
+    if not result['success']:
+        return False, {'error': 'שגיאה בתמלול מאובטח'}
+    
+    if result.get('segments'):
+        result['segments'] = map_segments_to_original(result['segments'], preprocessing)
+    
+    response = save_secure_session(payload.get('user_id'), patient_name, session_date, filename, result,
+                                   preprocessing=preprocessing,
+                                   stand_in=backend.stand_in)
+    job_queue.add_event(job_id, STAGE_SAVED)
+    return True, job_result(response)
+
+def save_secure_session(user_id, patient_name, session_date, filename, result, preprocessing=None, stand_in=False):
+    """שמירת סשן מוצפן - מחזיר תשובה ללקוח בלי הטקסט המפוענח"""
+    # שמירת התמלול המוצפן
+    patient_folder = get_patient_folder(patient_name)
+    session_file, session_id = new_session_file(patient_folder, prefix='secure_session')
+    
+    session_data = {
+        'session_id': session_id,
+        'user_id': user_id,
+        'patient_name': patient_name,
+        'session_date': session_date or datetime.datetime.now().strftime("%Y-%m-%d"),
+        'audio_filename': filename,
+        'quality_mode': 'secure-assemblyai',
+        'encrypted_transcript': result['encrypted_transcript'],
+        'content_hash': result['content_hash'],
+        'encryption_method': result['encryption_method'],
+        'privacy_level': result['privacy_level'],
+        'word_count': result['word_count'],
+        'char_count': result['char_count'],
+        'created_at': datetime.datetime.now().isoformat(),
+        'is_encrypted': True
+    }
+    
+    if result.get('segments'):
+        session_data['segments'] = segment_offsets(result['segments'])
+    if preprocessing:
+        session_data['preprocessing'] = preprocessing
+    # טוקני HMAC לחיפוש ב-/search/secure - בלי טקסט גלוי. סשן ממנוע דמה לא נכנס לחיפוש
+    if stand_in:
+        session_data['stand_in'] = True
+    elif result.get('blind_index'):
+        session_data['blind_index'] = result['blind_index']
+    
+    session_id = session_index.save_session(session_file, session_data)
+    
+    print(f"✅ תמלול מאובטח נשמר: {session_file}")
+    
+    # התוצאה בתור נשארת מוצפנת - הלקוח מפענח עם /decrypt-session
+    return {
+        'success': True,
+        'session_id': session_id,
+        'patient_name': patient_name,
+        'session_filename': os.path.basename(session_file),
+        'needs_decryption': True,
+        'encryption_info': {
+            'method': result['encryption_method'],
+            'privacy_level': result['privacy_level'],
+            'content_hash': result['content_hash']
+        },
+        'session_info': {
+            'sessions_used': count_sessions(),
+            'sessions_limit': MAX_SESSIONS,
+            'sessions_remaining': MAX_SESSIONS - count_sessions()
+        },
+        'security_message': '🔐 התמלול נשמר בהצפנה מקסימלית - רק אתה יכול לפענח אותו!'
+    }
+
+def job_result(response):
+    """התוצאה שנשמרת בתור - מזהה הסשן בלבד; התמלול נשאר רק בסשן ונמחק איתו"""
+    return {field: response[field] for field in JOB_RESULT_FIELDS if field in response}
+
+def get_owned_job(job_id, user_info):
+    """העבודה אם המשתמש הוא ששלח אותה, אחרת None (גם עבודה של משתמש אחר נראית כלא קיימת)"""
+    if not user_info:
+        return None
+    job = job_queue.get_job(job_id, include_payload=True)
+    if not job or job['payload'].get('user_id') != user_info['user_id']:
+        return None
+    return job
+
+@app.route('/jobs/<job_id>')
+def get_job_status(job_id):
+    """מצב עבודת תמלול - הלקוח שואל עד שהעבודה מסתיימת"""
+    try:
+        # בדיקת אימות
+        user_info = request_user()
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        job = get_owned_job(job_id, user_info)
+        if not job:
+            return jsonify({'error': 'עבודה לא נמצאה'}), 404
+        
+        return jsonify(job_status(job))
+        
+    except Exception as e:
+        print(f"❌ שגיאה בקבלת מצב עבודה {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    """שידור שלבי העבודה (SSE) עד שהיא מסתיימת - במקום לשאול שוב ושוב"""
+    try:
+        # בדיקת אימות
+        user_info = request_user(allow_query_token=True)
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        if not get_owned_job(job_id, user_info):
+            return jsonify({'error': 'עבודה לא נמצאה'}), 404
+        
+        # בהתחברות מחדש הדפדפן שולח את מזהה האירוע האחרון שקיבל
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or '0'
+        after_id = int(last_event_id) if last_event_id.isdigit() else 0
+        
+        if not sse_stream_slots.acquire(blocking=False):
+            return jsonify({'error': 'יותר מדי שידורים פתוחים - נסה שוב או שאל את /jobs/<id>'}), 503, {
+                'Retry-After': str(SSE_RETRY_AFTER_SECONDS)
+            }
             
-            # בדיקה אם המערכת המאובטחת זמינה
+    except Exception as e:
+        print(f"❌ שגיאה בפתיחת שידור עבודה {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    def generate(after_id):
+        deadline = time.monotonic() + SSE_STREAM_SECONDS
+        yield 'retry: 2000\n\n'
+        
+        while time.monotonic() < deadline:
+            # לא ממתינים מעבר לסוף החלון - ה-thread מתפנה בזמן
+            timeout = min(SSE_KEEPALIVE_SECONDS, deadline - time.monotonic())
+            events = job_queue.wait_for_events(job_id, after_id, timeout=max(timeout, 0))
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            
+            for event in events:
+                after_id = event['id']
+                if event['stage'] in (JOB_COMPLETED, JOB_FAILED):
+                    # אירוע אחרון - מצב העבודה המלא, כמו ב-/jobs/<id>
+                    data = job_status(job_queue.get_job(job_id))
+                    yield f"id: {event['id']}\nevent: done\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                    return
+                
+                data = {
+                    'stage': event['stage'],
+                    'percent': event['percent'],
+                    'eta_seconds': event['eta_seconds'],
+                    'at': event['created_at']
+                }
+                yield f"id: {event['id']}\nevent: progress\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    response = Response(stream_with_context(generate(after_id)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # המקום מתפנה כשהחיבור נסגר - בסיום העבודה, בסוף החלון או כשהלקוח התנתק
+    response.call_on_close(sse_stream_slots.release)
+    return response
+
+def job_status(job):
+    """מצב עבודה לתשובה ללקוח"""
+    response = {
+        'success': True,
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at']
+    }
+    
+    if job['status'] == JOB_QUEUED:
+        response['queue_position'] = job_queue.queue_position(job['job_id'])
+    elif job['status'] == JOB_COMPLETED:
+        response['result'] = completed_job_result(job['result'])
+    elif job['status'] == JOB_FAILED:
+        response['error'] = job['error']
+        response['result'] = job['result']
+    
+    return response
+
+def completed_job_result(result):
+    """תוצאת עבודה שהושלמה - התמלול נקרא מהסשן עצמו, כך שסשן או מטופל שנמחקו לא נחשפים דרך התור"""
+    # גם תוצאות ישנות שנשמרו עם הטקסט המלא מסוננות לשדות המותרים
+    result = job_result(result or {})
+    location = session_index.resolve(result['session_id']) if result.get('session_id') else None
+    if not location:
+        result['session_deleted'] = True
+        return result
+    
+    session_data = session_index.read_session(location['path'])
+    if session_data.get('is_encrypted'):
+        # סשן מוצפן - הלקוח מפענח עם /decrypt-session
+        result['needs_decryption'] = True
+        result['session_filename'] = location['filename']
+    else:
+        result['original_transcript'] = session_data.get('original_transcript', '')
+        result['corrected_transcript'] = session_data.get('corrected_transcript', '')
+    for field in ('segments', 'preprocessing', 'stand_in'):
+        if session_data.get(field):
+            result[field] = session_data[field]
+    return result
+
+def get_owned_upload(upload_id, user_info):
+    """מצב ההעלאה אם המשתמש הוא שפתח אותה, אחרת None (גם העלאה של משתמש אחר נראית כלא קיימת)"""
+    status = chunked_uploads.get_status(upload_id)
+    if not status or status['user_id'] != user_info['user_id']:
+        return None
+    return status
+
+@app.route('/uploads', methods=['POST'])
+def init_chunked_upload():
+    """פתיחת העלאה בחלקים"""
+    try:
+        # בדיקת אימות - ההעלאה נרשמת על שם המשתמש
+        user_info = request_user()
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        data = request.json or {}
+        filename = secure_filename(data.get('filename', '')) or 'audio'
+        
+        try:
+            total_size = int(data.get('total_size', 0))
+            chunk_size = int(data['chunk_size']) if data.get('chunk_size') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'גודל קובץ או חלק לא תקין'}), 400
+        
+        success, result = chunked_uploads.init_upload(filename, total_size, chunk_size,
+                                                      data.get('sha256'), user_id=user_info['user_id'])
+        if not success:
+            return jsonify({'error': result}), 400
+        
+        return jsonify({'success': True, **result}), 201
+        
+    except Exception as e:
+        print(f"❌ שגיאה בפתיחת העלאה: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/uploads/<upload_id>/chunks/<int:chunk_index>', methods=['PUT'])
+def upload_chunk(upload_id, chunk_index):
+    """העלאת חלק אחד - הכותרת X-Chunk-SHA256 מכילה את ה-checksum של החלק"""
+    try:
+        # בדיקת אימות
+        user_info = request_user()
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        if not get_owned_upload(upload_id, user_info):
+            return jsonify({'error': 'העלאה לא נמצאה'}), 404
+        
+        checksum = request.headers.get('X-Chunk-SHA256', '').strip()
+        success, result = chunked_uploads.write_chunk(upload_id, chunk_index, request.get_data(), checksum)
+        
+        if not success:
+            status_code = 404 if result == 'העלאה לא נמצאה' else 400
+            return jsonify({'error': result}), status_code
+        
+        return jsonify({'success': True, 'chunk_index': chunk_index, 'checksum': result})
+        
+    except Exception as e:
+        print(f"❌ שגיאה בהעלאת חלק {chunk_index}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload_status(upload_id):
+    """מצב העלאה - הלקוח שולח שוב רק את החלקים החסרים"""
+    user_info = request_user()
+    if not user_info:
+        return jsonify({'error': 'נדרש אימות'}), 401
+    
+    status = get_owned_upload(upload_id, user_info)
+    if not status:
+        return jsonify({'error': 'העלאה לא נמצאה'}), 404
+    return jsonify({'success': True, **status})
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """ביטול העלאה"""
+    user_info = request_user()
+    if not user_info:
+        return jsonify({'error': 'נדרש אימות'}), 401
+    
+    if not get_owned_upload(upload_id, user_info) or not chunked_uploads.abort(upload_id):
+        return jsonify({'error': 'העלאה לא נמצאה'}), 404
+    return jsonify({'success': True})
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    """סיום העלאה בחלקים והעברת הקובץ המורכב לתור התמלול"""
+    try:
+        # בדיקת אימות - העבודה נרשמת על שם המשתמש
+        user_info = request_user()
+        if not user_info:
+            return jsonify({'error': 'נדרש אימות'}), 401
+        
+        data = request.json or {}
+        patient_name = data.get('patient_name', '').strip()
+        session_date = data.get('session_date', '')
+        quality_mode = data.get('quality_mode', 'assemblyai')
+        encryption_password = data.get('encryption_key', '').strip()
+        segmented = bool(data.get('segmented', False))
+        trim_silence = bool(data.get('trim_silence', False))
+        
+        if not patient_name:
+            return jsonify({'error': 'חסר שם מטופל'}), 400
+        
+        # בתמלול מאובטח המנוע נבחר בשדה backend, אחרת quality_mode הוא המנוע
+        if quality_mode == 'secure-assemblyai':
+            backend_name = data.get('backend', 'assemblyai')
+        else:
+            backend_name = quality_mode
+        
+        backend_error = check_backend_available(backend_name)
+        if backend_error:
+            return backend_error
+        
+        if quality_mode == 'secure-assemblyai':
             if not SECURE_ASSEMBLYAI_AVAILABLE or SecureAssemblyAI is None:
-                print("❌ מערכת תמלול מאובטח לא זמינה")
                 return jsonify({
                     'error': 'מערכת תמלול מאובטח לא זמינה',
                     'message': 'חסרה ספריית ההצפנה. הרץ: pip install cryptography'
                 }), 503
-            
-            # יצירת מערכת תמלול מאובטחת
-            secure_ai = SecureAssemblyAI(ASSEMBLYAI_API_KEY, encryption_password)
-            
-            # תמלול מאובטח
-            result = secure_ai.secure_transcribe(temp_path, patient_name)
-            
-            if result['success']:
-                # שמירת התמלול המוצפן
-                patient_folder = get_patient_folder(patient_name)
-                session_timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                session_file = os.path.join(patient_folder, f"secure_session_{session_timestamp}.json")
-                
-                # פענוח זמני לסטטיסטיקות (רק לשמירה)
-                decrypted_text = secure_ai.decrypt_transcript(result['encrypted_transcript'])
-                
-                session_data = {
-                    'patient_name': patient_name,
-                    'session_date': session_date or datetime.datetime.now().strftime("%Y-%m-%d"),
-                    'audio_filename': filename,
-                    'quality_mode': 'secure-assemblyai',
-                    'encrypted_transcript': result['encrypted_transcript'],
-                    'content_hash': result['content_hash'],
-                    'encryption_method': result['encryption_method'],
-                    'privacy_level': result['privacy_level'],
-                    'word_count': result['word_count'],
-                    'char_count': result['char_count'],
-                    'created_at': datetime.datetime.now().isoformat(),
-                    'is_encrypted': True
-                }
-                
-                with open(session_file, 'w', encoding='utf-8') as f:
-                    json.dump(session_data, f, ensure_ascii=False, indent=2)
-                
-                print(f"✅ תמלול מאובטח נשמר: {session_file}")
-                
-                return jsonify({
-                    'success': True,
-                    'original_transcript': decrypted_text,  # מוצג רק בממשק
-                    'corrected_transcript': decrypted_text,
-                    'encryption_info': {
-                        'method': result['encryption_method'],
-                        'privacy_level': result['privacy_level'],
-                        'content_hash': result['content_hash']
-                    },
-                    'session_info': {
-                        'sessions_used': count_sessions(),
-                        'sessions_limit': MAX_SESSIONS,
-                        'sessions_remaining': MAX_SESSIONS - count_sessions()
-                    },
-                    'security_message': '🔐 התמלול נשמר בהצפנה מקסימלית - רק אתה יכול לפענח אותו!'
-                })
-            else:
-                return jsonify({'error': 'שגיאה בתמלול מאובטח'}), 500
-                
-        finally:
-            # ניקוי קובץ זמני
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            if len(encryption_password) < 8:
+                return jsonify({'error': 'סיסמת הצפנה חייבת להכיל לפחות 8 תווים'}), 400
+        
+        # בדיקת מגבלות
+        limit_error = check_transcription_limits(patient_name)
+        if limit_error:
+            return limit_error
+        
+        status = get_owned_upload(upload_id, user_info)
+        if not status:
+            return jsonify({'error': 'העלאה לא נמצאה'}), 404
+        
+        filename = status['filename']
+        stored_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{secrets.token_hex(8)}_{filename}")
+        
+        success, result = chunked_uploads.finalize(upload_id, stored_path)
+        if not success:
+            return jsonify({'error': result, 'missing_chunks': status['missing_chunks']}), 409
+        
+        audio_sha256 = sha256_file(stored_path)
+        cached_response = cached_transcription_response(user_info['user_id'], patient_name, session_date,
+                                                        quality_mode, filename, stored_path, audio_sha256,
+                                                        encryption_password=encryption_password,
+                                                        backend=backend_name)
+        if cached_response:
+            return cached_response
+        
+        job_id = enqueue_transcription_job(user_info['user_id'], patient_name, session_date, quality_mode,
+                                           filename, stored_path, audio_sha256, encryption_password=encryption_password,
+                                           backend=backend_name, segmented=segmented,
+                                           trim_silence=trim_silence)
+        
+        return job_accepted_response(job_id)
         
     except Exception as e:
-        print(f"❌ שגיאה בתמלול מאובטח: {e}")
-        return jsonify({'error': f'שגיאה בתמלול מאובטח: {str(e)}'}), 500
+        print(f"❌ שגיאה בסיום העלאה: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/patients/<patient_name>/session/<session_filename>')
 def get_session_content(patient_name, session_filename):
     """קבלת תוכן סשן ספציפי"""
     try:
-        if os.path.exists(app.config['TRANSCRIPTS_FOLDER']):
-            # חיפוש בתיקיות user_X
-            for item in os.listdir(app.config['TRANSCRIPTS_FOLDER']):
-                if item.startswith('user_'):
-                    user_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], item)
-                    patient_path = os.path.join(user_path, patient_name)
-                    
-                    if os.path.exists(patient_path) and os.path.isdir(patient_path):
-                        session_file = os.path.join(patient_path, session_filename)
-                        
-                        if os.path.exists(session_file) and session_filename.endswith('.json'):
-                            try:
-                                with open(session_file, 'r', encoding='utf-8') as f:
-                                    session_data = json.load(f)
-                                
-                                print(f"📋 נתוני סשן נטענו מהקובץ: {list(session_data.keys())}")
-                                
-                                # בדיקה אם זה סשן מוצפן
-                                if session_data.get('is_encrypted') and session_data.get('encrypted_transcript'):
-                                    print("🔐 זה סשן מוצפן - נדרשת סיסמה לפענוח")
-                                    # החזרת נתונים עם סימון שזה מוצפן
-                                    session_data['transcript_text'] = '[תמלול מוצפן - נדרשת סיסמה לפענוח]'
-                                    session_data['needs_decryption'] = True
-                                else:
-                                    # סשן רגיל - וידוא שיש תוכן תמלול בשדה הנכון
-                                    transcript_content = ''
-                                    if session_data.get('transcript_text'):
-                                        transcript_content = session_data['transcript_text']
-                                        print(f"✅ נמצא תמלול בשדה transcript_text: {len(transcript_content)} תווים")
-                                    elif session_data.get('corrected_transcript'):
-                                        transcript_content = session_data['corrected_transcript']
-                                        print(f"✅ נמצא תמלול בשדה corrected_transcript: {len(transcript_content)} תווים")
-                                    elif session_data.get('original_transcript'):
-                                        transcript_content = session_data['original_transcript']
-                                        print(f"✅ נמצא תמלול בשדה original_transcript: {len(transcript_content)} תווים")
-                                    else:
-                                        print(f"❌ לא נמצא תמלול בשום שדה!")
-                                    
-                                    # הוספת השדה transcript_text אם לא קיים
-                                    if not session_data.get('transcript_text') and transcript_content:
-                                        session_data['transcript_text'] = transcript_content
-                                        print(f"🔧 הוסף שדה transcript_text עם התוכן")
-                                
-                                # עיצוב תאריך יפה
-                                if session_data.get('created_at'):
-                                    try:
-                                        dt = datetime.datetime.fromisoformat(session_data['created_at'].replace('Z', '+00:00'))
-                                        session_data['formatted_date'] = dt.strftime('%d/%m/%Y')
-                                        session_data['formatted_time'] = dt.strftime('%H:%M')
-                                        session_data['formatted_datetime'] = dt.strftime('%d/%m/%Y %H:%M')
-                                    except:
-                                        session_data['formatted_date'] = session_data.get('session_date', 'לא ידוע')
-                                        session_data['formatted_time'] = ''
-                                        session_data['formatted_datetime'] = session_data.get('created_at', 'לא ידוע')
-                                
-                                print(f"📤 שולח נתוני סשן עם השדות: {list(session_data.keys())}")
-                                
-                                return jsonify({
-                                    'success': True,
-                                    'session_data': session_data
-                                })
-                                
-                            except Exception as e:
-                                print(f"❌ שגיאה בקריאת סשן {session_filename}: {e}")
-                                return jsonify({'error': 'שגיאה בקריאת הסשן'}), 500
-                        break
+        location = session_index.find_session(patient_name, session_filename)
+        if not location:
+            return jsonify({'error': 'סשן לא נמצא'}), 404
         
-        return jsonify({'error': 'סשן לא נמצא'}), 404
+        return session_content_response(location)
         
     except Exception as e:
         print(f"❌ שגיאה בקבלת תוכן סשן: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/sessions/<session_id>')
+def get_session_by_id(session_id):
+    """קבלת תוכן סשן לפי המזהה הקבוע שלו"""
+    try:
+        location = session_index.resolve(session_id)
+        if not location:
+            return jsonify({'error': 'סשן לא נמצא'}), 404
+        
+        return session_content_response(location)
+        
+    except Exception as e:
+        print(f"❌ שגיאה בקבלת תוכן סשן {session_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def session_content_response(location):
+    """קריאת קובץ הסשן והכנתו לתצוגה"""
+    try:
+        session_data = session_index.read_session(location['path'])
+        # טוקני האינדקס העיוור לא נחוצים לתצוגה
+        session_data.pop('blind_index', None)
+        
+        print(f"📋 נתוני סשן נטענו מהקובץ: {list(session_data.keys())}")
+        
+        # בדיקה אם זה סשן מוצפן
+        if session_data.get('is_encrypted') and session_data.get('encrypted_transcript'):
+            print("🔐 זה סשן מוצפן - נדרשת סיסמה לפענוח")
+            # החזרת נתונים עם סימון שזה מוצפן
+            session_data['transcript_text'] = '[תמלול מוצפן - נדרשת סיסמה לפענוח]'
+            session_data['needs_decryption'] = True
+        else:
+            # סשן רגיל - וידוא שיש תוכן תמלול בשדה הנכון
+            transcript_content = ''
+            if session_data.get('transcript_text'):
+                transcript_content = session_data['transcript_text']
+                print(f"✅ נמצא תמלול בשדה transcript_text: {len(transcript_content)} תווים")
+            elif session_data.get('corrected_transcript'):
+                transcript_content = session_data['corrected_transcript']
+                print(f"✅ נמצא תמלול בשדה corrected_transcript: {len(transcript_content)} תווים")
+            elif session_data.get('original_transcript'):
+                transcript_content = session_data['original_transcript']
+                print(f"✅ נמצא תמלול בשדה original_transcript: {len(transcript_content)} תווים")
+            else:
+                print(f"❌ לא נמצא תמלול בשום שדה!")
+            
+            # הוספת השדה transcript_text אם לא קיים
+            if not session_data.get('transcript_text') and transcript_content:
+                session_data['transcript_text'] = transcript_content
+                print(f"🔧 הוסף שדה transcript_text עם התוכן")
+        
+        # עיצוב תאריך יפה
+        if session_data.get('created_at'):
+            session_data.update(format_session_dates(session_data['created_at'], session_data.get('session_date')))
+        
+        session_data['session_id'] = location['session_id']
+        session_data['session_filename'] = location['filename']
+        
+        print(f"📤 שולח נתוני סשן עם השדות: {list(session_data.keys())}")
+        
+        return jsonify({
+            'success': True,
+            'session_data': session_data
+        })
+        
+    except Exception as e:
+        print(f"❌ שגיאה בקריאת סשן {location['filename']}: {e}")
+        return jsonify({'error': 'שגיאה בקריאת הסשן'}), 500
+
 @app.route('/decrypt-session', methods=['POST'])
 def decrypt_session():
     """פענוח סשן מוצפן עם סיסמה"""
@@ -1118,11 +2088,12 @@ def decrypt_session():
             return jsonify({'error': 'נדרש אימות'}), 401
         
         data = request.json
+        session_id = data.get('session_id', '').strip()
         patient_name = data.get('patient_name', '').strip()
         session_filename = data.get('session_filename', '').strip()
         decryption_password = data.get('decryption_password', '').strip()
         
-        if not patient_name or not session_filename or not decryption_password:
+        if not (session_id or (patient_name and session_filename)) or not decryption_password:
             return jsonify({'error': 'חסרים נתונים נדרשים'}), 400
         
         # בדיקה אם המערכת המאובטחת זמינה
@@ -1132,28 +2103,13 @@ def decrypt_session():
                 'message': 'חסרה ספריית ההצפנה'
             }), 503
         
-        # חיפוש הסשן
-        session_found = False
-        session_data = None
-        
-        if os.path.exists(app.config['TRANSCRIPTS_FOLDER']):
-            for item in os.listdir(app.config['TRANSCRIPTS_FOLDER']):
-                if item.startswith('user_'):
-                    user_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], item)
-                    patient_path = os.path.join(user_path, patient_name)
-                    
-                    if os.path.exists(patient_path) and os.path.isdir(patient_path):
-                        session_file = os.path.join(patient_path, session_filename)
-                        
-                        if os.path.exists(session_file) and session_filename.endswith('.json'):
-                            with open(session_file, 'r', encoding='utf-8') as f:
-                                session_data = json.load(f)
-                            session_found = True
-                            break
-        
-        if not session_found or not session_data:
+        # חיפוש הסשן - לפי המזהה, או לפי שם מטופל ושם קובץ
+        location = find_session_location(session_id, patient_name, session_filename)
+        if not location:
             return jsonify({'error': 'סשן לא נמצא'}), 404
         
+        session_data = session_index.read_session(location['path'])
+        
         # בדיקה אם זה באמת סשן מוצפן
         if not session_data.get('is_encrypted') or not session_data.get('encrypted_transcript'):
             return jsonify({'error': 'זה לא סשן מוצפן'}), 400
@@ -1197,33 +2153,17 @@ def delete_patient(patient_name):
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({'error': 'נדרש אימות'}), 401
         
-        deleted_sessions_count = 0
-        patient_found = False
-        
-        if os.path.exists(app.config['TRANSCRIPTS_FOLDER']):
-            # חיפוש בתיקיות user_X
-            for item in os.listdir(app.config['TRANSCRIPTS_FOLDER']):
-                if item.startswith('user_'):
-                    user_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], item)
-                    patient_path = os.path.join(user_path, patient_name)
-                    
-                    if os.path.exists(patient_path) and os.path.isdir(patient_path):
-                        patient_found = True
-                        
-                        # ספירת הסשנים לפני המחיקה
-                        session_files = [f for f in os.listdir(patient_path) if f.endswith('.json')]
-                        deleted_sessions_count = len(session_files)
-                        
-                        # מחיקת תיקיית המטופל וכל התוכן
-                        import shutil
-                        shutil.rmtree(patient_path)
-                        
-                        print(f"🗑️ מחק מטופל {patient_name} עם {deleted_sessions_count} סשנים")
-                        break
-        
-        if not patient_found:
+        # תיקיית המשתמש של המטופל - מהאינדקס
+        user_folder = session_index.patient_exists(patient_name)
+        if not user_folder:
             return jsonify({'error': 'מטופל לא נמצא'}), 404
         
+        # מחיקת תיקיית המטופל וכל התוכן (וגם מהאינדקס)
+        patient_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], user_folder, patient_name)
+        deleted_sessions_count = session_index.delete_patient(patient_path)
+        
+        print(f"🗑️ מחק מטופל {patient_name} עם {deleted_sessions_count} סשנים")
+        
         return jsonify({
             'success': True,
             'message': f'המטופל {patient_name} נמחק בהצלחה',
@@ -1246,52 +2186,101 @@ def delete_session():
             return jsonify({'error': 'נדרש אימות'}), 401
         
         data = request.json
+        session_id = data.get('session_id', '').strip()
         patient_name = data.get('patient_name', '').strip()
         session_filename = data.get('session_filename', '').strip()
         
-        if not patient_name or not session_filename:
+        if not session_id and (not patient_name or not session_filename):
             return jsonify({'error': 'חסרים נתונים נדרשים'}), 400
         
-        session_found = False
+        return delete_session_response(find_session_location(session_id, patient_name, session_filename))
         
-        if os.path.exists(app.config['TRANSCRIPTS_FOLDER']):
-            # חיפוש בתיקיות user_X
-            for item in os.listdir(app.config['TRANSCRIPTS_FOLDER']):
-                if item.startswith('user_'):
-                    user_path = os.path.join(app.config['TRANSCRIPTS_FOLDER'], item)
-                    patient_path = os.path.join(user_path, patient_name)
-                    
-                    if os.path.exists(patient_path) and os.path.isdir(patient_path):
-                        session_file = os.path.join(patient_path, session_filename)
-                        
-                        if os.path.exists(session_file):
-                            os.remove(session_file)
-                            session_found = True
-                            print(f"🗑️ מחק סשן {session_filename} של מטופל {patient_name}")
-                            break
-        
-        if not session_found:
-            return jsonify({'error': 'סשן לא נמצא'}), 404
+    except Exception as e:
+        print(f"❌ שגיאה במחיקת סשן: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session_by_id(session_id):
+    """מחיקת סשן לפי המזהה הקבוע שלו"""
+    try:
+        # בדיקת אימות
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'נדרש אימות'}), 401
         
-        return jsonify({
-            'success': True,
-            'message': f'הסשן נמחק בהצלחה',
-            'session_info': {
-                'sessions_used': count_sessions(),
-                'sessions_limit': MAX_SESSIONS,
-                'sessions_remaining': MAX_SESSIONS - count_sessions()
-            }
-        })
+        return delete_session_response(session_index.resolve(session_id))
         
     except Exception as e:
-        print(f"❌ שגיאה במחיקת סשן: {e}")
+        print(f"❌ שגיאה במחיקת סשן {session_id}: {e}")
         return jsonify({'error': str(e)}), 500
 
+def find_session_location(session_id, patient_name, session_filename):
+    """מיקום סשן - לפי מזהה אם ניתן, אחרת לפי שם מטופל ושם קובץ"""
+    if session_id:
+        return session_index.resolve(session_id)
+    return session_index.find_session(patient_name, session_filename)
+
+def delete_session_response(location):
+    """מחיקת הסשן (קובץ ואינדקס) והחזרת תשובה ללקוח"""
+    if not location or not session_index.session_exists(location['path']):
+        return jsonify({'error': 'סשן לא נמצא'}), 404
+    
+    session_index.delete_session(location['path'])
+    print(f"🗑️ מחק סשן {location['filename']} של מטופל {location['patient_name']}")
+    
+    return jsonify({
+        'success': True,
+        'message': f'הסשן נמחק בהצלחה',
+        'session_id': location['session_id'],
+        'session_info': {
+            'sessions_used': count_sessions(),
+            'sessions_limit': MAX_SESSIONS,
+            'sessions_remaining': MAX_SESSIONS - count_sessions()
+        }
+    })
+
+def cleanup_job_audio(job):
+    """מחיקת קובץ השמע רק אחרי שתוצאת העבודה נשמרה - עבודה שנקטעה עדיין צריכה אותו"""
+    # בתמלול מאובטח השמע הלא מוצפן נדרס לפני המחיקה
+    remove = secure_delete if job['job_type'] == 'transcribe-secure' and secure_delete else os.remove
+    
+    audio_path = job['payload'].get('audio_path')
+    if audio_path and os.path.exists(audio_path):
+        remove(audio_path)
+    
+    # קבצי ביניים של עבודה שנקטעה באמצע
+    for suffix in ('.normalized.wav', '.trimmed.wav'):
+        if audio_path and os.path.exists(f"{audio_path}{suffix}"):
+            remove(f"{audio_path}{suffix}")
+
+# workers לעיבוד התור - מופעלים בכל תהליך (ראה post_fork ב-gunicorn_config.py)
+job_worker_pool = JobWorkerPool(job_queue, {
+    'transcribe': process_transcription_job,
+    'transcribe-secure': process_secure_transcription_job
+}, num_workers=JOB_WORKERS, cleanup=cleanup_job_audio)
+
+def start_job_workers():
+    """הפעלת workers לעיבוד עבודות תמלול בתהליך הנוכחי"""
+    job_worker_pool.start()
+    chunked_uploads.purge_stale_uploads()
+    access_tokens.start_purger()
+    if SESSION_INDEX_WATCH:
+        session_index.start_watcher()
+    if SESSION_STORAGE == 'segments':
+        session_index.start_compactor()
+    # אחסון משותף - סשנים ששרתים אחרים שמרו או מחקו נכנסים לאינדקס המקומי
+    if session_index.object_store:
+        session_index.start_store_sync(int(os.getenv('SESSION_STORE_SYNC_SECONDS', '30')))
+
 if __name__ == '__main__':
     HOST = os.getenv('HOST', '0.0.0.0')
     PORT = int(os.getenv('PORT', '5000'))
     DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
     
+    # במצב debug ה-reloader מריץ את הקובץ פעמיים - מפעילים workers רק בתהליך שמגיש בקשות
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_job_workers()
+    
     print("🎤 מערכת תמלול פשוטה למטפלים")
     print(f"🌐 גישה: http://localhost:{PORT}")
     print(f"🔧 מגבלות: {MAX_PATIENTS} מטופלים, {MAX_SESSIONS} סשנים")
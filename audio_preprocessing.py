@@ -0,0 +1,337 @@
+# audio_preprocessing.py - נרמול שמע וחיתוך שקט לפני שליחה למנוע התמלול
+import os
+import wave
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# קצב הדגימה שמנועי תמלול דיבור עובדים בו בפועל - כל מה שמעליו הוא רוחב פס מבוזבז
+TARGET_SAMPLE_RATE = 16000
+# אורך מסנן ה-low-pass לפני הורדת קצב הדגימה (מונע aliasing)
+FILTER_TAPS = 63
+# כמה שניות שמע לעבד בכל פעם - הזיכרון קבוע גם בהקלטות של שעה וחצי
+READ_BLOCK_SECONDS = 10
+# זיהוי דיבור (VAD): אורך חלון, ריפוד סביב דיבור כדי לא לקטוע הברות
+VAD_FRAME_SECONDS = 0.02
+VAD_PAD_SECONDS = 0.2
+# שקט ארוך מ-MIN נחתך, ומשאירים ממנו KEEP שניות כדי שהמנוע יזהה הפסקה
+DEFAULT_MIN_SILENCE_SECONDS = 2.0
+DEFAULT_KEEP_SILENCE_SECONDS = 0.5
+
+
+def normalize_wav(input_path, output_path, target_rate=TARGET_SAMPLE_RATE):
+    """המרת WAV למונו 16kHz 16bit - מחזיר סטטיסטיקה, או None אם הקובץ אינו PCM WAV"""
+    if not NUMPY_AVAILABLE:
+        return None
+    
+    try:
+        source = wave.open(input_path, 'rb')
+    except (wave.Error, EOFError):
+        # לא WAV (למשל WebM מהדפדפן) - נשלח כמו שהוא
+        return None
+    
+    with source:
+        params = source.getparams()
+        if params.sampwidth not in (1, 2, 4) or params.nframes == 0:
+            return None
+        
+        if params.nchannels == 1 and params.sampwidth == 2 and params.framerate <= target_rate:
+            # כבר בפורמט הקומפקטי - אין מה לחסוך
+            return None
+        
+        output_rate = min(target_rate, params.framerate)
+        resampler = _Resampler(params.framerate, output_rate)
+        block_frames = params.framerate * READ_BLOCK_SECONDS
+        
+        with wave.open(output_path, 'wb') as target:
+            target.setnchannels(1)
+            target.setsampwidth(2)
+            target.setframerate(output_rate)
+            
+            while True:
+                raw = source.readframes(block_frames)
+                if not raw:
+                    break
+                mono = _decode_mono(raw, params.sampwidth, params.nchannels)
+                target.writeframes(_to_int16(resampler.process(mono)))
+            
+            target.writeframes(_to_int16(resampler.flush(params.nframes)))
+            output_frames = target.tell()
+    
+    original_bytes = os.path.getsize(input_path)
+    normalized_bytes = os.path.getsize(output_path)
+    original_duration = params.nframes / params.framerate
+    normalized_duration = output_frames / output_rate
+    
+    return {
+        'original_bytes': original_bytes,
+        'normalized_bytes': normalized_bytes,
+        'bytes_saved': original_bytes - normalized_bytes,
+        'original_duration': round(original_duration, 3),
+        'normalized_duration': round(normalized_duration, 3),
+        'duration_saved': round(max(0.0, original_duration - normalized_duration), 3),
+        'original_format': f"{params.nchannels}ch {params.framerate}Hz {params.sampwidth * 8}bit",
+        'normalized_format': f"1ch {output_rate}Hz 16bit"
+    }
+
+
+def trim_silence_wav(input_path, output_path, min_silence_seconds=DEFAULT_MIN_SILENCE_SECONDS,
+                     keep_silence_seconds=DEFAULT_KEEP_SILENCE_SECONDS):
+    """חיתוך קטעי שקט ארוכים - מחזיר סטטיסטיקה ומפת offsets, או None אם אין מה לחתוך"""
+    if not NUMPY_AVAILABLE:
+        return None
+    
+    try:
+        source = wave.open(input_path, 'rb')
+    except (wave.Error, EOFError):
+        return None
+    
+    with source:
+        params = source.getparams()
+        if params.sampwidth not in (1, 2, 4) or params.nframes == 0:
+            return None
+        
+        frame_samples = max(1, int(params.framerate * VAD_FRAME_SECONDS))
+        energy, zcr = _frame_features(source, params, frame_samples)
+        if len(energy) == 0:
+            return None
+        
+        speech = _speech_mask(energy, zcr)
+        spans = _kept_spans(speech, frame_samples, params.nframes,
+                            int(min_silence_seconds / VAD_FRAME_SECONDS),
+                            int(keep_silence_seconds / VAD_FRAME_SECONDS))
+        if len(spans) == 1:
+            return None
+        
+        # העתקת הקטעים שנשארים כמו שהם - בלי פענוח וקידוד מחדש
+        offset_map = []
+        written = 0
+        block_frames = params.framerate * READ_BLOCK_SECONDS
+        with wave.open(output_path, 'wb') as target:
+            target.setparams(params)
+            for start, end in spans:
+                offset_map.append([
+                    round(written / params.framerate, 3),
+                    round(start / params.framerate, 3),
+                    round((end - start) / params.framerate, 3)
+                ])
+                source.setpos(start)
+                remaining = end - start
+                while remaining > 0:
+                    raw = source.readframes(min(block_frames, remaining))
+                    if not raw:
+                        break
+                    target.writeframes(raw)
+                    remaining -= min(block_frames, remaining)
+                written += end - start
+    
+    original_duration = params.nframes / params.framerate
+    trimmed_duration = written / params.framerate
+    
+    return {
+        'original_duration': round(original_duration, 3),
+        'trimmed_duration': round(trimmed_duration, 3),
+        'trimmed_seconds': round(original_duration - trimmed_duration, 3),
+        'trimmed_percent': round(100 * (original_duration - trimmed_duration) / original_duration, 1),
+        'silences_trimmed': len(spans) - 1,
+        # [זמן בקובץ המקוצר, זמן בקובץ המקורי, אורך] לכל קטע שנשאר
+        'offset_map': offset_map
+    }
+
+
+def map_to_original(offset_map, trimmed_seconds):
+    """המרת זמן בקובץ המקוצר לזמן המתאים בהקלטה המקורית"""
+    if not offset_map:
+        return trimmed_seconds
+    for trimmed_start, original_start, duration in reversed(offset_map):
+        if trimmed_seconds >= trimmed_start:
+            return round(original_start + min(trimmed_seconds - trimmed_start, duration), 3)
+    return trimmed_seconds
+
+
+def _frame_features(source, params, frame_samples):
+    """אנרגיה (RMS) ו-zero-crossing rate לכל חלון - נקרא בבלוקים"""
+    block_frames = frame_samples * int(READ_BLOCK_SECONDS / VAD_FRAME_SECONDS)
+    energies = []
+    crossings = []
+    while True:
+        raw = source.readframes(block_frames)
+        if not raw:
+            break
+        samples = _decode_mono(raw, params.sampwidth, params.nchannels)
+        usable = len(samples) - len(samples) % frame_samples
+        if not usable:
+            continue
+        frames = samples[:usable].reshape(-1, frame_samples)
+        energies.append(np.sqrt((frames ** 2).mean(axis=1)))
+        signs = np.signbit(frames)
+        crossings.append((signs[:, 1:] != signs[:, :-1]).mean(axis=1))
+    
+    if not energies:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(energies), np.concatenate(crossings)
+
+
+def _speech_mask(energy, zcr):
+    """סימון חלונות עם דיבור - אנרגיה מעל סף יחסי לרעש הרקע, או אנרגיה בינונית עם ZCR גבוה (עיצורים שורקים)"""
+    noise_floor = np.percentile(energy, 10)
+    speech_level = np.percentile(energy, 95)
+    threshold = max(noise_floor + (speech_level - noise_floor) * 0.1, 1e-4)
+    
+    speech = (energy > threshold) | ((energy > max(noise_floor * 2, 1e-4)) & (zcr > 0.3))
+    
+    # ריפוד סביב כל דיבור - התחלות וסופי מילים שקטים נשארים
+    pad = int(VAD_PAD_SECONDS / VAD_FRAME_SECONDS)
+    return np.convolve(speech.astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode='same') > 0
+
+
+def _kept_spans(speech, frame_samples, total_samples, min_silence_frames, keep_frames):
+    """טווחי הדגימות שנשארים - כל שקט ארוך מוחלף ב-keep_frames מתוכו"""
+    # גבולות רצפי השקט
+    padded = np.concatenate([[True], speech, [True]]).astype(np.int8)
+    changes = np.diff(padded)
+    silence_starts = np.flatnonzero(changes == -1)
+    silence_ends = np.flatnonzero(changes == 1)
+    
+    spans = []
+    position = 0
+    for start, end in zip(silence_starts, silence_ends):
+        if end - start < max(min_silence_frames, keep_frames + 1):
+            continue
+        cut_start = int(start + keep_frames // 2) * frame_samples
+        cut_end = int(end - (keep_frames - keep_frames // 2)) * frame_samples
+        if cut_start > position:
+            spans.append((position, cut_start))
+        position = cut_end
+    if position < total_samples:
+        spans.append((position, total_samples))
+    return spans
+
+
+def _decode_mono(raw, sampwidth, nchannels):
+    """פענוח PCM לממוצע הערוצים בטווח [-1, 1]"""
+    dtype, scale, center = {
+        1: (np.uint8, 128.0, 128.0),
+        2: (np.int16, 32768.0, 0.0),
+        4: (np.int32, 2147483648.0, 0.0)
+    }[sampwidth]
+    samples = (np.frombuffer(raw, dtype=dtype).astype(np.float64) - center) / scale
+    usable = len(samples) - len(samples) % nchannels
+    return samples[:usable].reshape(-1, nchannels).mean(axis=1)
+
+
+def _to_int16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).round().astype('<i2').tobytes()
+
+
+class _Resampler:
+    """שינוי קצב דגימה בבלוקים: מסנן low-pass ואינטרפולציה לינארית, עם המשכיות בין בלוקים"""
+    
+    def __init__(self, source_rate, target_rate):
+        self.ratio = source_rate / target_rate
+        self.target_rate = target_rate
+        
+        if source_rate > target_rate:
+            # windowed-sinc עם חיתוך בחצי מקצב היעד
+            cutoff = 0.5 / self.ratio
+            n = np.arange(FILTER_TAPS) - (FILTER_TAPS - 1) / 2
+            taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(FILTER_TAPS)
+            self.taps = taps / taps.sum()
+        else:
+            self.taps = np.ones(1)
+        
+        # המסנן סיבתי - מפצים על ההשהיה שלו במיקום הדגימות
+        self.delay = (len(self.taps) - 1) / 2
+        self.history = np.zeros(len(self.taps) - 1)
+        self.filtered = np.zeros(0)
+        self.filtered_start = 0
+        self.next_output = 0
+    
+    def process(self, samples):
+        """הזנת בלוק דגימות - מחזיר את דגימות היעד שכבר אפשר לחשב"""
+        padded = np.concatenate([self.history, samples])
+        if len(self.history):
+            self.history = padded[-len(self.history):]
+        self.filtered = np.concatenate([self.filtered, np.convolve(padded, self.taps, mode='valid')])
+        return self._emit()
+    
+    def flush(self, source_frames):
+        """סוף הקובץ - דחיפת ההשהיה של המסנן והשלמת מספר הדגימות המדויק"""
+        output = self.process(np.zeros(int(np.ceil(self.delay)) + 1))
+        extra = self.next_output - int(round(source_frames / self.ratio))
+        if extra > 0:
+            output = output[:max(0, len(output) - extra)]
+        return output
+    
+    def _emit(self):
+        last_position = self.filtered_start + len(self.filtered) - 1
+        count = int(np.floor((last_position - self.delay) / self.ratio)) - self.next_output + 1
+        if count <= 0:
+            return np.zeros(0)
+        
+        positions = np.arange(self.next_output, self.next_output + count) * self.ratio + self.delay
+        local = positions - self.filtered_start
+        output = np.interp(local, np.arange(len(self.filtered)), self.filtered)
+        self.next_output += count
+        
+        # שומרים רק את הדגימות שהאינטרפולציה הבאה עוד צריכה
+        keep_from = max(0, int(np.floor(self.next_output * self.ratio + self.delay)) - self.filtered_start)
+        self.filtered = self.filtered[keep_from:]
+        self.filtered_start += keep_from
+        return output
+
+
+class AudioPreprocessor:
+    """הרצת נרמול השמע ב-process pool - עיבוד numpy כבד לא חוסם את ה-threads של השרת"""
+    
+    def __init__(self, max_workers=2, target_rate=TARGET_SAMPLE_RATE):
+        self.max_workers = max_workers
+        self.target_rate = target_rate
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+    
+    def _get_pool(self):
+        with self._lock:
+            # pool שנוצר לפני fork לא עובד בתהליך הבן - יוצרים חדש לכל תהליך
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+    
+    def normalize(self, input_path, output_path):
+        """נרמול קובץ בתהליך נפרד - מחזיר סטטיסטיקה, או None אם הקובץ נשאר כמו שהוא"""
+        if not NUMPY_AVAILABLE:
+            return None
+        
+        stats = self._get_pool().submit(normalize_wav, input_path, output_path, self.target_rate).result()
+        if stats is None and os.path.exists(output_path):
+            os.remove(output_path)
+        return stats
+    
+    def trim_silence(self, input_path, output_path, min_silence_seconds=DEFAULT_MIN_SILENCE_SECONDS,
+                     keep_silence_seconds=DEFAULT_KEEP_SILENCE_SECONDS):
+        """חיתוך שקט בתהליך נפרד - מחזיר סטטיסטיקה ומפת offsets, או None אם לא נחתך כלום"""
+        if not NUMPY_AVAILABLE:
+            return None
+        
+        stats = self._get_pool().submit(trim_silence_wav, input_path, output_path,
+                                        min_silence_seconds, keep_silence_seconds).result()
+        if stats is None and os.path.exists(output_path):
+            os.remove(output_path)
+        return stats
+    
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False)
+            self._pool = None
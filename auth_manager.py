@@ -4,16 +4,23 @@ import json
 import hashlib
 import secrets
 import datetime
+import threading
 from flask import session, request
 import requests
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
-import sqlite3
-import bcrypt
+from sqlite_pool import connect_db
+from token_cache import TokenCache, TOKEN_CACHE_TTL_SECONDS
+from access_tokens import AccessTokens
+from password_hashing import get_password_hasher
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# מופע אחד לכל תהליך - ראו get_auth_manager
+_auth_manager = None
+_auth_manager_lock = threading.Lock()
+
 class AuthManager:
     def __init__(self):
         self.db_path = 'users.db'
@@ -23,11 +30,20 @@ class AuthManager:
         self.free_max_patients = int(os.getenv('FREE_MAX_PATIENTS', '1'))
         self.free_max_sessions = int(os.getenv('FREE_MAX_SESSIONS', '5'))
         
+        # כיול עלות גיבוב הסיסמאות (פעם אחת לתהליך)
+        get_password_hasher()
+        
+        # טוקנים שאומתו לאחרונה - בקשה מאומתת לא פונה למסד הנתונים
+        self.token_cache = TokenCache(int(os.getenv('TOKEN_CACHE_TTL_SECONDS', str(TOKEN_CACHE_TTL_SECONDS))))
+        
         self.init_database()
+        # טוקני גישה חתומים וטוקני רענון (במקום שורה בטבלת sessions לכל כניסה)
+        self.access_tokens = AccessTokens(self.db_path, audience='users',
+                                          max_tokens_per_user=int(os.getenv('MAX_TOKENS_PER_USER', '10')))
     
     def init_database(self):
         """יצירת טבלת משתמשים"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect_db(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute(f'''
@@ -61,6 +77,23 @@ class AuthManager:
             )
         ''')
         
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS password_reset_tokens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                token TEXT UNIQUE,
+                expires_at TEXT,
+                used BOOLEAN DEFAULT 0,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        
+        # אינדקסים לניקוי לפי תפוגה ולמחיקה לפי משתמש
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_password_reset_tokens_expires ON password_reset_tokens (expires_at)')
+        
         # Update existing users who might have the old default limit
         cursor.execute(f'''
             UPDATE users 
@@ -72,17 +105,17 @@ class AuthManager:
         conn.close()
     
     def hash_password(self, password):
-        """הצפנת סיסמה"""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        """הצפנת סיסמה - אלגוריתם ועלות מכוילים (password_hashing.py)"""
+        return get_password_hasher().hash(password)
     
     def verify_password(self, password, password_hash):
         """אימות סיסמה"""
-        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        return get_password_hasher().verify(password, password_hash)
     
     def register_user(self, email, password, full_name):
         """רישום משתמש חדש"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # בדיקה אם המשתמש כבר קיים
@@ -116,11 +149,11 @@ class AuthManager:
     def login_user(self, email, password):
         """כניסת משתמש עם אימייל וסיסמה"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT id, password_hash, full_name, is_active, subscription_expires
+                SELECT id, password_hash, full_name, is_active, subscription_expires, subscription_type
                 FROM users WHERE email = ?
             ''', (email,))
             
@@ -128,7 +161,7 @@ class AuthManager:
             if not user:
                 return False, 'משתמש לא נמצא'
             
-            user_id, password_hash, full_name, is_active, subscription_expires = user
+            user_id, password_hash, full_name, is_active, subscription_expires, subscription_type = user
             
             if not is_active:
                 return False, 'חשבון לא פעיל'
@@ -147,24 +180,25 @@ class AuthManager:
                 UPDATE users SET last_login = ? WHERE id = ?
             ''', (datetime.datetime.now().isoformat(), user_id))
             
-            # יצירת session token
-            session_token = secrets.token_urlsafe(32)
-            expires_at = datetime.datetime.now() + datetime.timedelta(days=7)
-            
-            cursor.execute('''
-                INSERT INTO sessions (user_id, session_token, expires_at)
-                VALUES (?, ?, ?)
-            ''', (user_id, session_token, expires_at.isoformat()))
+            # גיבוב באלגוריתם אחר או בעלות נמוכה מהמכוילת - גיבוב מחדש עכשיו כשהסיסמה ידועה
+            if get_password_hasher().needs_rehash(password_hash):
+                cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?',
+                               (self.hash_password(password), user_id))
             
             conn.commit()
             conn.close()
             
+            # טוקן גישה חתום + טוקן רענון
+            tokens = self.access_tokens.issue(user_id, subscription_type)
+            
             print(f"✅ משתמש נכנס: {email}")
             return True, {
                 'user_id': user_id,
                 'email': email,
                 'full_name': full_name,
-                'session_token': session_token
+                'session_token': tokens['access_token'],
+                'refresh_token': tokens['refresh_token'],
+                'expires_in': tokens['expires_in']
             }
             
         except Exception as e:
@@ -196,16 +230,16 @@ class AuthManager:
             email = idinfo['email']
             full_name = idinfo.get('name', '')
             
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # בדיקה אם המשתמש קיים
-            cursor.execute('SELECT id, full_name, is_active FROM users WHERE google_id = ? OR email = ?', 
+            cursor.execute('SELECT id, full_name, is_active, subscription_type FROM users WHERE google_id = ? OR email = ?', 
                           (google_id, email))
             user = cursor.fetchone()
             
             if user:
-                user_id, existing_name, is_active = user
+                user_id, existing_name, is_active, subscription_type = user
                 if not is_active:
                     return False, 'חשבון לא פעיל'
                 
@@ -226,25 +260,22 @@ class AuthManager:
                       0, self.free_max_sessions))
                 user_id = cursor.lastrowid
                 final_name = full_name
-            
-            # יצירת session token
-            session_token = secrets.token_urlsafe(32)
-            expires_at = datetime.datetime.now() + datetime.timedelta(days=7)
-            
-            cursor.execute('''
-                INSERT INTO sessions (user_id, session_token, expires_at)
-                VALUES (?, ?, ?)
-            ''', (user_id, session_token, expires_at.isoformat()))
+                subscription_type = 'trial'
             
             conn.commit()
             conn.close()
             
+            # טוקן גישה חתום + טוקן רענון
+            tokens = self.access_tokens.issue(user_id, subscription_type)
+            
             print(f"✅ כניסה עם Google: {email}")
             return True, {
                 'user_id': user_id,
                 'email': email,
                 'full_name': final_name,
-                'session_token': session_token
+                'session_token': tokens['access_token'],
+                'refresh_token': tokens['refresh_token'],
+                'expires_in': tokens['expires_in']
             }
             
         except Exception as e:
@@ -252,32 +283,55 @@ class AuthManager:
             return False, f'שגיאה בכניסה עם Google: {str(e)}'
     
     def verify_session(self, session_token):
-        """אימות session token"""
+        """אימות session token - טוקן גישה חתום נבדק בזיכרון, ופרטי המשתמש מהמטמון אם אומת לאחרונה"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            signed = self.access_tokens.is_access_token(session_token)
+            if signed:
+                # חתימה, תפוגה וביטול - בלי מסד נתונים
+                is_valid, claims = self.access_tokens.verify(session_token)
+                if not is_valid:
+                    return False, claims
+            
+            user_data = self.token_cache.get(session_token)
+            if user_data:
+                return True, user_data
+            
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT s.user_id, u.email, u.full_name, u.subscription_expires, u.usage_count, u.usage_limit, 
-                       u.subscription_type, u.free_sessions_used, u.free_sessions_limit, u.payment_status
-                FROM sessions s
-                JOIN users u ON s.user_id = u.id
-                WHERE s.session_token = ? AND s.expires_at > ? AND u.is_active = 1
-            ''', (session_token, datetime.datetime.now().isoformat()))
+            if signed:
+                cursor.execute('''
+                    SELECT id, email, full_name, subscription_expires, usage_count, usage_limit, 
+                           subscription_type, free_sessions_used, free_sessions_limit, payment_status, ?
+                    FROM users WHERE id = ? AND is_active = 1
+                ''', (datetime.datetime.fromtimestamp(claims['exp']).isoformat(), claims['sub']))
+            else:
+                # session token ישן (לפני טוקני הגישה)
+                cursor.execute('''
+                    SELECT s.user_id, u.email, u.full_name, u.subscription_expires, u.usage_count, u.usage_limit, 
+                           u.subscription_type, u.free_sessions_used, u.free_sessions_limit, u.payment_status,
+                           s.expires_at
+                    FROM sessions s
+                    JOIN users u ON s.user_id = u.id
+                    WHERE s.session_token = ? AND s.expires_at > ? AND u.is_active = 1
+                ''', (session_token, datetime.datetime.now().isoformat()))
             
             result = cursor.fetchone()
             conn.close()
             
             if result:
-                user_id, email, full_name, subscription_expires, usage_count, usage_limit, subscription_type, free_sessions_used, free_sessions_limit, payment_status = result
+                user_id, email, full_name, subscription_expires, usage_count, usage_limit, subscription_type, free_sessions_used, free_sessions_limit, payment_status, session_expires = result
                 
                 # בדיקת תוקף מנוי
+                now = datetime.datetime.now()
+                valid_until = datetime.datetime.fromisoformat(session_expires)
                 if subscription_expires:
                     expires_date = datetime.datetime.fromisoformat(subscription_expires)
-                    if expires_date < datetime.datetime.now():
+                    if expires_date < now:
                         return False, 'המנוי פג תוקף'
+                    valid_until = min(valid_until, expires_date)
                 
-                return True, {
+                user_data = {
                     'user_id': user_id,
                     'email': email,
                     'full_name': full_name,
@@ -288,6 +342,9 @@ class AuthManager:
                     'free_sessions_limit': free_sessions_limit,
                     'payment_status': payment_status
                 }
+                # במטמון לא יותר מתוקף ה-session או המנוי
+                self.token_cache.put(session_token, user_data, (valid_until - now).total_seconds())
+                return True, user_data
             
             return False, 'Session לא תקין'
             
@@ -295,15 +352,22 @@ class AuthManager:
             print(f"❌ שגיאה באימות session: {str(e)}")
             return False, str(e)
     
-    def logout_user(self, session_token):
+    def logout_user(self, session_token, refresh_token=None):
         """יציאת משתמש"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM sessions WHERE session_token = ?', (session_token,))
-            conn.commit()
-            conn.close()
+            if self.access_tokens.is_access_token(session_token):
+                # ביטול טוקן הגישה (לכל התהליכים) ומחיקת טוקן הרענון
+                is_valid, claims = self.access_tokens.verify(session_token)
+                if is_valid:
+                    self.access_tokens.revoke(claims, refresh_token)
+            else:
+                conn = connect_db(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('DELETE FROM sessions WHERE session_token = ?', (session_token,))
+                conn.commit()
+                conn.close()
+            self.token_cache.invalidate(session_token)
             
             return True
             
@@ -311,10 +375,38 @@ class AuthManager:
             print(f"❌ שגיאה ביציאת משתמש: {str(e)}")
             return False
     
+    def refresh_session(self, refresh_token):
+        """טוקן גישה חדש תמורת טוקן רענון (חד-פעמי - מוחזר גם טוקן רענון חדש)"""
+        try:
+            is_valid, user_id = self.access_tokens.use_refresh_token(refresh_token)
+            if not is_valid:
+                return False, user_id
+            
+            conn = connect_db(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT subscription_type, is_active FROM users WHERE id = ?', (user_id,))
+            user = cursor.fetchone()
+            conn.close()
+            
+            if not user or not user[1]:
+                return False, 'חשבון לא פעיל'
+            
+            tokens = self.access_tokens.issue(user_id, user[0])
+            return True, {
+                'user_id': user_id,
+                'session_token': tokens['access_token'],
+                'refresh_token': tokens['refresh_token'],
+                'expires_in': tokens['expires_in']
+            }
+            
+        except Exception as e:
+            print(f"❌ שגיאה ברענון טוקן: {str(e)}")
+            return False, str(e)
+    
     def increment_usage(self, user_id):
         """הגדלת מונה השימוש"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -323,6 +415,7 @@ class AuthManager:
             
             conn.commit()
             conn.close()
+            self.token_cache.update_user(user_id, usage_count=lambda count: (count or 0) + 1)
             
             return True
             
@@ -333,7 +426,7 @@ class AuthManager:
     def check_usage_limit(self, user_id):
         """בדיקת מגבלת שימוש"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -345,17 +438,7 @@ class AuthManager:
             conn.close()
             
             if result:
-                usage_count, usage_limit, subscription_type = result
-                
-                # מנוי פרימיום = ללא הגבלה
-                if subscription_type in ['premium', 'professional']:
-                    return True, usage_count, -1
-                
-                # בדיקת מגבלה
-                if usage_count >= usage_limit:
-                    return False, usage_count, usage_limit
-                
-                return True, usage_count, usage_limit
+                return self.usage_limit_status(*result)
             
             return False, 0, 0
             
@@ -363,10 +446,22 @@ class AuthManager:
             print(f"❌ שגיאה בבדיקת מגבלת שימוש: {str(e)}")
             return False, 0, 0
     
+    def usage_limit_status(self, usage_count, usage_limit, subscription_type):
+        """מגבלת שימוש לפי נתוני המשתמש (גם מהמטמון) - (מותר, שימוש, מגבלה)"""
+        # מנוי פרימיום = ללא הגבלה
+        if subscription_type in ['premium', 'professional']:
+            return True, usage_count, -1
+        
+        # בדיקת מגבלה
+        if usage_count >= usage_limit:
+            return False, usage_count, usage_limit
+        
+        return True, usage_count, usage_limit
+    
     def get_user_info(self, user_id):
         """קבלת מידע משתמש"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -401,7 +496,7 @@ class AuthManager:
     def generate_password_reset_token(self, email):
         """יצירת טוקן לאיפוס סיסמה"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # בדיקה אם המשתמש קיים
@@ -417,19 +512,6 @@ class AuthManager:
             reset_token = secrets.token_urlsafe(32)
             expires_at = datetime.datetime.now() + datetime.timedelta(hours=1)  # תוקף של שעה
             
-            # יצירת טבלת טוקני איפוס אם לא קיימת
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    token TEXT UNIQUE,
-                    expires_at TEXT,
-                    used BOOLEAN DEFAULT 0,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
             # הוספת הטוקן
             cursor.execute('''
                 INSERT INTO password_reset_tokens (user_id, token, expires_at)
@@ -449,7 +531,7 @@ class AuthManager:
     def reset_password(self, token, new_password):
         """איפוס סיסמה באמצעות טוקן"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # בדיקת תוקף הטוקן
@@ -482,6 +564,7 @@ class AuthManager:
             
             conn.commit()
             conn.close()
+            self.revoke_user_tokens(user_id)
             
             print(f"✅ סיסמה אופסה בהצלחה עבור: {email}")
             return True, 'הסיסמה אופסה בהצלחה'
@@ -493,7 +576,7 @@ class AuthManager:
     def check_free_session_limit(self, user_id):
         """בדיקת מגבלת סשנים חינמיים"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -505,28 +588,7 @@ class AuthManager:
             conn.close()
             
             if result:
-                free_sessions_used, free_sessions_limit, subscription_type, payment_status = result
-                
-                # וידוא שהערכים לא null
-                if free_sessions_used is None:
-                    free_sessions_used = 0
-                if free_sessions_limit is None:
-                    free_sessions_limit = self.free_max_sessions
-                
-                print(f"🔍 בדיקת מגבלת סשנים עבור משתמש {user_id}: {free_sessions_used}/{free_sessions_limit}")
-                
-                # מנוי בתשלום = ללא הגבלה
-                if subscription_type in ['premium', 'professional'] and payment_status == 'paid':
-                    print(f"✅ מנוי בתשלום - ללא הגבלה")
-                    return True, free_sessions_used, -1, 'paid'
-                
-                # בדיקת מגבלת סשנים חינמיים - רק אם באמת הגיע למגבלה
-                if free_sessions_used >= free_sessions_limit:
-                    print(f"❌ הגיע למגבלת סשנים: {free_sessions_used} >= {free_sessions_limit}")
-                    return False, free_sessions_used, free_sessions_limit, 'limit_reached'
-                
-                print(f"✅ יש עוד סשנים זמינים: {free_sessions_limit - free_sessions_used}")
-                return True, free_sessions_used, free_sessions_limit, 'trial'
+                return self.free_session_status(user_id, *result)
             
             print(f"❌ לא נמצא משתמש {user_id}")
             return False, 0, 0, 'error'
@@ -535,10 +597,33 @@ class AuthManager:
             print(f"❌ שגיאה בבדיקת מגבלת סשנים חינמיים: {str(e)}")
             return False, 0, 0, 'error'
     
+    def free_session_status(self, user_id, free_sessions_used, free_sessions_limit, subscription_type, payment_status):
+        """מגבלת סשנים חינמיים לפי נתוני המשתמש (גם מהמטמון) - (מותר, בשימוש, מגבלה, סטטוס)"""
+        # וידוא שהערכים לא null
+        if free_sessions_used is None:
+            free_sessions_used = 0
+        if free_sessions_limit is None:
+            free_sessions_limit = self.free_max_sessions
+        
+        print(f"🔍 בדיקת מגבלת סשנים עבור משתמש {user_id}: {free_sessions_used}/{free_sessions_limit}")
+        
+        # מנוי בתשלום = ללא הגבלה
+        if subscription_type in ['premium', 'professional'] and payment_status == 'paid':
+            print(f"✅ מנוי בתשלום - ללא הגבלה")
+            return True, free_sessions_used, -1, 'paid'
+        
+        # בדיקת מגבלת סשנים חינמיים - רק אם באמת הגיע למגבלה
+        if free_sessions_used >= free_sessions_limit:
+            print(f"❌ הגיע למגבלת סשנים: {free_sessions_used} >= {free_sessions_limit}")
+            return False, free_sessions_used, free_sessions_limit, 'limit_reached'
+        
+        print(f"✅ יש עוד סשנים זמינים: {free_sessions_limit - free_sessions_used}")
+        return True, free_sessions_used, free_sessions_limit, 'trial'
+    
     def check_free_patient_limit(self, user_id):
         """בדיקת מגבלת מטופלים חינמיים"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -591,7 +676,7 @@ class AuthManager:
     def decrement_free_session(self, user_id):
         """הפחתת מונה סשנים חינמיים (כאשר מוחקים סשן)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -600,6 +685,7 @@ class AuthManager:
             
             conn.commit()
             conn.close()
+            self.token_cache.update_user(user_id, free_sessions_used=lambda used: max(0, (used or 0) - 1))
             
             return True
             
@@ -610,7 +696,7 @@ class AuthManager:
     def increment_free_session(self, user_id):
         """הגדלת מונה סשנים חינמיים"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -619,6 +705,7 @@ class AuthManager:
             
             conn.commit()
             conn.close()
+            self.token_cache.update_user(user_id, free_sessions_used=lambda used: (used or 0) + 1)
             
             return True
             
@@ -629,7 +716,7 @@ class AuthManager:
     def reset_free_sessions_counter(self, user_id):
         """איפוס מונה סשנים חינמיים (לפתרון בעיות)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -638,6 +725,7 @@ class AuthManager:
             
             conn.commit()
             conn.close()
+            self.token_cache.update_user(user_id, free_sessions_used=0)
             
             print(f"✅ מונה סשנים חינמיים אופס עבור משתמש {user_id}")
             return True
@@ -649,7 +737,7 @@ class AuthManager:
     def upgrade_to_premium(self, user_id, payment_method='manual'):
         """שדרוג למנוי פרימיום"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # עדכון סטטוס המנוי
@@ -663,6 +751,7 @@ class AuthManager:
             
             conn.commit()
             conn.close()
+            self.token_cache.invalidate_user(user_id)
             
             print(f"✅ משתמש {user_id} שודרג למנוי פרימיום")
             return True, 'שודרג למנוי פרימיום בהצלחה'
@@ -674,7 +763,7 @@ class AuthManager:
     def get_subscription_status(self, user_id):
         """קבלת סטטוס מנוי"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -719,7 +808,7 @@ class AuthManager:
             payment_session_id = secrets.token_urlsafe(32)
             
             # שמירת פרטי התשלום בבסיס הנתונים
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # יצירת טבלת תשלומים אם לא קיימת
@@ -762,7 +851,7 @@ class AuthManager:
     def complete_payment(self, payment_session_id, payment_method='manual'):
         """השלמת תשלום"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # קבלת פרטי התשלום
@@ -800,6 +889,7 @@ class AuthManager:
             
             conn.commit()
             conn.close()
+            self.token_cache.invalidate_user(user_id)
             
             print(f"✅ תשלום הושלם עבור משתמש {user_id}")
             return True, 'התשלום הושלם בהצלחה'
@@ -811,7 +901,7 @@ class AuthManager:
     def get_all_users(self):
         """קבלת רשימת כל המשתמשים (למנהלים)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -846,6 +936,24 @@ class AuthManager:
         except Exception as e:
             print(f"❌ שגיאה בקבלת רשימת משתמשים: {str(e)}")
             return []
+    
+    def invalidate_user(self, user_id):
+        """הסרת הטוקנים של משתמש מהמטמון - אחרי שינוי מנוי (הטוקנים עצמם נשארים תקפים)"""
+        self.token_cache.invalidate_user(user_id)
+    
+    def revoke_user_tokens(self, user_id):
+        """ביטול כל הטוקנים של משתמש - אחרי שינוי סיסמה, השבתה או מחיקה"""
+        self.access_tokens.revoke_user(user_id)
+        self.token_cache.invalidate_user(user_id)
+
+def get_auth_manager():
+    """ה-AuthManager של התהליך - נוצר פעם אחת (init_database רץ פעם אחת) ומחזיק את מטמון הטוקנים"""
+    global _auth_manager
+    if _auth_manager is None:
+        with _auth_manager_lock:
+            if _auth_manager is None:
+                _auth_manager = AuthManager()
+    return _auth_manager
 
 def require_auth(f):
     """דקורטור להרישת אימות - מחזיר JSON error"""
@@ -854,7 +962,7 @@ def require_auth(f):
     
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_manager = AuthManager()
+        auth_manager = get_auth_manager()
         
         # בדיקת session token
         session_token = request.headers.get('Authorization')
@@ -870,8 +978,9 @@ def require_auth(f):
         if not is_valid:
             return jsonify({'error': 'Session לא תקין'}), 401
         
-        # בדיקת מגבלת שימוש
-        can_use, usage_count, usage_limit = auth_manager.check_usage_limit(user_data['user_id'])
+        # בדיקת מגבלת שימוש - מהנתונים שאומתו, בלי פנייה נוספת למסד הנתונים
+        can_use, usage_count, usage_limit = auth_manager.usage_limit_status(
+            user_data['usage_count'], user_data['usage_limit'], user_data['subscription_type'])
         if not can_use:
             return jsonify({
                 'error': 'הגעת למגבלת השימוש החודשית',
@@ -893,7 +1002,7 @@ def require_auth_html(f):
     
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_manager = AuthManager()
+        auth_manager = get_auth_manager()
         
         # בדיקת session token
         session_token = request.headers.get('Authorization')
@@ -911,8 +1020,9 @@ def require_auth_html(f):
             # הפניה לדף כניסה במקום JSON error
             return redirect('/login')
         
-        # בדיקת מגבלת שימוש
-        can_use, usage_count, usage_limit = auth_manager.check_usage_limit(user_data['user_id'])
+        # בדיקת מגבלת שימוש - מהנתונים שאומתו, בלי פנייה נוספת למסד הנתונים
+        can_use, usage_count, usage_limit = auth_manager.usage_limit_status(
+            user_data['usage_count'], user_data['usage_limit'], user_data['subscription_type'])
         if not can_use:
             # הצגת דף שגיאה במקום JSON
             return render_template('error.html', 
@@ -934,7 +1044,7 @@ def require_session_limit_check(f):
     
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_manager = AuthManager()
+        auth_manager = get_auth_manager()
         
         # בדיקת session token
         session_token = request.headers.get('Authorization')
@@ -951,7 +1061,9 @@ def require_session_limit_check(f):
             return jsonify({'error': 'Session לא תקין'}), 401
         
         # בדיקת מגבלת סשנים חינמיים
-        can_create, sessions_used, sessions_limit, status = auth_manager.check_free_session_limit(user_data['user_id'])
+        can_create, sessions_used, sessions_limit, status = auth_manager.free_session_status(
+            user_data['user_id'], user_data['free_sessions_used'], user_data['free_sessions_limit'],
+            user_data['subscription_type'], user_data['payment_status'])
         
         if not can_create and status == 'limit_reached':
             return jsonify({
@@ -0,0 +1,269 @@
+# chunked_upload.py - העלאת קבצי שמע בחלקים עם אפשרות המשך אחרי ניתוק
+import os
+import uuid
+import shutil
+import hashlib
+import sqlite3
+import datetime
+from sqlite_pool import connect_db
+
+# גודל חלק ברירת מחדל - קטן מספיק כדי שניתוק יעלה רק כמה שניות של העלאה חוזרת
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+# העלאה שלא הושלמה תוך זמן זה נמחקת
+UPLOAD_EXPIRY_HOURS = 24
+
+
+class ChunkedUploadManager:
+    """ניהול העלאות בחלקים: init, PUT לכל חלק עם checksum, ו-finalize"""
+    
+    def __init__(self, spool_folder, db_path='chunked_uploads.db', max_upload_size=None,
+                 max_chunk_size=None):
+        self.spool_folder = spool_folder
+        self.db_path = db_path
+        self.max_upload_size = max_upload_size
+        self.max_chunk_size = max_chunk_size
+        os.makedirs(self.spool_folder, exist_ok=True)
+        self.init_database()
+    
+    def _connect(self):
+        """חיבור עם המתנה לנעילה - חלקים מגיעים במקביל מכמה workers"""
+        conn = connect_db(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def init_database(self):
+        """יצירת טבלאות העלאות וחלקים"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS uploads (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                filename TEXT NOT NULL,
+                total_size INTEGER NOT NULL,
+                chunk_size INTEGER NOT NULL,
+                total_chunks INTEGER NOT NULL,
+                file_sha256 TEXT,
+                status TEXT DEFAULT 'uploading',
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_chunks (
+                upload_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                checksum TEXT NOT NULL,
+                received_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (upload_id, chunk_index)
+            )
+        ''')
+        
+        # העלאה שייכת למשתמש שפתח אותה - רק הוא ממשיך, בודק, מבטל ומסיים אותה
+        cursor.execute('PRAGMA table_info(uploads)')
+        if 'user_id' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE uploads ADD COLUMN user_id INTEGER')
+        
+        conn.commit()
+        conn.close()
+    
+    def _spool_path(self, upload_id):
+        """קובץ ה-spool של העלאה (כל החלקים נכתבים לתוכו במקום שלהם)"""
+        return os.path.join(self.spool_folder, f"{upload_id}.part")
+    
+    def init_upload(self, filename, total_size, chunk_size=None, file_sha256=None, user_id=None):
+        """פתיחת העלאה חדשה - מחזיר (הצלחה, פרטי העלאה או הודעת שגיאה)"""
+        chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        
+        if total_size <= 0:
+            return False, 'גודל קובץ לא תקין'
+        if self.max_upload_size and total_size > self.max_upload_size:
+            return False, f'הקובץ גדול מהמותר ({self.max_upload_size // (1024 * 1024)}MB)'
+        if chunk_size <= 0 or (self.max_chunk_size and chunk_size > self.max_chunk_size):
+            return False, 'גודל חלק לא תקין'
+        
+        upload_id = uuid.uuid4().hex
+        total_chunks = (total_size + chunk_size - 1) // chunk_size
+        
+        # יצירת קובץ spool בגודל הסופי - חלקים יכולים להגיע בכל סדר
+        with open(self._spool_path(upload_id), 'wb') as f:
+            f.truncate(total_size)
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO uploads (id, user_id, filename, total_size, chunk_size, total_chunks, file_sha256, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (upload_id, user_id, filename, total_size, chunk_size, total_chunks,
+              file_sha256.lower() if file_sha256 else None, datetime.datetime.now().isoformat()))
+        conn.commit()
+        conn.close()
+        
+        print(f"📦 העלאה בחלקים נפתחה: {upload_id[:8]} ({total_chunks} חלקים)")
+        return True, {
+            'upload_id': upload_id,
+            'chunk_size': chunk_size,
+            'total_chunks': total_chunks
+        }
+    
+    def _get_upload(self, cursor, upload_id):
+        cursor.execute('SELECT * FROM uploads WHERE id = ?', (upload_id,))
+        return cursor.fetchone()
+    
+    def write_chunk(self, upload_id, chunk_index, data, checksum):
+        """כתיבת חלק אחד אחרי אימות ה-checksum שלו - חלק שכבר התקבל נכתב שוב בלי נזק"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        upload = self._get_upload(cursor, upload_id)
+        conn.close()
+        
+        if not upload:
+            return False, 'העלאה לא נמצאה'
+        if upload['status'] != 'uploading':
+            return False, 'ההעלאה כבר הסתיימה'
+        if chunk_index < 0 or chunk_index >= upload['total_chunks']:
+            return False, 'מספר חלק לא תקין'
+        
+        offset = chunk_index * upload['chunk_size']
+        expected_size = min(upload['chunk_size'], upload['total_size'] - offset)
+        if len(data) != expected_size:
+            return False, f'גודל חלק שגוי - צפוי {expected_size} בתים, התקבלו {len(data)}'
+        
+        actual_checksum = hashlib.sha256(data).hexdigest()
+        if not checksum or actual_checksum != checksum.lower():
+            return False, 'checksum של החלק לא תואם - יש לשלוח את החלק שוב'
+        
+        # כתיבה במקום של החלק - כמה חלקים יכולים להיכתב במקביל
+        fd = os.open(self._spool_path(upload_id), os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO upload_chunks (upload_id, chunk_index, checksum, received_at)
+            VALUES (?, ?, ?, ?)
+        ''', (upload_id, chunk_index, actual_checksum, datetime.datetime.now().isoformat()))
+        cursor.execute('UPDATE uploads SET updated_at = ? WHERE id = ?',
+                       (datetime.datetime.now().isoformat(), upload_id))
+        conn.commit()
+        conn.close()
+        
+        return True, actual_checksum
+    
+    def get_status(self, upload_id):
+        """מצב העלאה - אילו חלקים התקבלו ואילו חסרים (להמשך אחרי ניתוק)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        upload = self._get_upload(cursor, upload_id)
+        if not upload:
+            conn.close()
+            return None
+        
+        cursor.execute('''
+            SELECT chunk_index FROM upload_chunks WHERE upload_id = ? ORDER BY chunk_index
+        ''', (upload_id,))
+        received = [row['chunk_index'] for row in cursor.fetchall()]
+        conn.close()
+        
+        received_set = set(received)
+        missing = [i for i in range(upload['total_chunks']) if i not in received_set]
+        
+        return {
+            'upload_id': upload_id,
+            'user_id': upload['user_id'],
+            'filename': upload['filename'],
+            'status': upload['status'],
+            'total_size': upload['total_size'],
+            'chunk_size': upload['chunk_size'],
+            'total_chunks': upload['total_chunks'],
+            'received_chunks': received,
+            'missing_chunks': missing
+        }
+    
+    def finalize(self, upload_id, destination_path):
+        """סיום העלאה - בדיקה שכל החלקים הגיעו והעברת הקובץ המורכב ליעד"""
+        status = self.get_status(upload_id)
+        if not status:
+            return False, 'העלאה לא נמצאה'
+        if status['status'] != 'uploading':
+            return False, 'ההעלאה כבר הסתיימה'
+        if status['missing_chunks']:
+            return False, f"חסרים {len(status['missing_chunks'])} חלקים"
+        
+        spool_path = self._spool_path(upload_id)
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        upload = self._get_upload(cursor, upload_id)
+        conn.close()
+        
+        # אימות הקובץ המלא אם הלקוח שלח checksum כולל
+        if upload['file_sha256']:
+            file_hash = hashlib.sha256()
+            with open(spool_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    file_hash.update(block)
+            if file_hash.hexdigest() != upload['file_sha256']:
+                return False, 'checksum של הקובץ המלא לא תואם'
+        
+        # סימון אטומי - רק בקשת finalize אחת מעבירה את הקובץ הלאה
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE uploads SET status = 'finalized', updated_at = ?
+            WHERE id = ? AND status = 'uploading'
+        ''', (datetime.datetime.now().isoformat(), upload_id))
+        claimed = cursor.rowcount == 1
+        if claimed:
+            cursor.execute('DELETE FROM upload_chunks WHERE upload_id = ?', (upload_id,))
+        conn.commit()
+        conn.close()
+        
+        if not claimed:
+            return False, 'ההעלאה כבר הסתיימה'
+        
+        shutil.move(spool_path, destination_path)
+        print(f"✅ העלאה בחלקים הושלמה: {upload_id[:8]} ({status['total_size']} בתים)")
+        return True, destination_path
+    
+    def abort(self, upload_id):
+        """ביטול העלאה ומחיקת ה-spool"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM upload_chunks WHERE upload_id = ?', (upload_id,))
+        cursor.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+        deleted = cursor.rowcount > 0
+        conn.commit()
+        conn.close()
+        
+        spool_path = self._spool_path(upload_id)
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+        return deleted
+    
+    def purge_stale_uploads(self):
+        """מחיקת העלאות שלא הושלמו בזמן"""
+        cutoff = (datetime.datetime.now() - datetime.timedelta(hours=UPLOAD_EXPIRY_HOURS)).isoformat()
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id FROM uploads WHERE updated_at < ?
+        ''', (cutoff,))
+        stale = [row['id'] for row in cursor.fetchall()]
+        conn.close()
+        
+        for upload_id in stale:
+            self.abort(upload_id)
+        
+        if stale:
+            print(f"🧹 נמחקו {len(stale)} העלאות שלא הושלמו")
+        return len(stale)
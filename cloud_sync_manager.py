@@ -5,10 +5,10 @@ import hashlib
 import secrets
 import datetime
 import requests
-import sqlite3
+from sqlite_pool import connect_db
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
-from auth_manager import AuthManager
+from auth_manager import get_auth_manager
 from encryption_manager import EncryptionManager
 
 load_dotenv()
@@ -21,12 +21,12 @@ class CloudSyncManager:
         self.sync_server_url = os.getenv('SYNC_SERVER_URL', 'https://your-sync-server.com/api')
         self.sync_api_key = os.getenv('SYNC_API_KEY', '')
         self.encryption_manager = EncryptionManager()
-        self.auth_manager = AuthManager()
+        self.auth_manager = get_auth_manager()
         self.init_database()
     
     def init_database(self):
         """יצירת מסד נתונים לסנכרון"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect_db(self.db_path)
         cursor = conn.cursor()
         
         # טבלת מכשירים מורשים למטפל
@@ -120,7 +120,7 @@ class CloudSyncManager:
             # יצירת מפתח ציבורי למכשיר (לעתיד - הצפנה אסימטרית)
             public_key = secrets.token_urlsafe(32)
             
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -147,7 +147,7 @@ class CloudSyncManager:
     def get_user_devices(self, user_id):
         """קבלת רשימת מכשירים מורשים למטפל"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -197,7 +197,7 @@ class CloudSyncManager:
             ).hexdigest()
             
             # שמירה במסד הנתונים המקומי
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -320,7 +320,7 @@ class CloudSyncManager:
     def get_sync_status(self, user_id):
         """קבלת סטטוס סנכרון"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # מספר סשנים מסונכרנים
@@ -365,7 +365,7 @@ class CloudSyncManager:
     def resolve_sync_conflict(self, user_id, conflict_id, resolution_action):
         """פתרון קונפליקט סנכרון"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # קבלת פרטי הקונפליקט
@@ -430,7 +430,7 @@ class CloudSyncManager:
     def _is_session_synced(self, user_id, session_id):
         """בדיקה אם סשן כבר מסונכרן"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -449,7 +449,7 @@ class CloudSyncManager:
     def _sync_single_session(self, user_id, session_data):
         """סנכרון סשן בודד"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # יצירת hash
@@ -514,7 +514,7 @@ class CloudSyncManager:
         try:
             current_device = self.get_device_id()
             
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -545,7 +545,7 @@ class CloudSyncManager:
     def _has_sync_conflict(self, user_id, session):
         """בדיקת קונפליקט סנכרון"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # בדיקה אם יש סשן עם אותו ID אבל נתונים שונים
@@ -570,7 +570,7 @@ class CloudSyncManager:
     def _handle_sync_conflict(self, user_id, session):
         """טיפול בקונפליקט סנכרון"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # קבלת הנתונים המקומיים
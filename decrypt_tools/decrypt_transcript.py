@@ -17,6 +17,7 @@ from cryptography.hazmat.primitives import hashes
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
+from session_format import read_session
 
 def derive_key_from_password(password, salt=None):
     """גזירת מפתח הצפנה מסיסמה"""
@@ -120,7 +121,7 @@ def main():
     """פונקציה ראשית"""
     if len(sys.argv) != 3:
         print("שימוש: python decrypt_transcript.py <נתיב_לקובץ> <סיסמה>")
-        print("דוגמה: python decrypt_transcript.py transcripts/user_1/חיים/secure_session_2025-08-20_17-24-53.json mypassword123")
+        print("דוגמה: python decrypt_transcript.py transcripts/user_1/חיים/secure_session_2025-08-20_17-24-53.sess mypassword123")
         sys.exit(1)
     
     file_path = sys.argv[1]
@@ -133,8 +134,7 @@ def main():
     
     try:
         # קריאת הקובץ
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = read_session(file_path)
         
         # בדיקה שזה קובץ מוצפן
         if not data.get('is_encrypted', False):
@@ -165,7 +165,7 @@ def main():
             print("=" * 50)
             
             # שמירת התמלול המפוענח לקובץ
-            output_file = file_path.replace('.json', '_decrypted.txt')
+            output_file = os.path.splitext(file_path)[0] + '_decrypted.txt'
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(f"תמלול מפוענח - {data.get('patient_name', 'לא ידוע')}\n")
                 f.write(f"תאריך: {data.get('session_date', 'לא ידוע')}\n")
@@ -17,6 +17,7 @@ try:
     parent_dir = os.path.dirname(current_dir)
     sys.path.insert(0, parent_dir)
     from secure_assemblyai import decrypt_transcript_with_password
+    from session_format import read_session
 except ImportError:
     print("❌ לא ניתן לייבא את secure_assemblyai.py")
     print("ודא שהקובץ secure_assemblyai.py קיים בתיקייה הראשית")
@@ -31,8 +32,8 @@ def main():
         print("  python simple_decrypt.py <נתיב_לקובץ> [סיסמה]")
         print()
         print("דוגמאות:")
-        print("  python simple_decrypt.py transcripts/user_1/חיים/secure_session_2025-08-20_17-24-53.json")
-        print("  python simple_decrypt.py transcripts/user_1/חיים/secure_session_2025-08-20_17-24-53.json mypassword123")
+        print("  python simple_decrypt.py transcripts/user_1/חיים/secure_session_2025-08-20_17-24-53.sess")
+        print("  python simple_decrypt.py transcripts/user_1/חיים/secure_session_2025-08-20_17-24-53.sess mypassword123")
         print()
         print("⚠️  שים לב לסדר: קובץ ואז סיסמה!")
         print("אם לא תספק סיסמה, תתבקש להזין אותה באופן אינטראקטיבי")
@@ -60,8 +61,7 @@ def main():
     
     try:
         # קריאת הקובץ
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = read_session(file_path)
         
         # בדיקה שזה קובץ מוצפן
         if not data.get('is_encrypted', False):
@@ -106,7 +106,7 @@ def main():
                 print("=" * 50)
                 
                 # שמירת התמלול המפוענח לקובץ
-                output_file = file_path.replace('.json', '_decrypted.txt')
+                output_file = os.path.splitext(file_path)[0] + '_decrypted.txt'
                 with open(output_file, 'w', encoding='utf-8') as f:
                     f.write(f"תמלול מפוענח - {data.get('patient_name', 'לא ידוע')}\n")
                     f.write(f"תאריך: {data.get('session_date', 'לא ידוע')}\n")
@@ -9,8 +9,9 @@ from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
-import sqlite3
+from sqlite_pool import connect_db
 from dotenv import load_dotenv
+from hebrew_search import derive_search_key, blind_index, blind_query, searchable_text
 
 load_dotenv()
 
@@ -23,7 +24,7 @@ class EncryptionManager:
     
     def init_database(self):
         """יצירת מסד נתונים למפתחות הצפנה"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect_db(self.db_path)
         cursor = conn.cursor()
         
         # טבלת מפתחות הצפנה אישיים של מטפלים
@@ -54,6 +55,21 @@ class EncryptionManager:
             )
         ''')
         
+        # אינדקס עיוור - טוקני HMAC של מילות התמלול (מפתח שנגזר ממפתח ההצפנה), לחיפוש בלי פענוח
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS encrypted_session_terms (
+                user_id INTEGER NOT NULL,
+                token TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                PRIMARY KEY (user_id, token, session_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_encrypted_session_terms_session
+            ON encrypted_session_terms (session_id)
+        ''')
+        
         # טבלת מטא-דאטה לסנכרון
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS sync_metadata (
@@ -94,7 +110,7 @@ class EncryptionManager:
             key_verification = fernet.encrypt(verification_data.encode('utf-8')).decode('utf-8')
             
             # שמירה במסד הנתונים
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -117,7 +133,7 @@ class EncryptionManager:
     def verify_user_password(self, user_id, master_password):
         """אימות סיסמת הצפנה של המטפל"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -126,9 +142,9 @@ class EncryptionManager:
             ''', (user_id,))
             
             result = cursor.fetchone()
-            conn.close()
             
             if not result:
+                conn.close()
                 return False, "לא נמצא מפתח הצפנה למטפל זה"
             
             salt_b64, key_verification = result
@@ -152,14 +168,11 @@ class EncryptionManager:
                 expected_data = "ENCRYPTION_KEY_VERIFICATION_" + str(user_id)
                 
                 if verification_data == expected_data:
-                    # עדכון זמן שימוש אחרון
-                    conn = sqlite3.connect(self.db_path)
-                    cursor = conn.cursor()
+                    # עדכון זמן שימוש אחרון - באותו חיבור
                     cursor.execute('''
                         UPDATE user_encryption_keys SET last_used = ? WHERE user_id = ?
                     ''', (datetime.datetime.now().isoformat(), user_id))
                     conn.commit()
-                    conn.close()
                     
                     return True, key.decode('utf-8')
                 else:
@@ -167,6 +180,8 @@ class EncryptionManager:
                     
             except Exception:
                 return False, "סיסמת הצפנה שגויה"
+            finally:
+                conn.close()
                 
         except Exception as e:
             print(f"❌ שגיאה באימות סיסמת הצפנה: {str(e)}")
@@ -192,6 +207,10 @@ class EncryptionManager:
                 .encode('utf-8')
             ).hexdigest()
             
+            # אינדקס עיוור - רק טוקני HMAC של המילים יוצאים מההצפנה
+            text = searchable_text(session_data)
+            search_tokens = blind_index(text, derive_search_key(encryption_key)) if text else []
+            
             # מטא-דאטה לא מוצפנת (לחיפוש ומיון)
             metadata = {
                 'word_count': session_data.get('word_count', 0),
@@ -205,7 +224,8 @@ class EncryptionManager:
                 'session_id': session_id,
                 'patient_name_hash': patient_hash,
                 'encrypted_data': base64.b64encode(encrypted_data).decode('utf-8'),
-                'metadata': json.dumps(metadata, ensure_ascii=False)
+                'metadata': json.dumps(metadata, ensure_ascii=False),
+                'blind_index': search_tokens
             }
             
         except Exception as e:
@@ -238,7 +258,7 @@ class EncryptionManager:
     def save_encrypted_session(self, user_id, encrypted_session_data, session_date):
         """שמירת סשן מוצפן במסד הנתונים"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -256,6 +276,9 @@ class EncryptionManager:
                 datetime.datetime.now().isoformat()
             ))
             
+            self._save_search_tokens(cursor, user_id, encrypted_session_data['session_id'],
+                                     encrypted_session_data.get('blind_index'))
+            
             conn.commit()
             conn.close()
             
@@ -269,7 +292,7 @@ class EncryptionManager:
     def get_user_encrypted_sessions(self, user_id, patient_name_filter=None):
         """קבלת כל הסשנים המוצפנים של מטפל"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             if patient_name_filter:
@@ -315,7 +338,7 @@ class EncryptionManager:
     def delete_encrypted_session(self, user_id, session_id):
         """מחיקת סשן מוצפן"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -324,6 +347,10 @@ class EncryptionManager:
             ''', (user_id, session_id))
             
             deleted_count = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM encrypted_session_terms 
+                WHERE user_id = ? AND session_id = ?
+            ''', (user_id, session_id))
             conn.commit()
             conn.close()
             
@@ -337,6 +364,63 @@ class EncryptionManager:
             print(f"❌ שגיאה במחיקת סשן מוצפן: {str(e)}")
             return False, str(e)
     
+    def _save_search_tokens(self, cursor, user_id, session_id, search_tokens):
+        """החלפת טוקני האינדקס העיוור של סשן"""
+        if search_tokens is None:
+            return
+        cursor.execute('DELETE FROM encrypted_session_terms WHERE user_id = ? AND session_id = ?',
+                       (user_id, session_id))
+        cursor.executemany('''
+            INSERT OR IGNORE INTO encrypted_session_terms (user_id, token, session_id) VALUES (?, ?, ?)
+        ''', [(user_id, token, session_id) for token in search_tokens])
+    
+    def search_encrypted_sessions(self, user_id, query, encryption_key, patient_name_filter=None):
+        """חיפוש בסשנים מוצפנים דרך האינדקס העיוור - בלי לפענח אף סשן"""
+        try:
+            token_groups = blind_query(query, derive_search_key(encryption_key))
+            if not token_groups:
+                return True, []
+            
+            conditions = ['user_id = ?']
+            params = [user_id]
+            # כל מילה בשאילתה (באחת מהצורות שלה) חייבת להופיע
+            for tokens in token_groups:
+                placeholders = ', '.join('?' * len(tokens))
+                conditions.append(f'session_id IN (SELECT session_id FROM encrypted_session_terms '
+                                  f'WHERE user_id = ? AND token IN ({placeholders}))')
+                params.extend([user_id] + tokens)
+            if patient_name_filter:
+                conditions.append('patient_name_hash = ?')
+                params.append(hashlib.sha256(f"{user_id}_{patient_name_filter}".encode('utf-8')).hexdigest())
+            
+            conn = connect_db(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT session_id, session_date, metadata, created_at
+                FROM encrypted_sessions 
+                WHERE {' AND '.join(conditions)}
+                ORDER BY session_date DESC, created_at DESC
+            ''', params)
+            
+            sessions = []
+            for row in cursor.fetchall():
+                sessions.append({
+                    'session_id': row[0],
+                    'session_date': row[1],
+                    'metadata': row[2],
+                    'created_at': row[3]
+                })
+            
+            conn.close()
+            
+            print(f"🔍 חיפוש עיוור: {len(sessions)} סשנים מוצפנים תואמים למטפל {user_id}")
+            return True, sessions
+            
+        except Exception as e:
+            print(f"❌ שגיאה בחיפוש בסשנים מוצפנים: {str(e)}")
+            return False, str(e)
+    
     def sync_sessions_to_cloud(self, user_id, encryption_key):
         """סנכרון סשנים מוצפנים לענן (מדמה - בעתיד יהיה API אמיתי)"""
         try:
@@ -348,7 +432,7 @@ class EncryptionManager:
                 return False, "שגיאה בקבלת סשנים לסנכרון"
             
             # עדכון סטטוס סנכרון
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -435,9 +519,10 @@ class EncryptionManager:
             
             sessions = backup.get('sessions', [])
             imported_count = 0
+            search_key = derive_search_key(encryption_key)
             
             # יבוא כל הסשנים
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             for session in sessions:
@@ -457,6 +542,13 @@ class EncryptionManager:
                         session['created_at'],
                         session['updated_at']
                     ))
+                    
+                    # האינדקס העיוור לא נכלל בגיבוי - נבנה מחדש מהסשן המפוענח
+                    decrypted, session_data = self.decrypt_session_data(session, encryption_key)
+                    if decrypted:
+                        text = searchable_text(session_data)
+                        self._save_search_tokens(cursor, user_id, session['session_id'],
+                                                 blind_index(text, search_key) if text else [])
                     imported_count += 1
                 except Exception as e:
                     print(f"⚠️ שגיאה ביבוא סשן {session.get('session_id', 'unknown')}: {str(e)}")
@@ -474,7 +566,7 @@ class EncryptionManager:
     def get_encryption_stats(self, user_id):
         """סטטיסטיקות הצפנה למטפל"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # מספר סשנים מוצפנים
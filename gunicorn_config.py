@@ -1,10 +1,20 @@
 # Gunicorn configuration for Render deployment
 bind = "0.0.0.0:10000"
 workers = 1
-worker_class = "sync"
+# gthread - כל בקשה (כולל מאזין SSE ל-/jobs/<id>/events) תופסת thread ולא worker שלם
+worker_class = "gthread"
+# עד SSE_MAX_STREAMS (ברירת מחדל 16) מה-threads משמשים לשידורי SSE פתוחים, כל אחד לכל היותר
+# SSE_STREAM_SECONDS (ברירת מחדל 60). מעבר לתקרה /jobs/<id>/events מחזיר 503 עם Retry-After,
+# כך ששאר ה-threads תמיד פנויים למצב עבודות, העלאות ושאר הבקשות. בהגדלת התקרה להגדיל גם את threads.
+threads = 32
 worker_connections = 1000
 timeout = 30
 keepalive = 2
 max_requests = 1000
 max_requests_jitter = 100
 preload_app = True
+
+def post_fork(server, worker):
+    # threads לא שורדים fork - כל worker מפעיל את מעבדי תור התמלול שלו
+    from app import start_job_workers
+    start_job_workers()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# hebrew_search.py - נרמול טקסט עברי לחיפוש: הסרת ניקוד, אותיות שימוש (ו, ה, ב, ל, מ, ש, כ) וקטעי תצוגה
+import re
+import hmac
+import html
+import hashlib
+
+# ניקוד וטעמים (בלי מקף, פסק וסוף פסוק - הם מפרידים בין מילים)
+NIQQUD_CHARS = '\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7'
+NIQQUD = re.compile(f'[{NIQQUD_CHARS}]')
+# גרש וגרשיים בתוך מילה (צה"ל, ג'ירפה) - המילה נשארת שלמה
+QUOTE_CHARS = '"\'\u05F3\u05F4'
+INNER_QUOTES = re.compile(f'(?<=\\w)[{QUOTE_CHARS}](?=\\w)')
+WORD = re.compile(r'\w+')
+
+# אותיות שימוש שיכולות להידבק לתחילת מילה, ועד כמה מהן ברצף (וכשה..., ומה...)
+PREFIX_LETTERS = set('והבלמשכ')
+MAX_PREFIX_LETTERS = 3
+# אורך מינימלי של מה שנשאר אחרי הסרת אותיות שימוש (יד, אב)
+MIN_STEM_LENGTH = 2
+# אורך קטע התצוגה סביב ההתאמות (בתווים, מורחב לגבולות מילים)
+SNIPPET_CHARS = 200
+# אינדקס עיוור לסשנים מוצפנים - אורך כל טוקן (בבתים) והקשר הגזירה של מפתח החיפוש
+BLIND_TOKEN_BYTES = 16
+BLIND_KEY_CONTEXT = b'blind-search-index-v1'
+
+
+def normalize(text):
+    """הסרת ניקוד וגרשיים פנימיים, אותיות קטנות"""
+    return INNER_QUOTES.sub('', NIQQUD.sub('', text or '')).lower()
+
+
+def word_variants(word):
+    """המילה וכל הצורות שלה בלי אותיות שימוש בתחילתה (והבית -> בית, הבית)"""
+    variants = [word]
+    for length in range(1, MAX_PREFIX_LETTERS + 1):
+        if len(word) - length < MIN_STEM_LENGTH or word[length - 1] not in PREFIX_LETTERS:
+            break
+        variants.append(word[length:])
+    return variants
+
+
+def index_terms(text):
+    """(מילים מנורמלות, כל הצורות של כל מילה) - שתי העמודות שנכנסות לאינדקס"""
+    words = WORD.findall(normalize(text))
+    terms = [variant for word in words for variant in word_variants(word)]
+    return ' '.join(words), ' '.join(terms)
+
+
+def query_terms(query):
+    """המונחים לחיפוש - כל מילה כפי שנכתבה, ובנוסף בלי אות שימוש אחת אם נשאר שורש סביר"""
+    terms = []
+    for word in WORD.findall(normalize(query)):
+        options = [word]
+        if word[0] in PREFIX_LETTERS and len(word) - 1 > MIN_STEM_LENGTH:
+            options.append(word[1:])
+        terms.append(options)
+    return terms
+
+
+def fts_query(terms):
+    """שאילתת FTS5 - כל מילה חייבת להופיע (באחת מהצורות שלה). None אם אין מילים"""
+    if not terms:
+        return None
+    groups = []
+    for options in terms:
+        quoted = ' OR '.join('"' + option.replace('"', '""') + '"' for option in options)
+        groups.append(f'({quoted})')
+    return ' AND '.join(groups)
+
+
+def _hit_pattern(wanted):
+    """ביטוי שמוצא בטקסט המקורי את הצורות המבוקשות (גם עם ניקוד וגרשיים) בסוף מילה"""
+    mark = f'[{NIQQUD_CHARS}]*'
+    quote = '(?:["\'\u05F3\u05F4](?=\\w))?'
+    alternatives = [''.join(re.escape(ch) + mark + quote for ch in term)
+                    for term in sorted(wanted, key=len, reverse=True)]
+    # הביטוי מתחיל באות של המונח ולא בבדיקת גבול - כך הסריקה מהירה גם בתמלול ארוך
+    return re.compile(f"(?:{'|'.join(alternatives)})(?![\\w{NIQQUD_CHARS}])", re.IGNORECASE)
+
+
+def _word_start(text, start):
+    """תחילת המילה שההתאמה בסופה - None אם לפני ההתאמה יש במילה יותר מאותיות שימוש"""
+    prefix_letters = 0
+    position = start
+    while position > 0:
+        ch = text[position - 1]
+        if ch in PREFIX_LETTERS:
+            prefix_letters += 1
+            if prefix_letters > MAX_PREFIX_LETTERS:
+                return None
+        elif NIQQUD.match(ch) or (ch in QUOTE_CHARS and position > 1 and text[position - 2].isalnum()):
+            pass
+        elif ch.isalnum() or ch == '_':
+            return None
+        else:
+            break
+        position -= 1
+    return position
+
+
+def snippet(text, terms, size=SNIPPET_CHARS):
+    """קטע מהטקסט המקורי עם הכי הרבה התאמות, ההתאמות בתוך <mark> (שאר הטקסט מוגן ל-HTML)"""
+    text = text or ''
+    wanted = {option for options in terms for option in options}
+    hits = []
+    if wanted:
+        for match in _hit_pattern(wanted).finditer(text):
+            word_start = _word_start(text, match.start())
+            if word_start is not None:
+                hits.append((word_start, match.end()))
+    
+    # החלון שמכיל הכי הרבה התאמות (מתחיל קצת לפני ההתאמה הראשונה בו)
+    start = 0
+    best = 0
+    last = 0
+    for i, (first, _) in enumerate(hits):
+        while last < len(hits) and hits[last][0] < first + size:
+            last += 1
+        if last - i > best:
+            best, start = last - i, max(0, first - size // 4)
+    
+    # הרחבה לגבולות מילים
+    if start > 0:
+        start = text.rfind(' ', 0, start) + 1
+    end = min(len(text), start + size)
+    if end < len(text):
+        space = text.find(' ', end)
+        end = len(text) if space == -1 else space
+    
+    parts = []
+    position = start
+    for hit_start, hit_end in hits:
+        if hit_start < start or hit_end > end:
+            continue
+        parts.append(html.escape(text[position:hit_start]))
+        parts.append(f'<mark>{html.escape(text[hit_start:hit_end])}</mark>')
+        position = hit_end
+    parts.append(html.escape(text[position:end]))
+    
+    result = ''.join(parts).strip()
+    if start > 0:
+        result = '… ' + result
+    if end < len(text):
+        result += ' …'
+    return result
+
+
+def searchable_text(session_data):
+    """הטקסט הגלוי של סשן לאינדקס החיפוש - None לסשן מוצפן או בלי תמלול"""
+    if session_data.get('is_encrypted'):
+        return None
+    return (session_data.get('corrected_transcript') or session_data.get('transcript_text')
+            or session_data.get('original_transcript') or None)
+
+
+def derive_search_key(encryption_key):
+    """מפתח החיפוש העיוור - נגזר ממפתח ההצפנה (HMAC), ולא מגלה אותו"""
+    if isinstance(encryption_key, str):
+        encryption_key = encryption_key.encode('utf-8')
+    return hmac.new(encryption_key, BLIND_KEY_CONTEXT, hashlib.sha256).digest()
+
+
+def blind_token(search_key, term):
+    return hmac.new(search_key, term.encode('utf-8'), hashlib.sha256).hexdigest()[:BLIND_TOKEN_BYTES * 2]
+
+
+def blind_index(text, search_key):
+    """ה-HMAC של כל צורות המילים בטקסט - כל טוקן פעם אחת וממוין, בלי סדר המילים ובלי מספר ההופעות"""
+    _, terms = index_terms(text)
+    return sorted({blind_token(search_key, term) for term in terms.split()})
+
+
+def blind_query(query, search_key):
+    """טוקנים לחיפוש עיוור - לכל מילה בשאילתה רשימת הטוקנים של הצורות שלה"""
+    return [[blind_token(search_key, option) for option in options] for options in query_terms(query)]
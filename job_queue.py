@@ -0,0 +1,594 @@
+# job_queue.py - תור עבודות תמלול ברקע (משותף לכל תהליכי gunicorn)
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import atexit
+import datetime
+import threading
+from sqlite_pool import connect_db
+
+try:
+    from cryptography.fernet import Fernet
+    CRYPTO_AVAILABLE = True
+except ImportError:
+    CRYPTO_AVAILABLE = False
+
+# סטטוסים אפשריים לעבודה
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+# עבודה שה-worker שלה לא דיווח חיים זמן כזה תילקח מחדש ע"י worker אחר
+LEASE_SECONDS = 90
+HEARTBEAT_SECONDS = 15
+MAX_ATTEMPTS = 5
+
+# שלבי עבודת תמלול שמדווחים ללקוח (SSE) - והאחוז שמוצג כשהשלב מתחיל
+STAGE_UPLOADED = 'uploaded'
+STAGE_PREPROCESSING = 'preprocessing'
+STAGE_SUBMITTED = 'submitted'
+STAGE_PROVIDER_PROCESSING = 'provider-processing'
+STAGE_ENCRYPTING = 'encrypting'
+STAGE_SAVED = 'saved'
+STAGE_PERCENT = {
+    STAGE_UPLOADED: 0,
+    STAGE_PREPROCESSING: 5,
+    STAGE_SUBMITTED: 15,
+    STAGE_PROVIDER_PROCESSING: 20,
+    STAGE_ENCRYPTING: 90,
+    STAGE_SAVED: 95,
+    JOB_COMPLETED: 100,
+    JOB_FAILED: 100
+}
+# כל כמה זמן מאזין בודק אירועים שנכתבו ע"י תהליך אחר (בתוך התהליך מתעוררים מיד)
+EVENT_POLL_SECONDS = 1.0
+
+
+class JobQueue:
+    """תור עבודות מבוסס SQLite - כל ה-workers רואים את אותו התור"""
+    
+    def __init__(self, db_path='jobs.db', secret_key_path='jobs_secret.key'):
+        self.db_path = db_path
+        self.secret_key_path = secret_key_path
+        self._fernet = None
+        self._events_changed = threading.Condition()
+        self.init_database()
+    
+    def _connect(self):
+        """חיבור עם המתנה לנעילה - כמה תהליכים כותבים לאותו קובץ"""
+        conn = connect_db(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def init_database(self):
+        """יצירת טבלת עבודות"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        # WAL מאפשר לקרוא סטטוס בזמן שעבודה אחרת נכתבת
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER DEFAULT 0,
+                worker_id TEXT,
+                provider_ref TEXT,
+                heartbeat_at TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                started_at TEXT,
+                finished_at TEXT
+            )
+        ''')
+        
+        # עדכון טבלאות ישנות - עמודות שנוספו לחידוש עבודות אחרי קריסה
+        cursor.execute('PRAGMA table_info(jobs)')
+        columns = [row['name'] for row in cursor.fetchall()]
+        for column in ('provider_ref', 'heartbeat_at'):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE jobs ADD COLUMN {column} TEXT')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_created
+            ON jobs (status, created_at)
+        ''')
+        
+        # יומן שלבים לכל עבודה - המזהה הרץ משמש גם כ-Last-Event-ID בהתחברות מחדש
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                percent REAL,
+                eta_seconds REAL,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_job_events_job
+            ON job_events (job_id, id)
+        ''')
+        
+        conn.commit()
+        conn.close()
+    
+    def enqueue(self, job_type, payload):
+        """הוספת עבודה לתור - מחזיר מזהה עבודה"""
+        job_id = uuid.uuid4().hex
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO jobs (id, job_type, status, payload, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (job_id, job_type, JOB_QUEUED, json.dumps(payload, ensure_ascii=False),
+              datetime.datetime.now().isoformat()))
+        self._insert_event(cursor, job_id, STAGE_UPLOADED)
+        conn.commit()
+        conn.close()
+        self._notify_events()
+        
+        print(f"📥 עבודה {job_id[:8]} ({job_type}) נוספה לתור")
+        return job_id
+    
+    def claim_next(self, worker_id):
+        """לקיחת העבודה הבאה בתור באופן אטומי (רק worker אחד יקבל אותה)"""
+        now = datetime.datetime.now()
+        lease_expired = (now - datetime.timedelta(seconds=LEASE_SECONDS)).isoformat()
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            # BEGIN IMMEDIATE נועל לכתיבה כך ששני workers לא ייקחו את אותה עבודה
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            # עבודות שמיצו את הניסיונות לא נלקחות שוב - fail_exhausted מסמן אותן כנכשלות
+            cursor.execute('''
+                SELECT id FROM jobs
+                WHERE status = ? OR (status = ? AND heartbeat_at < ? AND attempts < ?)
+                ORDER BY created_at LIMIT 1
+            ''', (JOB_QUEUED, JOB_RUNNING, lease_expired, MAX_ATTEMPTS))
+            row = cursor.fetchone()
+            if not row:
+                conn.commit()
+                return None
+            
+            cursor.execute('''
+                UPDATE jobs SET status = ?, worker_id = ?, started_at = ?, heartbeat_at = ?,
+                                attempts = attempts + 1
+                WHERE id = ?
+            ''', (JOB_RUNNING, worker_id, now.isoformat(), now.isoformat(), row['id']))
+            conn.commit()
+        finally:
+            conn.close()
+        
+        return self.get_job(row['id'], include_payload=True)
+    
+    def fail_exhausted(self):
+        """סימון כנכשלות של עבודות שה-worker שלהן מת בלי לשחרר אותן (למשל SIGKILL) יותר מדי פעמים"""
+        # מחזיר את העבודות (עם payload) כדי שה-worker ינקה סודות וקבצים כמו בכל עבודה שנכשלה
+        lease_expired = (datetime.datetime.now() - datetime.timedelta(seconds=LEASE_SECONDS)).isoformat()
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT id FROM jobs WHERE status = ? AND heartbeat_at < ? AND attempts >= ?
+            ''', (JOB_RUNNING, lease_expired, MAX_ATTEMPTS))
+            job_ids = [row['id'] for row in cursor.fetchall()]
+            for job_id in job_ids:
+                self._mark_failed(cursor, job_id, 'העבודה נכשלה שוב ושוב - הופסקו הניסיונות')
+            conn.commit()
+        finally:
+            conn.close()
+        
+        if job_ids:
+            self._notify_events()
+            print(f"🛑 {len(job_ids)} עבודות נכשלו אחרי {MAX_ATTEMPTS} ניסיונות")
+        return [self.get_job(job_id, include_payload=True) for job_id in job_ids]
+    
+    def heartbeat(self, job_ids):
+        """חידוש ה-lease של עבודות שה-worker עדיין מעבד"""
+        if not job_ids:
+            return
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?
+        ''', [(datetime.datetime.now().isoformat(), job_id, JOB_RUNNING) for job_id in job_ids])
+        conn.commit()
+        conn.close()
+    
+    def release(self, job_id, worker_id):
+        """החזרת עבודה לתור (כשה-worker יוצא באמצע) - מזהה הספק נשמר לחידוש"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET status = ?, worker_id = NULL, heartbeat_at = NULL
+            WHERE id = ? AND status = ? AND worker_id = ?
+        ''', (JOB_QUEUED, job_id, JOB_RUNNING, worker_id))
+        conn.commit()
+        conn.close()
+    
+    def recover_orphaned_jobs(self):
+        """החזרה לתור של עבודות שנלקחו ע"י תהליך שכבר לא קיים במכונה הזו"""
+        host_prefix = f"{socket.gethostname()}:"
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, worker_id FROM jobs WHERE status = ? AND worker_id LIKE ?
+        ''', (JOB_RUNNING, host_prefix + '%'))
+        
+        orphaned = []
+        for row in cursor.fetchall():
+            pid = int(row['worker_id'].split(':')[1])
+            if not _pid_alive(pid):
+                orphaned.append(row['id'])
+        
+        if orphaned:
+            cursor.executemany('''
+                UPDATE jobs SET status = ?, worker_id = NULL, heartbeat_at = NULL
+                WHERE id = ? AND status = ?
+            ''', [(JOB_QUEUED, job_id, JOB_RUNNING) for job_id in orphaned])
+            conn.commit()
+            print(f"♻️ {len(orphaned)} עבודות שנקטעו הוחזרו לתור")
+        
+        conn.close()
+        return orphaned
+    
+    def set_provider_ref(self, job_id, provider_ref):
+        """שמירת מזהה התמלול אצל הספק מיד אחרי השליחה - כדי לא לשלוח שוב אחרי קריסה"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('UPDATE jobs SET provider_ref = ? WHERE id = ?', (provider_ref, job_id))
+        conn.commit()
+        conn.close()
+    
+    def get_provider_ref(self, job_id):
+        """מזהה התמלול אצל הספק (אם העבודה כבר נשלחה בעבר)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT provider_ref FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return row['provider_ref'] if row else None
+    
+    def complete(self, job_id, result):
+        """סימון עבודה כהושלמה ושמירת התוצאה"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET status = ?, result = ?, error = NULL, finished_at = ?
+            WHERE id = ?
+        ''', (JOB_COMPLETED, json.dumps(result, ensure_ascii=False),
+              datetime.datetime.now().isoformat(), job_id))
+        self._insert_event(cursor, job_id, JOB_COMPLETED)
+        conn.commit()
+        conn.close()
+        self._notify_events()
+    
+    def fail(self, job_id, error, result=None):
+        """סימון עבודה כנכשלה"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        self._mark_failed(cursor, job_id, error, result)
+        conn.commit()
+        conn.close()
+        self._notify_events()
+    
+    def _mark_failed(self, cursor, job_id, error, result=None):
+        # אירוע JOB_FAILED סוגר את זרם ה-SSE של הלקוח
+        cursor.execute('''
+            UPDATE jobs SET status = ?, error = ?, result = ?, finished_at = ?
+            WHERE id = ?
+        ''', (JOB_FAILED, str(error), json.dumps(result, ensure_ascii=False) if result else None,
+              datetime.datetime.now().isoformat(), job_id))
+        self._insert_event(cursor, job_id, JOB_FAILED)
+    
+    # --- אירועי התקדמות (לשידור ללקוח ב-SSE) ---
+    
+    def _insert_event(self, cursor, job_id, stage, percent=None, eta_seconds=None):
+        if percent is None:
+            percent = STAGE_PERCENT.get(stage)
+        cursor.execute('''
+            INSERT INTO job_events (job_id, stage, percent, eta_seconds, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (job_id, stage, percent, eta_seconds, datetime.datetime.now().isoformat()))
+    
+    def _notify_events(self):
+        with self._events_changed:
+            self._events_changed.notify_all()
+    
+    def add_event(self, job_id, stage, percent=None, eta_seconds=None):
+        """דיווח על שלב בעבודה - אחוז ברירת מחדל לפי השלב, זמן משוער לסיום אם ידוע"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        self._insert_event(cursor, job_id, stage, percent, eta_seconds)
+        conn.commit()
+        conn.close()
+        self._notify_events()
+    
+    def get_events(self, job_id, after_id=0):
+        """אירועי העבודה שאחרי המזהה הנתון, לפי הסדר"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, stage, percent, eta_seconds, created_at FROM job_events
+            WHERE job_id = ? AND id > ? ORDER BY id
+        ''', (job_id, after_id))
+        events = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return events
+    
+    def wait_for_events(self, job_id, after_id=0, timeout=15.0):
+        """המתנה לאירועים חדשים - מחזיר רשימה (ריקה אם עבר הזמן בלי שינוי)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.get_events(job_id, after_id)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            # אירוע מאותו תהליך מעיר מיד; אירוע מתהליך אחר נתפס בבדיקה הבאה
+            with self._events_changed:
+                self._events_changed.wait(min(remaining, EVENT_POLL_SECONDS))
+    
+    def clear_secrets(self, job_id):
+        """מחיקת שדות סודיים מה-payload לאחר סיום העבודה"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT payload FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        if row:
+            payload = json.loads(row['payload'])
+            cleaned = {k: v for k, v in payload.items() if not k.startswith('sealed_')}
+            if cleaned != payload:
+                cursor.execute('UPDATE jobs SET payload = ? WHERE id = ?',
+                               (json.dumps(cleaned, ensure_ascii=False), job_id))
+                conn.commit()
+        conn.close()
+    
+    def get_job(self, job_id, include_payload=False):
+        """קבלת מצב עבודה"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        if not row:
+            return None
+        
+        job = {
+            'job_id': row['id'],
+            'job_type': row['job_type'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'provider_ref': row['provider_ref']
+        }
+        if include_payload:
+            job['payload'] = json.loads(row['payload'])
+        return job
+    
+    def queue_position(self, job_id):
+        """כמה עבודות ממתינות לפני העבודה הזו"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) FROM jobs
+            WHERE status = ? AND created_at < (SELECT created_at FROM jobs WHERE id = ?)
+        ''', (JOB_QUEUED, job_id))
+        position = cursor.fetchone()[0]
+        conn.close()
+        return position
+    
+    # --- סודות זמניים (סיסמת הצפנה) לעבודות מאובטחות ---
+    
+    def _get_fernet(self):
+        """מפתח שרת משותף לכל ה-workers להצפנת סודות בתוך התור"""
+        if self._fernet:
+            return self._fernet
+        if not CRYPTO_AVAILABLE:
+            raise ImportError("ספריית ההצפנה לא זמינה - הרץ: pip install cryptography")
+        
+        key = os.getenv('JOB_SECRET_KEY')
+        if not key:
+            # כתיבה לקובץ זמני ו-link אטומי - רק התהליך הראשון יוצר מפתח, השאר קוראים אותו
+            temp_path = f"{self.secret_key_path}.{os.getpid()}.tmp"
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(Fernet.generate_key())
+            try:
+                os.link(temp_path, self.secret_key_path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temp_path)
+            with open(self.secret_key_path, 'rb') as f:
+                key = f.read().strip()
+        
+        self._fernet = Fernet(key)
+        return self._fernet
+    
+    def seal_secret(self, value):
+        """הצפנת סוד לפני שמירה ב-payload"""
+        return self._get_fernet().encrypt(value.encode('utf-8')).decode('utf-8')
+    
+    def unseal_secret(self, sealed_value):
+        """פענוח סוד מתוך ה-payload"""
+        return self._get_fernet().decrypt(sealed_value.encode('utf-8')).decode('utf-8')
+
+
+class JobWorkerPool:
+    """מאגר threads שמעבד עבודות מהתור - נפרד מה-threads שמטפלים בבקשות"""
+    
+    def __init__(self, job_queue, handlers, num_workers=2, poll_interval=1.0, cleanup=None):
+        self.job_queue = job_queue
+        self.handlers = handlers
+        self.cleanup = cleanup
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._pid = None
+        self._active = {}
+        self._active_lock = threading.Lock()
+        self._exit_hook_registered = False
+    
+    def start(self):
+        """הפעלת ה-workers (פעם אחת לכל תהליך)"""
+        # אחרי fork של gunicorn ה-threads של תהליך האב לא קיימים - מפעילים מחדש
+        if self._pid == os.getpid() and any(t.is_alive() for t in self._threads):
+            return
+        
+        self._pid = os.getpid()
+        self._stop_event.clear()
+        self._threads = []
+        with self._active_lock:
+            self._active = {}
+        
+        # עבודות של workers שמתו (max_requests, deploy, קריסה) חוזרות לתור ומתחדשות לפי מזהה הספק
+        try:
+            self.job_queue.recover_orphaned_jobs()
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ שגיאה בשחזור עבודות שנקטעו: {e}")
+        
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, args=(i,), daemon=True,
+                                      name=f"job-worker-{i}")
+            thread.start()
+            self._threads.append(thread)
+        
+        heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True,
+                                            name="job-heartbeat")
+        heartbeat_thread.start()
+        self._threads.append(heartbeat_thread)
+        
+        if not self._exit_hook_registered:
+            atexit.register(self._release_active_jobs)
+            self._exit_hook_registered = True
+        
+        print(f"⚙️ {self.num_workers} workers לעיבוד עבודות הופעלו (pid {self._pid})")
+    
+    def stop(self, timeout=5):
+        """עצירת ה-workers"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._release_active_jobs()
+    
+    def _heartbeat_loop(self):
+        """דיווח חיים על העבודות הפעילות כדי שלא ייחשבו נטושות"""
+        while not self._stop_event.wait(HEARTBEAT_SECONDS):
+            with self._active_lock:
+                job_ids = list(self._active)
+            try:
+                self.job_queue.heartbeat(job_ids)
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ שגיאה בעדכון heartbeat: {e}")
+    
+    def _release_active_jobs(self):
+        """ביציאה מהתהליך - החזרת עבודות פתוחות לתור במקום לחכות שה-lease יפוג"""
+        if self._pid != os.getpid():
+            return
+        with self._active_lock:
+            active = dict(self._active)
+        for job_id, worker_id in active.items():
+            try:
+                self.job_queue.release(job_id, worker_id)
+                print(f"↩️ עבודה {job_id[:8]} הוחזרה לתור לפני יציאה")
+            except sqlite3.Error as e:
+                print(f"⚠️ שגיאה בהחזרת עבודה {job_id[:8]} לתור: {e}")
+    
+    def _run(self, index):
+        """לולאת worker - לוקח עבודה, מריץ handler, שומר תוצאה"""
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        
+        while not self._stop_event.is_set():
+            try:
+                for exhausted in self.job_queue.fail_exhausted():
+                    self.job_queue.clear_secrets(exhausted['job_id'])
+                    self._cleanup(exhausted)
+                job = self.job_queue.claim_next(worker_id)
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ שגיאה בגישה לתור העבודות: {e}")
+                job = None
+            
+            if not job:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            
+            with self._active_lock:
+                self._active[job['job_id']] = worker_id
+            try:
+                self._process(job)
+            finally:
+                with self._active_lock:
+                    self._active.pop(job['job_id'], None)
+    
+    def _process(self, job):
+        """הרצת handler לעבודה אחת"""
+        job_id = job['job_id']
+        handler = self.handlers.get(job['job_type'])
+        
+        if not handler:
+            self.job_queue.fail(job_id, f"סוג עבודה לא מוכר: {job['job_type']}")
+            return
+        
+        started = time.time()
+        if job['provider_ref']:
+            print(f"🔁 ממשיך עבודה {job_id[:8]} ({job['job_type']}) - ניסיון {job['attempts']}")
+        else:
+            print(f"▶️ מתחיל עבודה {job_id[:8]} ({job['job_type']})")
+        
+        try:
+            success, result = handler(job_id, job['payload'])
+            if success:
+                self.job_queue.complete(job_id, result)
+                print(f"✅ עבודה {job_id[:8]} הושלמה ({time.time() - started:.1f} שניות)")
+            else:
+                self.job_queue.fail(job_id, result.get('error', 'שגיאה לא ידועה'), result)
+                print(f"❌ עבודה {job_id[:8]} נכשלה: {result.get('error')}")
+        except Exception as e:
+            self.job_queue.fail(job_id, str(e))
+            print(f"❌ עבודה {job_id[:8]} נכשלה: {e}")
+        finally:
+            self.job_queue.clear_secrets(job_id)
+        
+        self._cleanup(job)
+    
+    def _cleanup(self, job):
+        """ניקוי קבצים רק אחרי שהתוצאה נשמרה בתור"""
+        job_id = job['job_id']
+        if self.cleanup:
+            try:
+                self.cleanup(job)
+            except Exception as e:
+                print(f"⚠️ שגיאה בניקוי עבודה {job_id[:8]}: {e}")
+
+
+def _pid_alive(pid):
+    """בדיקה אם תהליך עדיין רץ במכונה הזו"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,148 @@
+# password_hashing.py - גיבוב סיסמאות עם עלות שמכוילת בהפעלה לזמן יעד, ושדרוג גיבובים ישנים בכניסה
+import os
+import hmac
+import math
+import time
+import base64
+import hashlib
+import secrets
+import threading
+
+try:
+    import bcrypt
+    BCRYPT_AVAILABLE = True
+except ImportError:
+    BCRYPT_AVAILABLE = False
+
+# כמה זמן בדיקת סיסמה אחת אמורה לקחת בשרת הנוכחי (מילישניות)
+PASSWORD_HASH_TARGET_MS = 200
+# גבולות העלות - גם בשרת איטי לא יורדים מהמינימום
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 16
+MIN_PBKDF2_ITERATIONS = 100000
+MAX_PBKDF2_ITERATIONS = 10000000
+# bcrypt משתמש רק ב-72 הבתים הראשונים (bcrypt 5 זורק שגיאה על יותר) - כמו הגיבובים הקיימים
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+ALGORITHM_BCRYPT = 'bcrypt'
+ALGORITHM_PBKDF2 = 'pbkdf2_sha256'
+# הפורמט הישן של app.py - sha256 בלי salt (64 תווי hex), נבדק רק כדי לשדרג בכניסה
+ALGORITHM_LEGACY_SHA256 = 'sha256'
+
+_password_hasher = None
+_password_hasher_lock = threading.Lock()
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def identify(password_hash):
+    """(אלגוריתם, עלות) של גיבוב שמור - העלות נשמרת בתוך הגיבוב עצמו"""
+    if not password_hash:
+        return None, None
+    if password_hash.startswith(('$2a$', '$2b$', '$2y$')):
+        return ALGORITHM_BCRYPT, int(password_hash[4:6])
+    if password_hash.startswith(ALGORITHM_PBKDF2 + '$'):
+        return ALGORITHM_PBKDF2, int(password_hash.split('$')[1])
+    if len(password_hash) == 64 and all(c in '0123456789abcdef' for c in password_hash):
+        return ALGORITHM_LEGACY_SHA256, None
+    return None, None
+
+
+class PasswordHasher:
+    """גיבוב ובדיקת סיסמאות: bcrypt (או PBKDF2 אם bcrypt לא מותקן) בעלות שמכוילת לזמן יעד"""
+    
+    def __init__(self, algorithm=None, target_ms=PASSWORD_HASH_TARGET_MS, cost=None):
+        self.algorithm = algorithm or (ALGORITHM_BCRYPT if BCRYPT_AVAILABLE else ALGORITHM_PBKDF2)
+        if self.algorithm == ALGORITHM_BCRYPT and not BCRYPT_AVAILABLE:
+            raise ImportError("ספריית bcrypt לא זמינה - הרץ: pip install bcrypt")
+        if self.algorithm not in (ALGORITHM_BCRYPT, ALGORITHM_PBKDF2):
+            raise ValueError(f"אלגוריתם גיבוב לא נתמך: {self.algorithm}")
+        self.target_ms = target_ms
+        # עלות קבועה (למשל כשכמה גדלי שרתים עובדים יחד) - בלי כיול
+        self.cost = cost or self.calibrate()
+    
+    # --- כיול ---
+    
+    def _time_hash(self, cost, samples=3):
+        """זמן גיבוב (שניות) בעלות נתונה - החציון מכמה מדידות"""
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            self._hash_with_cost('calibration-password', cost)
+            timings.append(time.perf_counter() - start)
+        return sorted(timings)[len(timings) // 2]
+    
+    def calibrate(self):
+        """העלות הגבוהה ביותר שנכנסת בזמן היעד בשרת הנוכחי"""
+        target = self.target_ms / 1000
+        if self.algorithm == ALGORITHM_BCRYPT:
+            # כל סבב נוסף מכפיל את הזמן - מודדים בעלות נמוכה ומחשבים
+            base_rounds = 8
+            elapsed = self._time_hash(base_rounds)
+            rounds = base_rounds + math.floor(math.log2(max(target / elapsed, 1)))
+            cost = max(MIN_BCRYPT_ROUNDS, min(MAX_BCRYPT_ROUNDS, rounds))
+        else:
+            # הזמן לינארי במספר האיטרציות
+            base_iterations = 20000
+            elapsed = self._time_hash(base_iterations)
+            iterations = int(base_iterations * target / elapsed) // 1000 * 1000
+            cost = max(MIN_PBKDF2_ITERATIONS, min(MAX_PBKDF2_ITERATIONS, iterations))
+        
+        print(f"🔑 גיבוב סיסמאות: {self.algorithm} בעלות {cost} (יעד {self.target_ms}ms)")
+        return cost
+    
+    # --- גיבוב ובדיקה ---
+    
+    def _hash_with_cost(self, password, cost, salt=None):
+        if self.algorithm == ALGORITHM_BCRYPT:
+            return bcrypt.hashpw(password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES],
+                                 bcrypt.gensalt(rounds=cost)).decode('utf-8')
+        salt = salt or secrets.token_bytes(16)
+        derived = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, cost)
+        return f"{ALGORITHM_PBKDF2}${cost}${_b64encode(salt)}${_b64encode(derived)}"
+    
+    def hash(self, password):
+        """גיבוב חדש באלגוריתם ובעלות הנוכחיים - האלגוריתם והעלות נשמרים בתוך הגיבוב"""
+        return self._hash_with_cost(password, self.cost)
+    
+    def verify(self, password, password_hash):
+        """בדיקת סיסמה מול גיבוב שמור, בכל אחד מהפורמטים (גם הישנים)"""
+        algorithm, cost = identify(password_hash)
+        if algorithm == ALGORITHM_BCRYPT:
+            if not BCRYPT_AVAILABLE:
+                return False
+            return bcrypt.checkpw(password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES], password_hash.encode('utf-8'))
+        if algorithm == ALGORITHM_PBKDF2:
+            _, _, salt, expected = password_hash.split('$')
+            derived = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), _b64decode(salt), cost)
+            return hmac.compare_digest(_b64encode(derived), expected)
+        if algorithm == ALGORITHM_LEGACY_SHA256:
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), password_hash)
+        return False
+    
+    def needs_rehash(self, password_hash):
+        """האם לגבב מחדש אחרי כניסה מוצלחת - אלגוריתם אחר או עלות נמוכה מהמכוילת"""
+        # עלות גבוהה יותר (גובבה בשרת מהיר יותר) לא מוחלשת - אחרת שרתים שונים מגבבים זה את זה מחדש בכל כניסה
+        algorithm, cost = identify(password_hash)
+        return algorithm != self.algorithm or cost < self.cost
+
+
+def get_password_hasher():
+    """ה-PasswordHasher של התהליך - הכיול רץ פעם אחת (עם preload_app - לפני ה-fork)"""
+    global _password_hasher
+    if _password_hasher is None:
+        with _password_hasher_lock:
+            if _password_hasher is None:
+                cost = os.getenv('PASSWORD_HASH_COST')
+                _password_hasher = PasswordHasher(
+                    algorithm=os.getenv('PASSWORD_HASH_ALGORITHM') or None,
+                    target_ms=int(os.getenv('PASSWORD_HASH_TARGET_MS', str(PASSWORD_HASH_TARGET_MS))),
+                    cost=int(cost) if cost else None
+                )
+    return _password_hasher
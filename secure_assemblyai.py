@@ -1,9 +1,10 @@
 # secure_assemblyai.py - תמלול מוצפן עם AssemblyAI
 import os
-import tempfile
 import hashlib
 import base64
 import assemblyai as aai
+from transcription_backends import AssemblyAIBackend, BACKEND_ERROR
+from hebrew_search import derive_search_key, blind_index
 
 try:
     from cryptography.fernet import Fernet
@@ -15,19 +16,27 @@ except ImportError as e:
     print("💡 הרץ: pip install cryptography")
     CRYPTO_AVAILABLE = False
 
+# גודל בלוק לקריאת קובץ השמע - הזיכרון נשאר קבוע גם בהקלטות ארוכות
+STREAM_BLOCK_SIZE = 1024 * 1024
+
 class SecureAssemblyAI:
     """תמלול מאובטח עם AssemblyAI - הצפנה מקסימלית"""
     
-    def __init__(self, api_key, user_password):
+    def __init__(self, api_key, user_password, backend=None):
         if not CRYPTO_AVAILABLE:
             raise ImportError("ספריית ההצפנה לא זמינה - הרץ: pip install cryptography")
         
         self.api_key = api_key
         aai.settings.api_key = api_key
         
+        # מנוע התמלול - ברירת מחדל AssemblyAI (ראה transcription_backends.py)
+        self.backend = backend or AssemblyAIBackend(api_key)
+        
         # יצירת מפתח הצפנה מהסיסמה של המשתמש
         self.encryption_key = self._derive_key(user_password)
         self.fernet = Fernet(self.encryption_key)
+        # מפתח לאינדקס העיוור - חיפוש בסשנים מוצפנים בלי לפענח אותם
+        self.search_key = derive_search_key(self.encryption_key)
         
     def _derive_key(self, password: str) -> bytes:
         """יצירת מפתח הצפנה מסיסמה"""
@@ -42,71 +51,120 @@ class SecureAssemblyAI:
         key = base64.urlsafe_b64encode(kdf.derive(password_bytes))
         return key
     
-    def secure_transcribe(self, audio_file_path: str, patient_name: str) -> dict:
+    def secure_transcribe(self, audio_file_path: str, patient_name: str,
+                          transcript_id: str = None, on_submitted=None,
+                          cache=None, audio_sha256: str = None, segmenter=None,
+                          on_transcribed=None) -> dict:
         """תמלול מאובטח עם הצפנה מקסימלית"""
+        # transcript_id - מזהה תמלול שכבר נשלח (חידוש אחרי קריסה, בלי העלאה נוספת)
+        # on_submitted - נקרא עם מזהה התמלול מיד אחרי השליחה למנוע התמלול
+        # cache, audio_sha256 - מטמון תמלולים (transcript_cache.py) ו-hash הקובץ לחיפוש בו
+        # segmenter - אם ניתן, הקלטה ארוכה מתומללת בחלקים במקביל (segmented_transcription.py)
+        # on_transcribed - נקרא כשהטקסט התקבל מהמנוע, לפני ההצפנה
         
         print("🔐 מתחיל תמלול מאובטח...")
         
-        # שלב 1: הצפנת הקובץ המקורי
-        encrypted_original = self._encrypt_file(audio_file_path)
-        print("✅ קובץ מקורי הוצפן")
+        if cache:
+            cached_text = cache.get(audio_sha256, self.backend)
+            if cached_text is not None:
+                print("⚡ תמלול נמצא במטמון - לא נשלח שוב")
+                result = self.build_result(cached_text, patient_name)
+                result['cached'] = True
+                return result
         
-        # שלב 2: יצירת קובץ זמני לתמלול
-        temp_audio = None
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                temp_audio = temp_file.name
-                
-                # העתקת הקובץ לתמלול (לא מוצפן - AssemblyAI צריך לשמוע)
-                with open(audio_file_path, 'rb') as original:
-                    temp_file.write(original.read())
-            
-            print("📤 שולח לתמלול ב-AssemblyAI...")
-            
-            # שלב 3: תמלול עם AssemblyAI
-            transcriber = aai.Transcriber()
-            config = aai.TranscriptionConfig(
-                language_code="he",
-                punctuate=True,
-                format_text=True
-            )
-            
-            transcript = transcriber.transcribe(temp_audio, config=config)
-            
-            if transcript.status == aai.TranscriptStatus.error:
-                raise Exception(f"שגיאה בתמלול: {transcript.error}")
-            
-            print("✅ תמלול הושלם")
-            
-            # שלב 4: הצפנת התוצאות מיד
-            encrypted_transcript = self._encrypt_text(transcript.text)
-            
-            # שלב 5: יצירת hash לאימות שלמות
-            content_hash = hashlib.sha256(transcript.text.encode()).hexdigest()
-            
-            print("🔐 תוצאות הוצפנו")
-            
-            # שלב 6: מחיקת נתונים לא מוצפנים מהזיכרון
-            original_text = transcript.text  # שמירה זמנית לסטטיסטיקות
-            del transcript  # מחיקה מהזיכרון
-            
-            return {
-                'success': True,
-                'encrypted_transcript': encrypted_transcript,
-                'content_hash': content_hash,
-                'patient_name': patient_name,
-                'word_count': len(original_text.split()),
-                'char_count': len(original_text),
-                'encryption_method': 'AES-256 + PBKDF2',
-                'privacy_level': 'maximum'
-            }
-            
-        finally:
-            # שלב 7: ניקוי מוחלט של קבצים זמניים
-            if temp_audio and os.path.exists(temp_audio):
-                # מחיקה מאובטחת - כתיבה עליונה
-                self._secure_delete(temp_audio)
-                print("🗑️ קבצים זמניים נמחקו באופן מאובטח")
+        if segmenter:
+            segmented = segmenter.transcribe(audio_file_path, provider_refs=transcript_id,
+                                             on_submitted=on_submitted)
+            # None - הקובץ לא ניתן לחלוקה וממשיכים לתמלול רגיל
+            if segmented is not None:
+                success, text, segments = segmented
+                if not success:
+                    raise Exception(f"שגיאה בתמלול: {text}")
+                if cache:
+                    cache.put(audio_sha256, self.backend, text)
+                if on_transcribed:
+                    on_transcribed()
+                result = self.build_result(text, patient_name)
+                result['segments'] = segments
+                return result
+        
+        if transcript_id:
+            # הקובץ כבר הועלה בניסיון קודם - רק ממתינים לתוצאה
+            print(f"🔁 ממשיך תמלול קיים ב-{self.backend.name}: {transcript_id}")
+            text = self._wait_for_text(transcript_id)
+            if cache:
+                cache.put(audio_sha256, self.backend, text)
+            if on_transcribed:
+                on_transcribed()
+            return self.build_result(text, patient_name)
+        
+        # שלב 1: קריאה אחת של הקובץ בבלוקים - hash למטמון והעלאה מאותם בלוקים
+        audio_hash = hashlib.sha256()
+        print(f"📤 שולח לתמלול ב-{self.backend.name}...")
+        
+        # שלב 2: העלאה בזרימה - הקובץ לא נטען לזיכרון ולא מועתק לקובץ זמני
+        transcript_id = self.backend.submit(self._stream_audio(audio_file_path, audio_hash))
+        
+        # שלב 3: המתנה לתמלול
+        if on_submitted:
+            on_submitted(transcript_id)
+        text = self._wait_for_text(transcript_id)
+        
+        print("✅ תמלול הושלם")
+        
+        if cache:
+            cache.put(audio_sha256 or audio_hash.hexdigest(), self.backend, text)
+        
+        if on_transcribed:
+            on_transcribed()
+        return self.build_result(text, patient_name)
+    
+    def _stream_audio(self, audio_file_path: str, audio_hash):
+        """קריאת קובץ השמע פעם אחת בבלוקים בגודל קבוע - כל בלוק מעודכן ב-hash ונשלח"""
+        with open(audio_file_path, 'rb') as audio:
+            for block in iter(lambda: audio.read(STREAM_BLOCK_SIZE), b''):
+                audio_hash.update(block)
+                yield block
+    
+    def _wait_for_text(self, transcript_id: str) -> str:
+        """המתנה לסיום התמלול במנוע והחזרת הטקסט"""
+        if self.backend.wait(transcript_id) == BACKEND_ERROR:
+            _, error = self.backend.result(transcript_id)
+            raise Exception(f"שגיאה בתמלול: {error}")
+        
+        success, text = self.backend.result(transcript_id)
+        if not success:
+            raise Exception(f"שגיאה בתמלול: {text}")
+        return text
+    
+    def build_result(self, text: str, patient_name: str) -> dict:
+        """הצפנת תוצאת התמלול והחזרת מבנה התוצאה"""
+        # שלב 4: הצפנת התוצאות מיד
+        encrypted_transcript = self._encrypt_text(text)
+        
+        # שלב 5: יצירת hash לאימות שלמות
+        content_hash = hashlib.sha256(text.encode()).hexdigest()
+        
+        # אינדקס עיוור - HMAC של המילים, הטקסט עצמו לא נשמר
+        search_tokens = blind_index(text, self.search_key)
+        
+        print("🔐 תוצאות הוצפנו")
+        
+        # שלב 6: מחיקת נתונים לא מוצפנים מהזיכרון
+        original_text = text  # שמירה זמנית לסטטיסטיקות
+        del text  # מחיקה מהזיכרון
+        
+        return {
+            'success': True,
+            'encrypted_transcript': encrypted_transcript,
+            'content_hash': content_hash,
+            'blind_index': search_tokens,
+            'patient_name': patient_name,
+            'word_count': len(original_text.split()),
+            'char_count': len(original_text),
+            'encryption_method': 'AES-256 + PBKDF2',
+            'privacy_level': 'maximum'
+        }
     
     def decrypt_transcript(self, encrypted_transcript: str) -> str:
         """פענוח התמלול עם הסיסמה של המשתמש"""
@@ -120,36 +178,31 @@ class SecureAssemblyAI:
             print(f"🔍 שגיאה בפענוח: {e}")
             raise Exception("שגיאה בפענוח - סיסמה שגויה או נתונים פגומים")
     
-    def _encrypt_file(self, file_path: str) -> str:
-        """הצפנת קובץ"""
-        with open(file_path, 'rb') as file:
-            file_data = file.read()
-        
-        encrypted_data = self.fernet.encrypt(file_data)
-        return base64.urlsafe_b64encode(encrypted_data).decode()
-    
     def _encrypt_text(self, text: str) -> str:
         """הצפנת טקסט"""
         encrypted_bytes = self.fernet.encrypt(text.encode('utf-8'))
         return base64.urlsafe_b64encode(encrypted_bytes).decode('utf-8')
-    
-    def _secure_delete(self, file_path: str):
-        """מחיקה מאובטחת של קובץ"""
-        try:
-            # כתיבה עליונה עם נתונים אקראיים
-            file_size = os.path.getsize(file_path)
-            with open(file_path, 'r+b') as file:
-                file.write(os.urandom(file_size))
-                file.flush()
-                os.fsync(file.fileno())
-            
-            # מחיקה רגילה
+
+def secure_delete(file_path: str):
+    """מחיקה מאובטחת של קובץ שמע לא מוצפן - כתיבה עליונה לפני המחיקה"""
+    try:
+        # כתיבה עליונה עם נתונים אקראיים
+        remaining = os.path.getsize(file_path)
+        with open(file_path, 'r+b') as file:
+            while remaining > 0:
+                block_size = min(STREAM_BLOCK_SIZE, remaining)
+                file.write(os.urandom(block_size))
+                remaining -= block_size
+            file.flush()
+            os.fsync(file.fileno())
+        
+        # מחיקה רגילה
+        os.remove(file_path)
+    except Exception as e:
+        print(f"⚠️ שגיאה במחיקה מאובטחת: {e}")
+        # מחיקה רגילה כגיבוי
+        if os.path.exists(file_path):
             os.remove(file_path)
-        except Exception as e:
-            print(f"⚠️ שגיאה במחיקה מאובטחת: {e}")
-            # מחיקה רגילה כגיבוי
-            if os.path.exists(file_path):
-                os.remove(file_path)
 
 # דוגמה לשימוש
 def example_usage():
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# segment_store.py - אחסון סשנים בקבצי מקטע לכל משתמש: הוספה בסוף בלבד, קריאה דרך mmap ודחיסה ברקע
+import os
+import zlib
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from session_format import fsync_directory
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    # Windows - נעילה בין threads בלבד
+    FCNTL_AVAILABLE = False
+
+# מבנה רשומה:
+#   MAGIC (4 בתים) | סוג (בית) | אורך המפתח (4) | אורך הערך (4) | crc32 של המפתח והערך (4) | מפתח | ערך
+# המפתח - הנתיב היחסי של הסשן (user_X/מטופל/session_....sess), הערך - הסשן בפורמט v2 (encode_session)
+RECORD_MAGIC = b'TSR1'
+RECORD_HEADER = struct.Struct('>4sBIII')
+RECORD_PUT = 0
+RECORD_TOMBSTONE = 1
+
+# תיקיית המקטעים בתוך תיקיית המשתמש (הנקודה מבדילה אותה מתיקיות מטופלים)
+SEGMENTS_FOLDER = '.segments'
+SEGMENT_EXTENSION = '.seg'
+# מעל הגודל הזה מתחילים מקטע חדש - רק המקטע האחרון (הפעיל) מקבל רשומות
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+# כמה מקטעים נשארים ממופים בזיכרון בכל תהליך
+MAX_OPEN_SEGMENTS = 256
+# בדחיסה - כמה בתים מועתקים בכל כתיבה (fsync אחד לכל קבוצה)
+COPY_BATCH_BYTES = 8 * 1024 * 1024
+
+
+class SegmentStore:
+    """קבצי מקטע של סשנים - כל שמירה נוספת לסוף המקטע הפעיל, והמיקום (מקטע, offset, אורך) נשמר באינדקס"""
+    
+    def __init__(self, transcripts_folder='transcripts', max_segment_bytes=SEGMENT_MAX_BYTES):
+        self.transcripts_folder = transcripts_folder
+        self.max_segment_bytes = max_segment_bytes
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._maps = OrderedDict()
+        self._maps_lock = threading.Lock()
+    
+    # --- מקטעים ---
+    
+    def segments_folder(self, user_folder):
+        return os.path.join(self.transcripts_folder, user_folder, SEGMENTS_FOLDER)
+    
+    def segment_path(self, segment):
+        """segment - נתיב יחסי לתיקיית התמלולים (user_X/.segments/000001.seg), כפי שנשמר באינדקס"""
+        return os.path.join(self.transcripts_folder, segment)
+    
+    def segments(self, user_folder):
+        """המקטעים של משתמש מהישן לחדש - נתיבים יחסיים"""
+        folder = self.segments_folder(user_folder)
+        if not os.path.isdir(folder):
+            return []
+        names = sorted(name for name in os.listdir(folder) if name.endswith(SEGMENT_EXTENSION))
+        return [os.path.join(user_folder, SEGMENTS_FOLDER, name) for name in names]
+    
+    def users(self):
+        """תיקיות המשתמשים שיש להן מקטעים"""
+        if not os.path.isdir(self.transcripts_folder):
+            return []
+        return sorted(name for name in os.listdir(self.transcripts_folder)
+                      if os.path.isdir(os.path.join(self.transcripts_folder, name, SEGMENTS_FOLDER)))
+    
+    def _user_lock(self, user_folder):
+        with self._locks_lock:
+            return self._locks.setdefault(user_folder, threading.Lock())
+    
+    @contextmanager
+    def _locked(self, user_folder, name='append', blocking=True):
+        """נעילה בין threads ובין תהליכים (gunicorn) - מחזיר False אם blocking=False והנעילה תפוסה"""
+        folder = self.segments_folder(user_folder)
+        os.makedirs(folder, exist_ok=True)
+        thread_lock = self._user_lock(f"{user_folder}:{name}")
+        if not thread_lock.acquire(blocking):
+            yield False
+            return
+        
+        lock_file = None
+        try:
+            if FCNTL_AVAILABLE:
+                lock_file = open(os.path.join(folder, f'.{name}.lock'), 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            yield True
+        finally:
+            if lock_file:
+                lock_file.close()
+            thread_lock.release()
+    
+    def _active_segment(self, user_folder):
+        """המקטע שאליו מוסיפים - האחרון, או חדש אם האחרון התמלא. נקרא תחת נעילת ההוספה"""
+        segments = self.segments(user_folder)
+        if segments and os.path.getsize(self.segment_path(segments[-1])) < self.max_segment_bytes:
+            return segments[-1]
+        number = int(os.path.basename(segments[-1])[:-len(SEGMENT_EXTENSION)]) + 1 if segments else 1
+        return os.path.join(user_folder, SEGMENTS_FOLDER, f"{number:06d}{SEGMENT_EXTENSION}")
+    
+    # --- כתיבה ---
+    
+    def append(self, user_folder, records):
+        """הוספת רשומות (מפתח, ערך בבתים או None למחיקה) בכתיבה אחת ו-fsync אחד - מחזיר מיקום לכל רשומה"""
+        if not records:
+            return []
+        
+        with self._locked(user_folder):
+            segment = self._active_segment(user_folder)
+            segment_file = self.segment_path(segment)
+            created = not os.path.exists(segment_file)
+            
+            with open(segment_file, 'ab') as f:
+                offset = f.tell()
+                chunks = []
+                locations = []
+                for key, value in records:
+                    raw_key = key.encode('utf-8')
+                    flags = RECORD_TOMBSTONE if value is None else RECORD_PUT
+                    value = value if value is not None else b''
+                    crc = zlib.crc32(value, zlib.crc32(raw_key))
+                    chunks.extend((RECORD_HEADER.pack(RECORD_MAGIC, flags, len(raw_key), len(value), crc),
+                                   raw_key, value))
+                    value_offset = offset + RECORD_HEADER.size + len(raw_key)
+                    locations.append((segment, value_offset, len(value)))
+                    offset = value_offset + len(value)
+                f.write(b''.join(chunks))
+                f.flush()
+                os.fsync(f.fileno())
+            
+            if created:
+                fsync_directory(os.path.dirname(segment_file))
+        return locations
+    
+    def copy(self, segment, user_folder, records, batch_bytes=COPY_BATCH_BYTES):
+        """העתקת רשומות (מפתח, offset, אורך או None למחיקה) ממקטע סגור לסוף המקטע הפעיל - ישירות מה-mmap"""
+        if not records:
+            return []
+        locations = []
+        batch = []
+        batch_size = 0
+        mapped = self._map(segment, os.path.getsize(self.segment_path(segment)))
+        with memoryview(mapped) as whole:
+            for key, offset, length in records:
+                batch.append((key, None if length is None else whole[offset:offset + length]))
+                batch_size += length or 0
+                if batch_size >= batch_bytes:
+                    locations.extend(self._append_views(user_folder, batch))
+                    batch, batch_size = [], 0
+            locations.extend(self._append_views(user_folder, batch))
+        return locations
+    
+    def _append_views(self, user_folder, records):
+        try:
+            return self.append(user_folder, records)
+        finally:
+            for _, value in records:
+                if value is not None:
+                    value.release()
+    
+    def compaction_lock(self, user_folder):
+        """נעילת דחיסה בלי המתנה - תהליך אחד דוחס את המשתמש, והשאר מדלגים (with מחזיר False)"""
+        return self._locked(user_folder, 'compact', blocking=False)
+    
+    def remove_segment(self, segment):
+        """מחיקת מקטע שכל הרשומות החיות שלו הועתקו (דחיסה)"""
+        with self._maps_lock:
+            # המיפוי נסגר כשהקורא האחרון משחרר אותו
+            self._maps.pop(segment, None)
+        os.remove(self.segment_path(segment))
+        fsync_directory(os.path.dirname(self.segment_path(segment)))
+    
+    # --- קריאה ---
+    
+    def _map(self, segment, end):
+        """mmap של המקטע (מהמטמון), ממופה מחדש אם המקטע הפעיל גדל מאז"""
+        with self._maps_lock:
+            mapped = self._maps.get(segment)
+            if mapped is not None and len(mapped) >= end:
+                self._maps.move_to_end(segment)
+                return mapped
+        
+        with open(self.segment_path(segment), 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < end:
+            raise ValueError(f"רשומה מחוץ למקטע {segment}")
+        
+        with self._maps_lock:
+            self._maps[segment] = mapped
+            self._maps.move_to_end(segment)
+            while len(self._maps) > MAX_OPEN_SEGMENTS:
+                self._maps.popitem(last=False)
+        return mapped
+    
+    @contextmanager
+    def view(self, segment, offset, length):
+        """memoryview של ערך הרשומה ישירות מתוך ה-mmap - בלי להעתיק. תקף רק בתוך ה-with"""
+        mapped = self._map(segment, offset + length)
+        with memoryview(mapped) as whole, whole[offset:offset + length] as value:
+            yield value
+    
+    def scan(self, segment):
+        """כל הרשומות התקינות במקטע לפי הסדר: (סוג, מפתח, offset של הערך, אורך הערך)"""
+        records = []
+        size = os.path.getsize(self.segment_path(segment))
+        if not size:
+            return records
+        
+        mapped = self._map(segment, size)
+        position = 0
+        while position + RECORD_HEADER.size <= size:
+            magic, flags, key_length, value_length, crc = RECORD_HEADER.unpack_from(mapped, position)
+            key_offset = position + RECORD_HEADER.size
+            value_offset = key_offset + key_length
+            end = value_offset + value_length
+            
+            valid = magic == RECORD_MAGIC and end <= size
+            if valid:
+                with memoryview(mapped) as whole, whole[key_offset:value_offset] as raw_key, \
+                        whole[value_offset:end] as value:
+                    valid = zlib.crc32(value, zlib.crc32(raw_key)) == crc
+                    key = bytes(raw_key).decode('utf-8', errors='replace') if valid else None
+            
+            if not valid:
+                # רשומה קטועה (קריסה באמצע כתיבה) - ממשיכים מה-MAGIC הבא
+                next_record = mapped.find(RECORD_MAGIC, position + 1)
+                if next_record == -1:
+                    break
+                position = next_record
+                continue
+            
+            records.append((flags, key, value_offset, value_length))
+            position = end
+        return records
@@ -0,0 +1,224 @@
+# segmented_transcription.py - תמלול מקבילי של הקלטות ארוכות בחלקים שנחתכים בשקט
+import os
+import json
+import math
+import wave
+import shutil
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# אורך חלק רצוי, חפיפה בין חלקים סמוכים וטווח החיפוש של נקודת שקט סביב כל חיתוך (בשניות)
+DEFAULT_SEGMENT_SECONDS = 300
+DEFAULT_OVERLAP_SECONDS = 2.0
+MAX_CUT_SEARCH_SECONDS = 30
+# חלון לחישוב אנרגיה והחלקה - שקט קצר בין מילים לא נבחר כנקודת חיתוך
+ENERGY_FRAME_SECONDS = 0.02
+ENERGY_SMOOTH_FRAMES = 10
+# כמה שניות שמע לקרוא מהדיסק בכל פעם
+READ_BLOCK_SECONDS = 10
+# קצב דיבור מהיר (מילים לשנייה) - כמה מילים לכל היותר נכנסות לאזור החפיפה בין שני חלקים
+STITCH_WORDS_PER_SECOND = 4
+# חפיפה קצרה מזה לא נחשבת כפילות - מילה בודדת חוזרת גם בדיבור רגיל
+MIN_STITCH_WORDS = 2
+
+
+class SegmentedTranscriber:
+    """חיתוך קובץ WAV בנקודות שקט, תמלול החלקים במקביל וחיבור הטקסט בלי כפילויות"""
+    
+    def __init__(self, backend, max_workers=4, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+                 overlap_seconds=DEFAULT_OVERLAP_SECONDS, on_progress=None):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        # on_progress - נקרא עם (חלקים שהסתיימו, סך החלקים) אחרי כל חלק שתומלל
+        self.on_progress = on_progress
+    
+    def transcribe(self, audio_path, provider_refs=None, on_submitted=None):
+        """תמלול בחלקים - מחזיר (הצלחה, טקסט או הודעת שגיאה, מפת חלקים), או None אם אי אפשר לחלק"""
+        # provider_refs - מזהי התמלול של חלקים שכבר נשלחו (JSON, חידוש אחרי קריסה)
+        # on_submitted - נקרא עם כל מזהי החלקים (JSON) אחרי כל שליחה
+        segments = self.plan_segments(audio_path)
+        if not segments:
+            return None
+        
+        refs = {}
+        if provider_refs:
+            try:
+                refs = {int(index): ref for index, ref in json.loads(provider_refs).items()}
+            except (ValueError, AttributeError):
+                refs = {}
+        refs_lock = threading.Lock()
+        finished = [0]
+        
+        segment_folder = f"{audio_path}.segments"
+        os.makedirs(segment_folder, exist_ok=True)
+        
+        def transcribe_segment(segment):
+            index = segment['index']
+            with refs_lock:
+                ref = refs.get(index)
+            
+            if not ref:
+                segment_path = os.path.join(segment_folder, f"{index:04d}.wav")
+                self._write_segment(audio_path, segment_path, segment)
+                try:
+                    ref = self.backend.submit(segment_path)
+                finally:
+                    os.remove(segment_path)
+                
+                with refs_lock:
+                    refs[index] = ref
+                    refs_json = json.dumps({str(i): r for i, r in refs.items()})
+                if on_submitted:
+                    on_submitted(refs_json)
+            
+            self.backend.wait(ref)
+            result = self.backend.result(ref)
+            
+            with refs_lock:
+                finished[0] += 1
+                done = finished[0]
+            if self.on_progress:
+                self.on_progress(done, len(segments))
+            return result
+        
+        print(f"✂️ תמלול בחלקים: {len(segments)} חלקים, עד {self.max_workers} במקביל")
+        
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(segments))) as executor:
+                results = list(executor.map(transcribe_segment, segments))
+        finally:
+            shutil.rmtree(segment_folder, ignore_errors=True)
+        
+        for segment, (success, text) in zip(segments, results):
+            if not success:
+                return False, f"חלק {segment['index'] + 1}: {text}", segments
+        
+        # אזור החפיפה הוא overlap_seconds לכל צד של נקודת החיתוך
+        max_overlap_words = math.ceil(2 * self.overlap_seconds * STITCH_WORDS_PER_SECOND)
+        text = stitch_transcripts([text for _, text in results], max_overlap_words)
+        return True, text, segments
+    
+    def plan_segments(self, audio_path):
+        """חלוקת הקובץ לחלקים חופפים - מחזיר רשימת חלקים עם offset, או None אם אין צורך/אפשרות"""
+        if not NUMPY_AVAILABLE:
+            return None
+        
+        try:
+            with wave.open(audio_path, 'rb') as wav:
+                params = wav.getparams()
+                if params.sampwidth not in (1, 2, 4) or params.comptype != 'NONE':
+                    return None
+                energy = self._frame_energy(wav, params)
+        except (wave.Error, EOFError):
+            # לא WAV (למשל WebM מהדפדפן) - מתמללים את הקובץ כולו
+            return None
+        
+        duration = params.nframes / params.framerate
+        if duration < self.segment_seconds * 1.5:
+            return None
+        
+        # החלקה - מחפשים רגע שקט מתמשך ולא הפסקה בין שתי הברות
+        if len(energy) >= ENERGY_SMOOTH_FRAMES:
+            kernel = np.ones(ENERGY_SMOOTH_FRAMES) / ENERGY_SMOOTH_FRAMES
+            energy = np.convolve(energy, kernel, mode='same')
+        
+        search_seconds = min(MAX_CUT_SEARCH_SECONDS, self.segment_seconds / 4)
+        cuts = [0.0]
+        target = self.segment_seconds
+        while target < duration - self.segment_seconds / 2:
+            low = int((target - search_seconds) / ENERGY_FRAME_SECONDS)
+            high = int((target + search_seconds) / ENERGY_FRAME_SECONDS)
+            window = energy[low:high]
+            cut = (low + int(np.argmin(window))) * ENERGY_FRAME_SECONDS if len(window) else target
+            cuts.append(cut)
+            target = cut + self.segment_seconds
+        cuts.append(duration)
+        
+        segments = []
+        for index in range(len(cuts) - 1):
+            start = max(0.0, cuts[index] - self.overlap_seconds)
+            end = min(duration, cuts[index + 1] + self.overlap_seconds)
+            segments.append({
+                'index': index,
+                'offset': round(start, 3),
+                'start_frame': int(start * params.framerate),
+                'end_frame': int(end * params.framerate),
+                'duration': round(end - start, 3)
+            })
+        return segments
+    
+    def _frame_energy(self, wav, params):
+        """אנרגיית RMS לכל חלון של ENERGY_FRAME_SECONDS - נקרא בבלוקים, בלי לטעון את כל הקובץ"""
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[params.sampwidth]
+        samples_per_frame = max(1, int(params.framerate * ENERGY_FRAME_SECONDS))
+        block_frames = samples_per_frame * int(READ_BLOCK_SECONDS / ENERGY_FRAME_SECONDS)
+        
+        energies = []
+        while True:
+            raw = wav.readframes(block_frames)
+            if not raw:
+                break
+            samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+            if params.sampwidth == 1:
+                samples -= 128
+            # ממוצע הערוצים - מספיק כדי למצוא שקט
+            samples = samples.reshape(-1, params.nchannels).mean(axis=1)
+            usable = len(samples) - len(samples) % samples_per_frame
+            if usable:
+                frames = samples[:usable].reshape(-1, samples_per_frame)
+                energies.append(np.sqrt((frames ** 2).mean(axis=1)))
+        
+        return np.concatenate(energies) if energies else np.zeros(0)
+    
+    def _write_segment(self, audio_path, segment_path, segment):
+        """כתיבת חלק כקובץ WAV נפרד - העתקת בתים בלי פענוח"""
+        with wave.open(audio_path, 'rb') as source, wave.open(segment_path, 'wb') as target:
+            target.setparams(source.getparams())
+            source.setpos(segment['start_frame'])
+            block_frames = source.getframerate() * READ_BLOCK_SECONDS
+            remaining = segment['end_frame'] - segment['start_frame']
+            while remaining > 0:
+                raw = source.readframes(min(block_frames, remaining))
+                if not raw:
+                    break
+                target.writeframes(raw)
+                remaining -= min(block_frames, remaining)
+
+
+def _stitch_key(word):
+    """השוואת מילים בלי פיסוק ואותיות גדולות - כל חלק מתמלל את קצוות המשפט קצת אחרת"""
+    return word.strip(string.punctuation + '״׳–—…').lower()
+
+
+def stitch_transcripts(texts, max_overlap_words=math.ceil(2 * DEFAULT_OVERLAP_SECONDS * STITCH_WORDS_PER_SECOND)):
+    """חיבור טקסטים של חלקים חופפים - המילים שתומללו פעמיים באזור החפיפה נשארות פעם אחת"""
+    # רק סוף החלק הקודם מול תחילת החלק הבא, באורך החפיפה לכל היותר - ביטוי שחוזר
+    # בתוך הטקסט לא נחשב כפילות. אם אין התאמה שנוגעת בשני הקצוות - מחברים כמו שהם
+    words = []
+    for text in texts:
+        next_words = (text or '').split()
+        if not words:
+            words = next_words
+            continue
+        
+        tail_keys = [_stitch_key(word) for word in words[-max_overlap_words:]]
+        head_keys = [_stitch_key(word) for word in next_words[:max_overlap_words]]
+        overlap = 0
+        for size in range(min(len(tail_keys), len(head_keys)), MIN_STITCH_WORDS - 1, -1):
+            if tail_keys[-size:] == head_keys[:size]:
+                overlap = size
+                break
+        
+        # הרצף המשותף נשאר מהחלק הקודם, והחלק הבא ממשיך מיד אחריו
+        words = words + next_words[overlap:]
+    
+    return ' '.join(words)
@@ -0,0 +1,58 @@
+# session_export.py - יצוא סשנים בזרימה (zip או ndjson) - הקובץ לא נבנה בזיכרון, כל סשן נכתב ונשלח מיד
+import io
+import json
+import time
+import zipfile
+import datetime
+
+EXPORT_FORMATS = ('zip', 'ndjson')
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """יעד כתיבה ל-ZipFile שרק אוסף את הבתים עד שהם נשלחים - בלי seek, ולכן zip בזרימה"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_time(created_at):
+    """זמן הקובץ בארכיון לפי מועד יצירת הסשן"""
+    try:
+        return datetime.datetime.fromisoformat(created_at).timetuple()[:6]
+    except (TypeError, ValueError):
+        return time.localtime()[:6]
+
+
+def iter_zip(entries):
+    """ארכיון zip בזרימה - entries מניב (שם, תוכן בבתים, created_at), והארכיון נשלח חלק אחרי חלק"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data, created_at in entries:
+            info = zipfile.ZipInfo(name, date_time=_zip_time(created_at))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, data)
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    # התיקייה המרכזית של הארכיון נכתבת בסגירה
+    chunk = buffer.drain()
+    if chunk:
+        yield chunk
+
+
+def iter_ndjson(records):
+    """שורת JSON לכל סשן"""
+    for record in records:
+        yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# session_format.py - פורמט קבצי סשן v2: כותרת מטא-דאטה קטנה + גוף דחוס (וקריאה שקופה של קבצי JSON ישנים)
+import os
+import sys
+import json
+import zlib
+import uuid
+import struct
+import datetime
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# מבנה קובץ v2:
+#   MAGIC (4 בתים) | אורך הכותרת (4 בתים, big-endian) | כותרת JSON | גוף JSON דחוס
+# את הכותרת אפשר לקרוא בלי לגעת בגוף - רשימות ואינדקס קוראים רק אותה
+SESSION_MAGIC = b'TSS2'
+SESSION_EXTENSION = '.sess'
+LEGACY_EXTENSION = '.json'
+SESSION_EXTENSIONS = (SESSION_EXTENSION, LEGACY_EXTENSION)
+
+# שדות שנשמרים בכותרת - כל השאר (תמלולים, הצפנה, חלקים) בגוף הדחוס
+HEADER_FIELDS = ('session_id', 'patient_name', 'session_date', 'created_at', 'word_count', 'char_count',
+                 'quality_mode', 'is_encrypted', 'audio_filename')
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def is_session_file(filename):
+    """קובץ סשן - v2 או JSON ישן"""
+    return filename.endswith(SESSION_EXTENSIONS)
+
+
+def encode_session(session_data):
+    """סשן (dict) -> בתים בפורמט v2"""
+    header = {field: session_data[field] for field in HEADER_FIELDS if field in session_data}
+    body = {key: value for key, value in session_data.items() if key not in HEADER_FIELDS}
+    
+    # בדרך כלל התמלול המתוקן זהה למקורי - שומרים אותו רק כשהוא שונה
+    if 'corrected_transcript' in body and body['corrected_transcript'] == body.get('original_transcript'):
+        del body['corrected_transcript']
+        header['corrected_is_original'] = True
+    
+    raw_body = json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if ZSTD_AVAILABLE:
+        header['compression'] = 'zstd'
+        compressed_body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw_body)
+    else:
+        header['compression'] = 'zlib'
+        compressed_body = zlib.compress(raw_body, ZLIB_LEVEL)
+    header['format'] = 2
+    
+    raw_header = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return SESSION_MAGIC + struct.pack('>I', len(raw_header)) + raw_header + compressed_body
+
+
+def decode_session(data):
+    """בתים (v2 או JSON ישן) -> סשן (dict) - גם memoryview (מקטע ממופה), והגוף נפתח בלי להעתיק אותו"""
+    if bytes(data[:len(SESSION_MAGIC)]) != SESSION_MAGIC:
+        return json.loads(bytes(data).decode('utf-8'))
+    
+    header, body_offset = _decode_header(data)
+    compressed_body = data[body_offset:]
+    if header.get('compression') == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ValueError("קובץ הסשן דחוס ב-zstd - הרץ: pip install zstandard")
+        raw_body = zstandard.ZstdDecompressor().decompress(compressed_body)
+    else:
+        raw_body = zlib.decompress(compressed_body)
+    
+    session_data = dict(header)
+    session_data.update(json.loads(raw_body.decode('utf-8')))
+    if session_data.pop('corrected_is_original', False):
+        session_data['corrected_transcript'] = session_data.get('original_transcript', '')
+    session_data.pop('compression', None)
+    session_data.pop('format', None)
+    return session_data
+
+
+def _decode_header(data):
+    """(כותרת, מיקום תחילת הגוף) מתוך בתים של קובץ v2"""
+    if len(data) < len(SESSION_MAGIC) + 4:
+        raise ValueError("קובץ סשן קטוע")
+    header_size = struct.unpack_from('>I', data, len(SESSION_MAGIC))[0]
+    body_offset = len(SESSION_MAGIC) + 4 + header_size
+    if len(data) < body_offset:
+        raise ValueError("כותרת קובץ הסשן קטועה")
+    return json.loads(bytes(data[len(SESSION_MAGIC) + 4:body_offset]).decode('utf-8')), body_offset
+
+
+def new_session_file(patient_folder, prefix='session'):
+    """נתיב ומזהה לסשן חדש - המזהה בשם הקובץ מונע התנגשות של שתי שמירות באותה שנייה"""
+    session_id = uuid.uuid4().hex
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return os.path.join(patient_folder, f"{prefix}_{timestamp}_{session_id[:8]}{SESSION_EXTENSION}"), session_id
+
+
+def write_temp_session(session_file, session_data):
+    """כתיבת הסשן לקובץ זמני ליד היעד (עדיין בלי fsync) - מחזיר את נתיב הקובץ הזמני"""
+    temp_file = f"{session_file}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(temp_file, 'wb') as f:
+            f.write(encode_session(session_data))
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return temp_file
+
+
+def fsync_file(path):
+    """הורדת תוכן הקובץ לדיסק"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(folder):
+    """הורדת רשומות התיקייה לדיסק - בלי זה שינוי שם עלול להיעלם בקריסה"""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        # מערכות שלא תומכות בפתיחת תיקייה (Windows)
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_session(session_file, session_data):
+    """כתיבה אטומית של סשן בפורמט v2 - קובץ זמני, fsync ושינוי שם. קריסה לא משאירה קובץ קטוע"""
+    temp_file = write_temp_session(session_file, session_data)
+    try:
+        fsync_file(temp_file)
+        os.replace(temp_file, session_file)
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    fsync_directory(os.path.dirname(session_file) or '.')
+
+
+def read_session(session_file):
+    """קריאת סשן מלא - v2 או JSON ישן"""
+    with open(session_file, 'rb') as f:
+        return decode_session(f.read())
+
+
+def read_session_header(session_file):
+    """המטא-דאטה של סשן בלבד - ב-v2 נקראת רק הכותרת, בלי לפתוח את הגוף"""
+    with open(session_file, 'rb') as f:
+        prefix = f.read(len(SESSION_MAGIC) + 4)
+        if not prefix.startswith(SESSION_MAGIC):
+            session_data = json.loads((prefix + f.read()).decode('utf-8'))
+            return {field: session_data[field] for field in HEADER_FIELDS if field in session_data}
+        
+        header_size = struct.unpack('>I', prefix[len(SESSION_MAGIC):])[0]
+        header, _ = _decode_header(prefix + f.read(header_size))
+    
+    header.pop('corrected_is_original', None)
+    header.pop('compression', None)
+    header.pop('format', None)
+    return header
+
+
+def migrated_path(session_file):
+    """שם הקובץ אחרי המרה ל-v2"""
+    base, _ = os.path.splitext(session_file)
+    return base + SESSION_EXTENSION
+
+
+def migrate_file(session_file, session_id=None, remove_original=True):
+    """המרת קובץ JSON ישן ל-v2 - מחזיר (נתיב חדש, גודל לפני, גודל אחרי, הסשן) או None אם כבר הומר"""
+    if not session_file.endswith(LEGACY_EXTENSION):
+        return None
+    
+    session_data = read_session(session_file)
+    # המזהה שהסשן קיבל לפי הנתיב הישן נשמר בקובץ, כדי שלא ישתנה אחרי שינוי השם
+    if session_id and not session_data.get('session_id'):
+        session_data['session_id'] = session_id
+    
+    new_file = migrated_path(session_file)
+    write_session(new_file, session_data)
+    
+    old_size = os.path.getsize(session_file)
+    if remove_original:
+        os.remove(session_file)
+    return new_file, old_size, os.path.getsize(new_file), session_data
+
+
+def main():
+    """המרת כל קבצי הסשן הישנים ל-v2: python session_format.py migrate [תיקיית_תמלולים] [קובץ_אינדקס]"""
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("🗜️ המרת קבצי סשן לפורמט v2")
+        print("שימוש:")
+        print("  python session_format.py migrate [transcripts] [session_index.db]")
+        print("אפשר להריץ בזמן שהשרת פועל - כל קובץ מומר ומעודכן באינדקס בנפרד")
+        sys.exit(1)
+    
+    from session_index import SessionIndex
+    
+    transcripts_folder = sys.argv[2] if len(sys.argv) > 2 else 'transcripts'
+    db_path = sys.argv[3] if len(sys.argv) > 3 else 'session_index.db'
+    index = SessionIndex(transcripts_folder, db_path)
+    
+    migrated, failed, before, after = 0, 0, 0, 0
+    for root, dirs, files in os.walk(transcripts_folder):
+        for file in files:
+            if not file.endswith(LEGACY_EXTENSION):
+                continue
+            session_file = os.path.join(root, file)
+            try:
+                result = index.migrate_session(session_file)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ לא ניתן להמיר {session_file}: {e}")
+                failed += 1
+                continue
+            if result:
+                migrated += 1
+                before += result[1]
+                after += result[2]
+    
+    ratio = f" (פי {before / after:.1f})" if after else ""
+    print(f"✅ הומרו {migrated} סשנים: {before // 1024}KB ← {after // 1024}KB{ratio}")
+    if failed:
+        print(f"⚠️ {failed} קבצים לא הומרו")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1365 @@
+#!/usr/bin/env python3
+# session_index.py - אינדקס SQLite של מטופלים וסשנים (במקום סריקת תיקיית התמלולים בכל בקשה)
+import os
+import re
+import sys
+import json
+import uuid
+import base64
+import hashlib
+import shutil
+import sqlite3
+import time
+import datetime
+import threading
+from session_format import (is_session_file, encode_session, decode_session, write_temp_session, fsync_file,
+                            fsync_directory, read_session, migrate_file)
+from segment_store import SegmentStore, SEGMENTS_FOLDER, RECORD_PUT, RECORD_TOMBSTONE
+from session_storage import create_storage
+from sqlite_pool import connect_db
+from hebrew_search import index_terms, query_terms, fts_query, snippet, searchable_text
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+    FileSystemEventHandler = object
+
+# חותמת הזמן בשם קובץ סשן (session_2025-08-20_17-24-53.json) - לסשנים בלי created_at
+SESSION_FILENAME_TIMESTAMP = re.compile(r'(\d{4}-\d{2}-\d{2})_(\d{2})-(\d{2})-(\d{2})')
+# גודל עמוד ברשימת סשנים
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# כמה שמירות לכל היותר נכנסות ל-commit קבוצתי אחד (fsync לכל קובץ, אבל commit אחד לאינדקס)
+GROUP_COMMIT_MAX_BATCH = 64
+# מספר תוצאות חיפוש
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# איפה נשמרים סשנים חדשים - קובץ לכל סשן, מקטעים לכל משתמש (segment_store.py),
+# או אחסון אובייקטים שכמה שרתים חולקים (session_storage.py): local, sqlite, s3
+STORAGE_MODES = ('files', 'segments', 'local', 'sqlite', 's3')
+# דחיסת מקטעים - כל כמה זמן, מתחת לאיזה אחוז נתונים חיים, ומקטע שנכתב לאחרונה לא נדחס
+# (שמירה שנוספה למקטע רגע לפני שנסגר אולי עוד לא נרשמה באינדקס)
+COMPACT_INTERVAL_SECONDS = 600
+COMPACT_LIVE_RATIO = 0.5
+COMPACT_MIN_AGE_SECONDS = 300
+# סנכרון עם אחסון אובייקטים משותף - כל כמה זמן נבדק מה שרתים אחרים שמרו או מחקו,
+# ומזהה שלא נמצא באינדקס מפעיל סנכרון מיידי לכל היותר פעם ב-MIN שניות
+STORE_SYNC_INTERVAL_SECONDS = 30
+STORE_SYNC_MIN_INTERVAL_SECONDS = 5
+
+
+class SessionIndex:
+    """אינדקס של קבצי הסשנים - מתעדכן בכל כתיבה ומחיקה, ונבנה מחדש מהדיסק לפי בקשה"""
+    
+    def __init__(self, transcripts_folder='transcripts', db_path='session_index.db', auto_rebuild=True,
+                 storage='files', object_store=None):
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"מצב אחסון לא מוכר: {storage} (אפשרויות: {', '.join(STORAGE_MODES)})")
+        self.transcripts_folder = transcripts_folder
+        self.db_path = db_path
+        # סשנים שכבר נשמרו במקטעים נקראים גם אחרי מעבר חזרה לקבצים - המיקום שלהם באינדקס
+        self.storage = storage
+        self.segments = SegmentStore(transcripts_folder)
+        self.object_store = object_store
+        if self.object_store is None and storage not in ('files', 'segments'):
+            self.object_store = create_storage(storage)
+        self._compactor = None
+        self._compactor_pid = None
+        self._compactor_stop = threading.Event()
+        self._compactor_lock = threading.Lock()
+        self._observer = None
+        self._observer_pid = None
+        self._observer_lock = threading.Lock()
+        self._store_sync = None
+        self._store_sync_pid = None
+        self._store_sync_stop = threading.Event()
+        self._store_sync_thread_lock = threading.Lock()
+        self._store_sync_lock = threading.Lock()
+        self._store_synced_at = 0.0
+        # commit קבוצתי - שמירות שמגיעות בזמן שאחרת מבצעת fsync ממתינות ונכנסות יחד לסבב הבא
+        self._commit_cond = threading.Condition()
+        self._commit_pending = []
+        self._committing = False
+        # False אם ה-SQLite המותקן נבנה בלי FTS5
+        self.search_available = False
+        
+        if self.init_database() and auto_rebuild:
+            # אינדקס חדש לעץ תמלולים קיים (שדרוג) - סורקים פעם אחת
+            self.rebuild()
+    
+    def _connect(self):
+        conn = connect_db(self.db_path)
+        # INSERT OR REPLACE מוחק את השורה הקודמת דרך הטריגר - כך גם אינדקס החיפוש מתנקה
+        conn.execute('PRAGMA recursive_triggers = ON')
+        return conn
+    
+    def init_database(self):
+        """יצירת טבלאות האינדקס - מחזיר True אם האינדקס עוד לא נבנה מעולם"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS patients (
+                user_folder TEXT NOT NULL,
+                patient_name TEXT NOT NULL,
+                PRIMARY KEY (user_folder, patient_name)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_patients_name
+            ON patients (patient_name)
+        ''')
+        
+        # path - נתיב יחסי לתיקיית התמלולים (user_X/מטופל/session_....json)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                path TEXT PRIMARY KEY,
+                user_folder TEXT,
+                patient_name TEXT,
+                filename TEXT NOT NULL,
+                created_at TEXT,
+                word_count INTEGER DEFAULT 0,
+                quality_mode TEXT,
+                is_encrypted INTEGER DEFAULT 0,
+                session_date TEXT,
+                audio_filename TEXT,
+                session_id TEXT,
+                segment TEXT,
+                segment_offset INTEGER,
+                segment_length INTEGER,
+                object_store TEXT,
+                object_version TEXT,
+                stand_in INTEGER DEFAULT 0,
+                user_id INTEGER
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sessions_patient_created
+            ON sessions (user_folder, patient_name, created_at)
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS index_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        
+        # עדכון אינדקס ישן - עמודות שנוספו לרשימת הסשנים, וממלאים אותן בבנייה מחדש
+        cursor.execute('PRAGMA table_info(sessions)')
+        columns = [row[1] for row in cursor.fetchall()]
+        for column in ('session_date', 'audio_filename', 'session_id'):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE sessions ADD COLUMN {column} TEXT')
+                cursor.execute("DELETE FROM index_meta WHERE key = 'rebuilt_at'")
+        # איפה הסשן שמור - מיקום בקובץ מקטע, או שם אחסון האובייקטים. שניהם NULL לסשן שנשמר כקובץ.
+        # object_version - גודל וזמן השינוי של האובייקט בסנכרון האחרון (NULL לשמירה מהשרת הזה)
+        for column, column_type in (('segment', 'TEXT'), ('segment_offset', 'INTEGER'),
+                                    ('segment_length', 'INTEGER'), ('object_store', 'TEXT'),
+                                    ('object_version', 'TEXT')):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE sessions ADD COLUMN {column} {column_type}')
+        # סשן ממנוע דמה (ivrit.ai בלי API, local) - נרשם ברשימות אבל לא באינדקסי החיפוש
+        if 'stand_in' not in columns:
+            cursor.execute('ALTER TABLE sessions ADD COLUMN stand_in INTEGER DEFAULT 0')
+        # המשתמש שתמלל את הסשן - החיפוש מוגבל לסשנים שלו. סשנים ישנים בלי משתמש לא נמצאים בחיפוש
+        if 'user_id' not in columns:
+            cursor.execute('ALTER TABLE sessions ADD COLUMN user_id INTEGER')
+            cursor.execute("DELETE FROM index_meta WHERE key = 'rebuilt_at'")
+        
+        # מזהה סשן קבוע -> מיקום הקובץ בחיפוש אחד, בלי לעבור על תיקיות המשתמשים
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_id
+            ON sessions (session_id)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sessions_patient_filename
+            ON sessions (patient_name, filename)
+        ''')
+        
+        # הסשנים החיים בכל מקטע - לדחיסה
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sessions_segment
+            ON sessions (segment)
+        ''')
+        
+        # חיפוש מלא בתמלולים - words: המילים המנורמלות, terms: גם בלי אותיות שימוש, body: הטקסט לקטעי תצוגה
+        # ה-rowid זהה ל-rowid של הסשן, והטריגר מוחק את השורה יחד עם הסשן
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'session_search'")
+        search_existed = cursor.fetchone() is not None
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS session_search
+                USING fts5(words, terms, body UNINDEXED, tokenize = 'unicode61')
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS sessions_search_delete AFTER DELETE ON sessions
+                BEGIN
+                    DELETE FROM session_search WHERE rowid = old.rowid;
+                END
+            ''')
+            self.search_available = True
+            if not search_existed:
+                cursor.execute("DELETE FROM index_meta WHERE key = 'rebuilt_at'")
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ חיפוש בתמלולים לא זמין (SQLite בלי FTS5): {e}")
+        
+        # אינדקס עיוור של סשנים מוצפנים - טוקני HMAC של המילים (ראה hebrew_search.blind_index), בלי טקסט
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blind_terms (
+                token TEXT NOT NULL,
+                session_rowid INTEGER NOT NULL,
+                PRIMARY KEY (token, session_rowid)
+            ) WITHOUT ROWID
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_blind_terms_session
+            ON blind_terms (session_rowid)
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS sessions_blind_delete AFTER DELETE ON sessions
+            BEGIN
+                DELETE FROM blind_terms WHERE session_rowid = old.rowid;
+            END
+        ''')
+        
+        cursor.execute("SELECT value FROM index_meta WHERE key = 'rebuilt_at'")
+        needs_rebuild = cursor.fetchone() is None
+        
+        conn.commit()
+        conn.close()
+        return needs_rebuild
+    
+    def _relative_parts(self, path):
+        """(נתיב יחסי, תיקיית משתמש, שם מטופל) - None אם הנתיב מחוץ לתיקיית התמלולים"""
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.transcripts_folder))
+        if relative == '.' or relative.startswith('..'):
+            return None
+        parts = relative.split(os.sep)
+        user_folder = parts[0] if len(parts) >= 2 else None
+        patient_name = parts[1] if len(parts) >= 3 else None
+        return relative, user_folder, patient_name
+    
+    def _session_row(self, session_file, session_data, location=None, object_store=None, object_version=None):
+        relative, user_folder, patient_name = self._relative_parts(session_file)
+        filename = os.path.basename(session_file)
+        return (
+            relative,
+            user_folder,
+            patient_name,
+            filename,
+            session_data.get('created_at') or created_at_from_filename(filename),
+            session_data.get('word_count', 0),
+            session_data.get('quality_mode'),
+            1 if session_data.get('is_encrypted') else 0,
+            session_data.get('session_date', ''),
+            session_data.get('audio_filename', ''),
+            session_data.get('session_id') or stable_session_id(relative),
+            *(location or (None, None, None)),
+            object_store,
+            object_version,
+            1 if session_data.get('stand_in') else 0,
+            session_data.get('user_id')
+        )
+    
+    def _insert_session(self, cursor, session_file, session_data, location=None, object_store=None,
+                        object_version=None):
+        """רישום סשן באינדקס - location הוא (מקטע, offset, אורך) לסשן שנשמר במקטע,
+        object_store שם האחסון לסשן שנשמר כאובייקט"""
+        row = self._session_row(session_file, session_data, location, object_store, object_version)
+        if row[1] and row[2]:
+            cursor.execute('INSERT OR IGNORE INTO patients (user_folder, patient_name) VALUES (?, ?)',
+                           (row[1], row[2]))
+        cursor.execute('''
+            INSERT OR REPLACE INTO sessions
+            (path, user_folder, patient_name, filename, created_at, word_count, quality_mode, is_encrypted,
+             session_date, audio_filename, session_id, segment, segment_offset, segment_length, object_store,
+             object_version, stand_in, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', row)
+        session_rowid = cursor.lastrowid
+        
+        # טקסט דמה לא נמצא בחיפוש כאילו היה תמלול אמיתי
+        if session_data.get('stand_in'):
+            return
+        
+        if session_data.get('blind_index'):
+            cursor.executemany('INSERT OR IGNORE INTO blind_terms (token, session_rowid) VALUES (?, ?)',
+                               [(token, session_rowid) for token in session_data['blind_index']])
+        
+        text = searchable_text(session_data) if self.search_available else None
+        if text:
+            words, terms = index_terms(text)
+            cursor.execute('INSERT INTO session_search (rowid, words, terms, body) VALUES (?, ?, ?, ?)',
+                           (session_rowid, words, terms, text))
+    
+    # --- כתיבה ומחיקה (הקובץ והאינדקס באותה טרנזקציה) ---
+    
+    def add_patient(self, patient_folder):
+        """רישום תיקיית מטופל שנוצרה"""
+        parts = self._relative_parts(patient_folder)
+        if not parts:
+            return
+        relative, user_folder, _ = parts
+        if len(relative.split(os.sep)) != 2:
+            return
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR IGNORE INTO patients (user_folder, patient_name) VALUES (?, ?)',
+                       (user_folder, os.path.basename(patient_folder)))
+        conn.commit()
+        conn.close()
+    
+    def save_session(self, session_file, session_data):
+        """כתיבה אטומית של קובץ סשן ורישומו באינדקס - אם אחד נכשל, אף אחד לא נשאר. מחזיר את מזהה הסשן"""
+        # המזהה נשמר גם בקובץ - כך הוא לא משתנה בבנייה מחדש של האינדקס
+        session_data.setdefault('session_id', uuid.uuid4().hex)
+        
+        # הכתיבה (קובץ זמני, קידוד למקטע או העלאת האובייקט) מקבילית - רק ה-fsync, שינוי השם וה-commit
+        # עוברים דרך הסבב הקבוצתי
+        pending = {
+            'session_file': session_file,
+            'temp_file': None,
+            'record': None,
+            'location': None,
+            'object_store': None,
+            'session_data': session_data,
+            'done': False,
+            'error': None
+        }
+        if self.object_store:
+            parts = self._relative_parts(session_file)
+            if not parts:
+                raise ValueError(f"נתיב סשן מחוץ לתיקיית התמלולים: {session_file}")
+            self.object_store.put(object_key(parts[0]), encode_session(session_data))
+            pending['object_store'] = self.object_store.name
+        elif self.storage == 'segments':
+            pending['record'] = encode_session(session_data)
+        else:
+            pending['temp_file'] = write_temp_session(session_file, session_data)
+        self._group_commit(pending)
+        
+        if pending['error']:
+            raise pending['error']
+        return session_data['session_id']
+    
+    def _group_commit(self, pending):
+        """ממתין שהשמירה תיכנס לסבב commit - השמירה הראשונה שמוצאת את התור פנוי מבצעת את הסבב לכולן"""
+        with self._commit_cond:
+            self._commit_pending.append(pending)
+        
+        while True:
+            with self._commit_cond:
+                while self._committing and not pending['done']:
+                    self._commit_cond.wait()
+                if pending['done']:
+                    return
+                self._committing = True
+                batch = self._commit_pending[:GROUP_COMMIT_MAX_BATCH]
+                del self._commit_pending[:GROUP_COMMIT_MAX_BATCH]
+            
+            try:
+                self._commit_batch(batch)
+            finally:
+                with self._commit_cond:
+                    self._committing = False
+                    for item in batch:
+                        item['done'] = True
+                    self._commit_cond.notify_all()
+    
+    def _commit_batch(self, batch):
+        """fsync לכל הקבצים הזמניים (או כתיבה אחת לכל מקטע), שינוי שם למקום, fsync לכל תיקייה ו-commit אחד"""
+        committed = []
+        for item in batch:
+            if item['temp_file'] is None:
+                continue
+            try:
+                fsync_file(item['temp_file'])
+                os.replace(item['temp_file'], item['session_file'])
+                committed.append(item)
+            except Exception as e:
+                item['error'] = e
+                if os.path.exists(item['temp_file']):
+                    os.remove(item['temp_file'])
+        
+        # שינויי השם נשמרים לפני ה-commit - קריסה ביניהם משאירה קובץ שלם שבנייה מחדש תמצא
+        for folder in {os.path.dirname(item['session_file']) or '.' for item in committed}:
+            fsync_directory(folder)
+        
+        committed.extend(self._append_segments([item for item in batch if item['record'] is not None]))
+        committed.extend(item for item in batch if item['object_store'])
+        
+        if not committed:
+            return
+        
+        conn = None
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            for item in committed:
+                self._insert_session(cursor, item['session_file'], item['session_data'], item['location'],
+                                     item['object_store'])
+            conn.commit()
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            for item in committed:
+                item['error'] = e
+        finally:
+            if conn:
+                conn.close()
+        
+        for item in committed:
+            if item['temp_file'] is None:
+                # רשומה שלא נכנסה לאינדקס נשארת במקטע עד הדחיסה, ואובייקט נמחק.
+                # אם הסשן היה קובץ (שמירה חוזרת) - עבר למקטע או לאחסון האובייקטים
+                if item['error']:
+                    if item['object_store']:
+                        self.object_store.delete(object_key(self._relative_parts(item['session_file'])[0]))
+                elif os.path.exists(item['session_file']):
+                    os.remove(item['session_file'])
+            elif item['error'] and os.path.exists(item['session_file']):
+                os.remove(item['session_file'])
+        
+        if len(batch) > 1:
+            print(f"💾 commit קבוצתי: {len(batch)} סשנים נשמרו יחד")
+    
+    def _append_segments(self, items):
+        """הוספת הסשנים למקטעים - כתיבה אחת ו-fsync אחד לכל משתמש. מחזיר את אלה שנכתבו"""
+        by_user = {}
+        for item in items:
+            parts = self._relative_parts(item['session_file'])
+            if not parts or not parts[1]:
+                item['error'] = ValueError(f"נתיב סשן מחוץ לתיקיית משתמש: {item['session_file']}")
+                continue
+            item['relative'] = parts[0]
+            by_user.setdefault(parts[1], []).append(item)
+        
+        appended = []
+        for user_folder, user_items in by_user.items():
+            try:
+                locations = self.segments.append(user_folder,
+                                                 [(item['relative'], item['record']) for item in user_items])
+            except Exception as e:
+                for item in user_items:
+                    item['error'] = e
+                continue
+            for item, location in zip(user_items, locations):
+                item['location'] = location
+                appended.append(item)
+        return appended
+    
+    def delete_session(self, session_file):
+        """מחיקת קובץ סשן והסרתו מהאינדקס"""
+        parts = self._relative_parts(session_file)
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            segment, store_name = None, None
+            if parts:
+                cursor.execute('SELECT segment, object_store FROM sessions WHERE path = ?', (parts[0],))
+                row = cursor.fetchone()
+                segment, store_name = row if row else (None, None)
+                cursor.execute('DELETE FROM sessions WHERE path = ?', (parts[0],))
+            if store_name:
+                self._object_store(store_name).delete(object_key(parts[0]))
+            elif segment:
+                # במקטע נרשמת רשומת מחיקה (לבנייה מחדש), והמקום עצמו מתפנה בדחיסה
+                self.segments.append(parts[1], [(parts[0], None)])
+            else:
+                os.remove(session_file)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def delete_patient(self, patient_folder):
+        """מחיקת תיקיית מטופל וכל הסשנים שלה - מחזיר כמה סשנים נמחקו מהאינדקס"""
+        parts = self._relative_parts(patient_folder)
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            deleted = 0
+            if parts:
+                self._delete_stored_prefix(cursor, parts[0])
+                deleted = self._delete_prefix(cursor, parts[0])
+            if os.path.isdir(patient_folder):
+                shutil.rmtree(patient_folder)
+            conn.commit()
+            return deleted
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def migrate_session(self, session_file):
+        """המרת סשן JSON ישן לפורמט v2 ועדכון האינדקס - מחזיר (נתיב חדש, גודל לפני, גודל אחרי) או None"""
+        parts = self._relative_parts(session_file)
+        if not parts:
+            return None
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT session_id FROM sessions WHERE path = ?', (parts[0],))
+            row = cursor.fetchone()
+            session_id = row[0] if row and row[0] else stable_session_id(parts[0])
+            
+            result = migrate_file(session_file, session_id=session_id, remove_original=False)
+            if not result:
+                return None
+            new_file, old_size, new_size, session_data = result
+            
+            cursor.execute('DELETE FROM sessions WHERE path = ?', (parts[0],))
+            self._insert_session(cursor, new_file, session_data)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        # הקובץ הישן נמחק רק אחרי שהאינדקס מצביע על החדש - קוראים בזמן ההמרה לא נתקעים
+        os.remove(session_file)
+        return new_file, old_size, new_size
+    
+    def _delete_stored_prefix(self, cursor, relative):
+        """מחיקת הסשנים שמתחת לנתיב יחסי ונשמרו במקטעים (רשומות מחיקה) או כאובייקטים -
+        מה שלא נמחק שם חוזר בבנייה מחדש"""
+        prefix = relative + os.sep
+        cursor.execute('''
+            SELECT user_folder, path, segment, object_store FROM sessions
+            WHERE substr(path, 1, ?) = ? AND (segment IS NOT NULL OR object_store IS NOT NULL)
+        ''', (len(prefix), prefix))
+        by_user = {}
+        for user_folder, path, segment, store_name in cursor.fetchall():
+            if store_name:
+                self._object_store(store_name).delete(object_key(path))
+            else:
+                by_user.setdefault(user_folder, []).append((path, None))
+        for user_folder, records in by_user.items():
+            self.segments.append(user_folder, records)
+    
+    def _delete_prefix(self, cursor, relative):
+        """הסרת כל מה שמתחת לנתיב יחסי (תיקיית משתמש או מטופל) מהאינדקס"""
+        parts = relative.split(os.sep)
+        prefix = relative + os.sep
+        cursor.execute('DELETE FROM sessions WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+        deleted = cursor.rowcount
+        if len(parts) == 1:
+            cursor.execute('DELETE FROM patients WHERE user_folder = ?', (parts[0],))
+        elif len(parts) == 2:
+            cursor.execute('DELETE FROM patients WHERE user_folder = ? AND patient_name = ?',
+                           (parts[0], parts[1]))
+        return deleted
+    
+    # --- שאילתות ---
+    
+    def _location(self, row):
+        if not row:
+            return None
+        return {
+            'session_id': row[0],
+            'path': os.path.join(self.transcripts_folder, row[1]),
+            'user_folder': row[2],
+            'patient_name': row[3],
+            'filename': row[4]
+        }
+    
+    def resolve(self, session_id):
+        """מיקום סשן לפי המזהה שלו, או None"""
+        location = self._resolve(session_id)
+        if location is None and self._sync_on_miss():
+            # אולי שרת אחר שמר אותו באחסון המשותף
+            location = self._resolve(session_id)
+        return location
+    
+    def _resolve(self, session_id):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT session_id, path, user_folder, patient_name, filename FROM sessions WHERE session_id = ?
+        ''', (session_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return self._location(row)
+    
+    def find_session(self, patient_name, filename):
+        """מיקום סשן לפי שם מטופל ושם קובץ (הכתובות הישנות), או None"""
+        location = self._find_session(patient_name, filename)
+        if location is None and self._sync_on_miss():
+            location = self._find_session(patient_name, filename)
+        return location
+    
+    def _find_session(self, patient_name, filename):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT session_id, path, user_folder, patient_name, filename FROM sessions
+            WHERE patient_name = ? AND filename = ? ORDER BY user_folder LIMIT 1
+        ''', (patient_name, filename))
+        row = cursor.fetchone()
+        conn.close()
+        return self._location(row)
+    
+    def _stored_location(self, relative):
+        """(מקטע, offset, אורך, אחסון אובייקטים) של סשן שלא נשמר כקובץ, או None"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT segment, segment_offset, segment_length, object_store FROM sessions
+            WHERE path = ? AND (segment IS NOT NULL OR object_store IS NOT NULL)
+        ''', (relative,))
+        row = cursor.fetchone()
+        conn.close()
+        return row
+    
+    def _object_store(self, name):
+        """אחסון האובייקטים שבו נשמר סשן - רק זה שמוגדר בשרת הזה נגיש"""
+        if not self.object_store or self.object_store.name != name:
+            raise OSError(f"הסשן נשמר באחסון {name}, שלא מוגדר בשרת הזה (SESSION_STORAGE)")
+        return self.object_store
+    
+    def read_session(self, session_file):
+        """קריאת סשן מלא - מאחסון האובייקטים, מהמקטע (mmap, בלי להעתיק את הגוף) לפי האינדקס, או מהקובץ"""
+        parts = self._relative_parts(session_file)
+        for attempt in range(2):
+            stored = self._stored_location(parts[0]) if parts else None
+            if not stored:
+                return read_session(session_file)
+            if stored[3]:
+                return decode_session(self._object_store(stored[3]).get(object_key(parts[0])))
+            try:
+                with self.segments.view(*stored[:3]) as value:
+                    return decode_session(value)
+            except FileNotFoundError:
+                # המקטע נדחס ונמחק בין הקריאה מהאינדקס לפתיחה - המיקום החדש כבר באינדקס
+                if attempt:
+                    raise
+    
+    def session_exists(self, session_file):
+        """האם הסשן קיים - במקטע או באחסון האובייקטים לפי האינדקס, או כקובץ"""
+        parts = self._relative_parts(session_file)
+        if parts and self._stored_location(parts[0]):
+            return True
+        return os.path.isfile(session_file)
+    
+    def count_patients(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM patients')
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    def count_sessions(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM sessions')
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    def patient_exists(self, patient_name, user_id=None):
+        """האם יש מטופל בשם הזה אצל משתמש כלשהו - עם user_id, רק אם המשתמש תמלל לו סשן"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        if user_id is None:
+            cursor.execute('SELECT user_folder FROM patients WHERE patient_name = ? LIMIT 1', (patient_name,))
+        else:
+            cursor.execute('SELECT user_folder FROM sessions WHERE patient_name = ? AND user_id = ? LIMIT 1',
+                           (patient_name, user_id))
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else None
+    
+    def list_patients(self):
+        """כל המטופלים עם מספר הסשנים של כל אחד"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT p.user_folder, p.patient_name, COUNT(s.path)
+            FROM patients p
+            LEFT JOIN sessions s ON s.user_folder = p.user_folder AND s.patient_name = p.patient_name
+            GROUP BY p.user_folder, p.patient_name
+            ORDER BY p.user_folder, p.patient_name
+        ''')
+        patients = [{'user_folder': user_folder, 'name': name, 'session_count': count}
+                    for user_folder, name, count in cursor.fetchall()]
+        conn.close()
+        return patients
+    
+    def list_sessions(self, user_folder, patient_name, limit=DEFAULT_PAGE_SIZE, cursor=None,
+                      date_from=None, date_to=None, user_id=None):
+        """עמוד של מטא-דאטה של סשנים (החדשים ראשונים) - מחזיר (סשנים, cursor לעמוד הבא או None)"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions = ['user_folder = ?', 'patient_name = ?']
+        params = [user_folder, patient_name]
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        
+        # date_from/date_to - תאריכים (YYYY-MM-DD), כולל שני הקצוות
+        if date_from:
+            conditions.append('created_at >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append('created_at < ?')
+            params.append(date_to + '\uffff')
+        
+        # keyset pagination - ממשיכים מהסשן האחרון בעמוד הקודם, בלי OFFSET
+        if cursor:
+            last_created_at, last_path = decode_cursor(cursor)
+            conditions.append('(created_at < ? OR (created_at = ? AND path < ?))')
+            params.extend([last_created_at, last_created_at, last_path])
+        
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        db_cursor = conn.cursor()
+        db_cursor.execute(f'''
+            SELECT path, session_id, filename, created_at, word_count, quality_mode, is_encrypted, session_date,
+                   audio_filename
+            FROM sessions WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, path DESC LIMIT ?
+        ''', params + [limit + 1])
+        rows = db_cursor.fetchall()
+        conn.close()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['path'])
+        
+        sessions = [{
+            'session_id': row['session_id'],
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'session_date': row['session_date'] or '',
+            'word_count': row['word_count'] or 0,
+            'quality_mode': row['quality_mode'],
+            'is_encrypted': bool(row['is_encrypted']),
+            'audio_filename': row['audio_filename'] or ''
+        } for row in rows]
+        return sessions, next_cursor
+    
+    def search(self, query, user_folder=None, patient_name=None, limit=DEFAULT_SEARCH_LIMIT, user_id=None):
+        """חיפוש מלא בתמלולים הגלויים - הסשנים המתאימים ביותר ראשונים, עם קטע טקסט סביב ההתאמות"""
+        terms = query_terms(query)
+        match = fts_query(terms)
+        if not match or not self.search_available:
+            return []
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+        
+        conditions = ['session_search MATCH ?']
+        params = [match]
+        if user_folder:
+            conditions.append('s.user_folder = ?')
+            params.append(user_folder)
+        if user_id is not None:
+            conditions.append('s.user_id = ?')
+            params.append(user_id)
+        if patient_name:
+            conditions.append('s.patient_name = ?')
+            params.append(patient_name)
+        
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT s.rowid AS search_rowid, s.session_id, s.patient_name, s.filename, s.created_at,
+                   s.session_date, s.word_count, bm25(session_search) AS score
+            FROM session_search JOIN sessions s ON s.rowid = session_search.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY score LIMIT ?
+        ''', params + [limit])
+        rows = cursor.fetchall()
+        
+        # הטקסט המלא נקרא רק לתוצאות שנבחרו - לא לכל הסשנים שהתאימו
+        bodies = {}
+        if rows:
+            rowids = [row['search_rowid'] for row in rows]
+            cursor.execute(f'''
+                SELECT rowid, body FROM session_search WHERE rowid IN ({', '.join('?' * len(rowids))})
+            ''', rowids)
+            bodies = dict(cursor.fetchall())
+        conn.close()
+        
+        return [{
+            'session_id': row['session_id'],
+            'patient_name': row['patient_name'],
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'session_date': row['session_date'] or '',
+            'word_count': row['word_count'] or 0,
+            # bm25 שלילי - גבוה יותר = מתאים יותר
+            'score': round(-row['score'], 3),
+            'snippet': snippet(bodies.get(row['search_rowid'], ''), terms)
+        } for row in rows]
+    
+    def blind_search(self, token_groups, user_folder=None, patient_name=None, limit=DEFAULT_SEARCH_LIMIT,
+                     user_id=None):
+        """חיפוש בסשנים מוצפנים לפי טוקני HMAC - כל מילה בשאילתה (באחת מהצורות שלה) חייבת להופיע"""
+        if not token_groups:
+            return []
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+        
+        conditions = []
+        params = []
+        for tokens in token_groups:
+            conditions.append(f"rowid IN (SELECT session_rowid FROM blind_terms WHERE token IN "
+                              f"({', '.join('?' * len(tokens))}))")
+            params.extend(tokens)
+        if user_folder:
+            conditions.append('user_folder = ?')
+            params.append(user_folder)
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if patient_name:
+            conditions.append('patient_name = ?')
+            params.append(patient_name)
+        
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        # אין תדירויות באינדקס העיוור - התוצאות לפי תאריך, החדשות ראשונות
+        cursor.execute(f'''
+            SELECT session_id, patient_name, filename, created_at, session_date, word_count
+            FROM sessions WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, path DESC LIMIT ?
+        ''', params + [limit])
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [{
+            'session_id': row['session_id'],
+            'patient_name': row['patient_name'],
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'session_date': row['session_date'] or '',
+            'word_count': row['word_count'] or 0
+        } for row in rows]
+    
+    def sessions_without_blind_index(self, user_id=None):
+        """סשנים מוצפנים שנשמרו לפני האינדקס העיוור - נתיבים מלאים (עם user_id - רק של המשתמש)"""
+        conditions = ['is_encrypted = 1', 'stand_in = 0', 'rowid NOT IN (SELECT session_rowid FROM blind_terms)']
+        params = []
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT path FROM sessions WHERE {' AND '.join(conditions)}
+        ''', params)
+        paths = [os.path.join(self.transcripts_folder, row[0]) for row in cursor.fetchall()]
+        conn.close()
+        return paths
+    
+    def count_patient_sessions(self, user_folder, patient_name):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM sessions WHERE user_folder = ? AND patient_name = ?',
+                       (user_folder, patient_name))
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    # --- סנכרון עם הדיסק ---
+    
+    def rebuild(self):
+        """סריקה מלאה של תיקיית התמלולים ובניית האינדקס מחדש - מחזיר (מטופלים, סשנים)"""
+        patients = set()
+        sessions = []
+        
+        if os.path.exists(self.transcripts_folder):
+            for root, dirs, files in os.walk(self.transcripts_folder):
+                # המקטעים נסרקים בנפרד - זו לא תיקיית מטופל
+                dirs[:] = [name for name in dirs if name != SEGMENTS_FOLDER]
+                relative = os.path.relpath(root, self.transcripts_folder)
+                parts = [] if relative == '.' else relative.split(os.sep)
+                # מטופלים - תיקיות בתוך user_X
+                if len(parts) == 1 and parts[0].startswith('user_'):
+                    patients.update((parts[0], name) for name in dirs)
+                
+                for file in files:
+                    if is_session_file(file):
+                        sessions.append(os.path.join(root, file))
+        segment_sessions = self._scan_segments()
+        # באחסון משותף - כל הסשנים שבו, גם אלה ששרתים אחרים שמרו
+        objects = self.object_store.list_objects() if self.object_store else []
+        object_keys = [info['key'] for info in objects]
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            if self.search_available:
+                cursor.execute('DELETE FROM session_search')
+            cursor.execute('DELETE FROM blind_terms')
+            cursor.execute('DELETE FROM sessions')
+            cursor.execute('DELETE FROM patients')
+            cursor.executemany('INSERT INTO patients (user_folder, patient_name) VALUES (?, ?)',
+                               sorted(patients))
+            # הקבצים נקראים אחד-אחד בתוך הטרנזקציה - בלי להחזיק את כל התמלולים בזיכרון
+            for session_file in sessions:
+                self._insert_session(cursor, session_file, self._read_session(session_file))
+            # סשן שנמצא גם כקובץ וגם במקטע - המקטע נכתב אחרון
+            for relative, location in segment_sessions.items():
+                session_file = os.path.join(self.transcripts_folder, relative)
+                self._insert_session(cursor, session_file, self._read_session(session_file, location), location)
+            for info in objects:
+                session_file = os.path.join(self.transcripts_folder, *info['key'].split('/'))
+                session_data = self._read_session(session_file, object_key=info['key'])
+                self._insert_session(cursor, session_file, session_data, object_store=self.object_store.name,
+                                     object_version=object_version(info))
+            cursor.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('rebuilt_at', ?)",
+                           (datetime.datetime.now().isoformat(),))
+            # כולל מטופלים שיש להם סשנים במקטעים או באחסון האובייקטים בלי תיקייה בשרת הזה
+            cursor.execute('SELECT COUNT(*) FROM patients')
+            patient_count = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        total = len(set(sessions)
+                    | {os.path.join(self.transcripts_folder, relative) for relative in segment_sessions}
+                    | {os.path.join(self.transcripts_folder, *key.split('/')) for key in object_keys})
+        print(f"🗂️ אינדקס הסשנים נבנה מחדש: {patient_count} מטופלים, {total} סשנים")
+        return patient_count, total
+    
+    def _scan_segments(self):
+        """המצב האחרון של כל סשן במקטעים - {נתיב יחסי: (מקטע, offset, אורך)}. רשומת מחיקה מבטלת את מה שלפניה"""
+        live = {}
+        for user_folder in self.segments.users():
+            for segment in self.segments.segments(user_folder):
+                for flags, key, offset, length in self.segments.scan(segment):
+                    if flags == RECORD_TOMBSTONE:
+                        live.pop(key, None)
+                    else:
+                        live[key] = (segment, offset, length)
+        return live
+    
+    def _read_session(self, session_file, location=None, object_key=None):
+        """תוכן סשן - קובץ, מקטע או אובייקט (למטא-דאטה ולאינדקס החיפוש). סשן פגום נספר כסשן בלי פרטים"""
+        try:
+            if object_key:
+                session_data = decode_session(self.object_store.get(object_key))
+            elif location:
+                with self.segments.view(*location) as value:
+                    session_data = decode_session(value)
+            else:
+                session_data = read_session(session_file)
+            return session_data if isinstance(session_data, dict) else {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ קובץ סשן לא קריא {session_file}: {e}")
+            return {}
+    
+    def sync_object_store(self):
+        """סנכרון האינדקס עם אחסון האובייקטים המשותף - סשנים ששרתים אחרים שמרו, שינו או מחקו.
+        מחזיר (נוספו או עודכנו, הוסרו)"""
+        if not self.object_store:
+            return 0, 0
+        
+        with self._store_sync_lock:
+            self._store_synced_at = time.monotonic()
+            listed = {info['key']: object_version(info) for info in self.object_store.list_objects()}
+            
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('SELECT path, object_version FROM sessions WHERE object_store = ?',
+                           (self.object_store.name,))
+            indexed = {object_key(path): version for path, version in cursor.fetchall()}
+            conn.close()
+            
+            # גרסה NULL - השרת הזה שמר את הסשן, והאינדקס כבר מכיל את התוכן. רק רושמים את הגרסה
+            changed = [key for key, version in listed.items()
+                       if key not in indexed or (indexed[key] is not None and indexed[key] != version)]
+            unversioned = [key for key, version in indexed.items() if version is None and key in listed]
+            # מפתח שלא הופיע ברשימה נבדק שוב - אולי נשמר כאן אחרי שהרשימה נקראה
+            removed = [key for key in indexed if key not in listed and self.object_store.stat(key) is None]
+            
+            # התוכן נקרא לפני הטרנזקציה - לא מחזיקים את נעילת הכתיבה בזמן ההורדה
+            updates = []
+            for key in changed:
+                try:
+                    session_data = decode_session(self.object_store.get(key))
+                except FileNotFoundError:
+                    # נמחק בין הרשימה לקריאה - יוסר בסנכרון הבא
+                    continue
+                except ValueError as e:
+                    print(f"⚠️ סשן לא קריא באחסון המשותף {key}: {e}")
+                    session_data = {}
+                updates.append((key, session_data if isinstance(session_data, dict) else {}))
+            
+            if not updates and not unversioned and not removed:
+                return 0, 0
+            
+            conn = self._connect()
+            cursor = conn.cursor()
+            try:
+                for key, session_data in updates:
+                    session_file = os.path.join(self.transcripts_folder, *key.split('/'))
+                    self._insert_session(cursor, session_file, session_data,
+                                         object_store=self.object_store.name, object_version=listed[key])
+                cursor.executemany('''
+                    UPDATE sessions SET object_version = ? WHERE path = ? AND object_version IS NULL
+                ''', [(listed[key], os.path.join(*key.split('/'))) for key in unversioned])
+                
+                patients = set()
+                for key in removed:
+                    cursor.execute('DELETE FROM sessions WHERE path = ? AND object_store = ?',
+                                   (os.path.join(*key.split('/')), self.object_store.name))
+                    parts = key.split('/')
+                    if len(parts) >= 3:
+                        patients.add((parts[0], parts[1]))
+                # מטופל שנמחק בשרת אחר - בלי סשנים ובלי תיקייה בשרת הזה
+                for user_folder, patient_name in patients:
+                    cursor.execute('SELECT 1 FROM sessions WHERE user_folder = ? AND patient_name = ? LIMIT 1',
+                                   (user_folder, patient_name))
+                    if (not cursor.fetchone()
+                            and not os.path.isdir(os.path.join(self.transcripts_folder, user_folder, patient_name))):
+                        cursor.execute('DELETE FROM patients WHERE user_folder = ? AND patient_name = ?',
+                                       (user_folder, patient_name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        
+        if updates or removed:
+            print(f"🔄 אינדקס הסשנים סונכרן עם {self.object_store.name}: "
+                  f"{len(updates)} נוספו או עודכנו, {len(removed)} הוסרו")
+        return len(updates), len(removed)
+    
+    def _sync_on_miss(self):
+        """סנכרון מיידי כשמשהו לא נמצא באינדקס - רק עם אחסון משותף, ולא יותר מפעם ב-MIN שניות"""
+        if not self.object_store:
+            return False
+        if time.monotonic() - self._store_synced_at < STORE_SYNC_MIN_INTERVAL_SECONDS:
+            return False
+        try:
+            self.sync_object_store()
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"⚠️ שגיאה בסנכרון אינדקס הסשנים: {e}")
+            return False
+        return True
+    
+    def start_store_sync(self, interval=STORE_SYNC_INTERVAL_SECONDS):
+        """סנכרון ברקע עם אחסון האובייקטים כל interval שניות - כל תהליך מעדכן את האינדקס שלו"""
+        if not self.object_store:
+            return False
+        
+        with self._store_sync_thread_lock:
+            if self._store_sync_pid == os.getpid() and self._store_sync and self._store_sync.is_alive():
+                return True
+            
+            self._store_sync_stop = threading.Event()
+            self._store_sync = threading.Thread(target=self._store_sync_loop,
+                                                args=(interval, self._store_sync_stop),
+                                                daemon=True, name='session-store-sync')
+            self._store_sync.start()
+            self._store_sync_pid = os.getpid()
+        
+        print(f"🔄 סנכרון אינדקס הסשנים עם {self.object_store.name} הופעל (כל {interval} שניות)")
+        return True
+    
+    def stop_store_sync(self):
+        with self._store_sync_thread_lock:
+            self._store_sync_stop.set()
+            if self._store_sync:
+                self._store_sync.join(timeout=5)
+                self._store_sync = None
+    
+    def _store_sync_loop(self, interval, stop_event):
+        while not stop_event.wait(interval):
+            try:
+                self.sync_object_store()
+            except (sqlite3.Error, OSError, ValueError) as e:
+                print(f"⚠️ שגיאה בסנכרון אינדקס הסשנים: {e}")
+    
+    def sync_path(self, path):
+        """עדכון האינדקס לפי המצב בדיסק של נתיב אחד (קובץ סשן, תיקיית מטופל או משתמש)"""
+        parts = self._relative_parts(path)
+        if not parts:
+            return
+        relative, user_folder, _ = parts
+        depth = len(relative.split(os.sep))
+        if SEGMENTS_FOLDER in relative.split(os.sep):
+            return
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            if is_session_file(relative) and os.path.isfile(path):
+                self._insert_session(cursor, path, self._read_session(path))
+            elif os.path.isdir(path):
+                if depth == 2 and user_folder.startswith('user_'):
+                    cursor.execute('INSERT OR IGNORE INTO patients (user_folder, patient_name) VALUES (?, ?)',
+                                   (user_folder, os.path.basename(path)))
+            elif is_session_file(relative):
+                # קובץ שנמחק אחרי שהסשן עבר למקטע או לאחסון האובייקטים - הסשן עצמו לא נמחק
+                cursor.execute('DELETE FROM sessions WHERE path = ? AND segment IS NULL AND object_store IS NULL',
+                               (relative,))
+            elif not os.path.exists(path):
+                self._delete_prefix(cursor, relative)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def start_watcher(self):
+        """מעקב אחרי שינויים ידניים בתיקיית התמלולים (inotify דרך watchdog) - מחזיר True אם הופעל"""
+        if not WATCHDOG_AVAILABLE:
+            print("⚠️ מעקב אחרי תיקיית התמלולים כבוי - חסרה ספריית watchdog")
+            return False
+        
+        with self._observer_lock:
+            # threads לא שורדים fork - כל תהליך מפעיל observer משלו
+            if self._observer_pid == os.getpid() and self._observer and self._observer.is_alive():
+                return True
+            
+            os.makedirs(self.transcripts_folder, exist_ok=True)
+            self._observer = Observer()
+            self._observer.daemon = True
+            self._observer.schedule(_TranscriptsEventHandler(self), self.transcripts_folder, recursive=True)
+            self._observer.start()
+            self._observer_pid = os.getpid()
+        
+        print(f"👀 מעקב אחרי {self.transcripts_folder} הופעל")
+        return True
+    
+    def stop_watcher(self):
+        with self._observer_lock:
+            if self._observer:
+                self._observer.stop()
+                self._observer.join(timeout=5)
+                self._observer = None
+    
+    # --- דחיסת מקטעים ---
+    
+    def compact_segments(self):
+        """דחיסת מקטעים סגורים שרובם סשנים שנמחקו - מחזיר כמה בתים התפנו"""
+        reclaimed = 0
+        for user_folder in self.segments.users():
+            with self.segments.compaction_lock(user_folder) as acquired:
+                # תהליך אחר כבר דוחס את המשתמש הזה
+                if acquired:
+                    reclaimed += self._compact_user(user_folder)
+        return reclaimed
+    
+    def _compact_user(self, user_folder):
+        # המקטע האחרון פעיל - לא נדחס
+        sealed = self.segments.segments(user_folder)[:-1]
+        if not sealed:
+            return 0
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT segment, SUM(segment_length) FROM sessions
+            WHERE user_folder = ? AND segment IS NOT NULL GROUP BY segment
+        ''', (user_folder,))
+        live_bytes = dict(cursor.fetchall())
+        conn.close()
+        
+        reclaimed = 0
+        older_kept = False
+        now = time.time()
+        for segment in sealed:
+            segment_file = self.segments.segment_path(segment)
+            size = os.path.getsize(segment_file)
+            if (now - os.path.getmtime(segment_file) < COMPACT_MIN_AGE_SECONDS
+                    or (size and (live_bytes.get(segment) or 0) / size >= COMPACT_LIVE_RATIO)):
+                older_kept = True
+                continue
+            # רשומות מחיקה נחוצות רק כל עוד יש מקטע ישן יותר שאולי מכיל את הסשן שנמחק
+            freed = self._compact_segment(user_folder, segment, keep_tombstones=older_kept)
+            if freed is None:
+                older_kept = True
+            else:
+                reclaimed += freed
+        return reclaimed
+    
+    def _compact_segment(self, user_folder, segment, keep_tombstones):
+        """העתקת הסשנים החיים של מקטע לסוף המקטע הפעיל, עדכון האינדקס ומחיקת המקטע - מחזיר בתים שהתפנו"""
+        size = os.path.getsize(self.segments.segment_path(segment))
+        records = self.segments.scan(segment)
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT path, segment_offset FROM sessions WHERE segment = ?', (segment,))
+            live = dict(cursor.fetchall())
+            
+            copies = []
+            for flags, key, offset, length in records:
+                if flags == RECORD_PUT and live.get(key) == offset:
+                    copies.append((key, offset, length))
+                elif flags == RECORD_TOMBSTONE and keep_tombstones:
+                    # סשן שנשמר מחדש אחרי המחיקה - רשומת המחיקה כבר לא רלוונטית
+                    cursor.execute('SELECT 1 FROM sessions WHERE path = ?', (key,))
+                    if not cursor.fetchone():
+                        copies.append((key, offset, None))
+            
+            locations = self.segments.copy(segment, user_folder, copies)
+            # רק סשן שעדיין במקום הישן עובר - אם נמחק או נשמר מחדש בינתיים, העותק נשאר כזבל לדחיסה הבאה
+            for (key, offset, length), location in zip(copies, locations):
+                if length is not None:
+                    cursor.execute('''
+                        UPDATE sessions SET segment = ?, segment_offset = ?, segment_length = ?
+                        WHERE path = ? AND segment = ? AND segment_offset = ?
+                    ''', (*location, key, segment, offset))
+            conn.commit()
+            
+            cursor.execute('SELECT COUNT(*) FROM sessions WHERE segment = ?', (segment,))
+            if cursor.fetchone()[0]:
+                return None
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        self.segments.remove_segment(segment)
+        copied = sum(length for _, _, length in copies if length is not None)
+        print(f"🧹 מקטע {segment} נדחס: {len(copies)} רשומות הועתקו, {(size - copied) // 1024}KB התפנו")
+        return size - copied
+    
+    def start_compactor(self, interval=COMPACT_INTERVAL_SECONDS):
+        """דחיסת מקטעים ברקע כל interval שניות (כל תהליך מפעיל thread משלו, והנעילה בוחרת אחד לכל משתמש)"""
+        with self._compactor_lock:
+            if self._compactor_pid == os.getpid() and self._compactor and self._compactor.is_alive():
+                return True
+            
+            self._compactor_stop = threading.Event()
+            self._compactor = threading.Thread(target=self._compact_loop, args=(interval, self._compactor_stop),
+                                               daemon=True, name='segment-compactor')
+            self._compactor.start()
+            self._compactor_pid = os.getpid()
+        
+        print(f"🧹 דחיסת מקטעים ברקע הופעלה (כל {interval} שניות)")
+        return True
+    
+    def stop_compactor(self):
+        with self._compactor_lock:
+            self._compactor_stop.set()
+            if self._compactor:
+                self._compactor.join(timeout=5)
+                self._compactor = None
+    
+    def _compact_loop(self, interval, stop_event):
+        while not stop_event.wait(interval):
+            try:
+                self.compact_segments()
+            except (sqlite3.Error, OSError, ValueError) as e:
+                print(f"⚠️ שגיאה בדחיסת מקטעים: {e}")
+
+
+def object_version(info):
+    """גרסת אובייקט מתוך ה-stat שלו - משתנה בכל שמירה מחדש"""
+    return f"{info['size']}:{info['modified']}:{info.get('etag', '')}"
+
+
+def object_key(relative_path):
+    """מפתח הסשן באחסון האובייקטים - הנתיב היחסי עם /"""
+    return relative_path.replace(os.sep, '/')
+
+
+def created_at_from_filename(filename):
+    """זמן יצירה (ISO) מתוך שם קובץ סשן, או מחרוזת ריקה"""
+    match = SESSION_FILENAME_TIMESTAMP.search(filename)
+    if not match:
+        return ''
+    date, hours, minutes, seconds = match.groups()
+    return f"{date}T{hours}:{minutes}:{seconds}"
+
+
+def stable_session_id(relative_path):
+    """מזהה לסשן ישן שנשמר בלי session_id - נגזר מהנתיב, כך שהוא זהה בכל בנייה מחדש"""
+    return hashlib.sha256(relative_path.encode('utf-8')).hexdigest()[:32]
+
+
+def encode_cursor(created_at, path):
+    return base64.urlsafe_b64encode(json.dumps([created_at, path]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(created_at, path) של הסשן האחרון בעמוד הקודם - ValueError אם ה-cursor לא תקין"""
+    try:
+        created_at, path = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"cursor לא תקין: {e}")
+    return created_at, path
+
+
+class _TranscriptsEventHandler(FileSystemEventHandler):
+    """כל שינוי בדיסק מסונכרן לאינדקס - כולל שינויים שלנו, שהעדכון שלהם אידמפוטנטי"""
+    
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+    
+    def _sync(self, path):
+        try:
+            self.index.sync_path(path)
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ שגיאה בעדכון אינדקס הסשנים עבור {path}: {e}")
+    
+    def on_created(self, event):
+        self._sync(event.src_path)
+    
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._sync(event.src_path)
+    
+    def on_deleted(self, event):
+        self._sync(event.src_path)
+    
+    def on_moved(self, event):
+        self._sync(event.src_path)
+        self._sync(event.dest_path)
+
+
+def main():
+    """בנייה מחדש של האינדקס מהדיסק או דחיסת מקטעים: python session_index.py rebuild|compact [תיקייה] [אינדקס]"""
+    if len(sys.argv) < 2 or sys.argv[1] not in ('rebuild', 'compact'):
+        print("🗂️ אינדקס סשנים")
+        print("שימוש:")
+        print("  python session_index.py rebuild [transcripts] [session_index.db]")
+        print("  python session_index.py compact [transcripts] [session_index.db]")
+        sys.exit(1)
+    
+    transcripts_folder = sys.argv[2] if len(sys.argv) > 2 else 'transcripts'
+    db_path = sys.argv[3] if len(sys.argv) > 3 else 'session_index.db'
+    
+    # אותו אחסון כמו בשרת (app.py) - בנייה מחדש באחסון משותף קוראת את כל הסשנים ממנו
+    index = SessionIndex(transcripts_folder, db_path, auto_rebuild=False,
+                         storage=os.getenv('SESSION_STORAGE', 'files').lower())
+    if sys.argv[1] == 'rebuild':
+        index.rebuild()
+    else:
+        print(f"🧹 התפנו {index.compact_segments() // 1024}KB")
+
+
+if __name__ == "__main__":
+    main()
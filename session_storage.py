@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+# session_storage.py - אחסון סשנים מאחורי ממשק אחיד (put, get, list, delete, stat): דיסק מקומי, SQLite או S3
+import os
+import re
+import hmac
+import uuid
+import sqlite3
+import hashlib
+import datetime
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import quote, unquote, urlsplit, parse_qs
+from session_format import fsync_file, fsync_directory
+from sqlite_pool import connect_db
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+# אובייקט גדול מזה עולה ב-multipart - חלקים במקביל (S3 דורש לפחות 5MB לחלק, חוץ מהאחרון)
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+# חיבורים פתוחים לשרת ה-S3 (וגם מספר החלקים שעולים במקביל)
+S3_MAX_CONNECTIONS = 8
+S3_TIMEOUT_SECONDS = 60
+S3_LIST_PAGE_SIZE = 1000
+S3_XML_NAMESPACE = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class StorageBackend:
+    """ממשק בסיס לאחסון סשנים - מפתחות הם נתיבים יחסיים עם / (user_1/מטופל/session_....sess)"""
+    
+    name = None
+    
+    def put(self, key: str, data: bytes):
+        """שמירת אובייקט (מחליף אובייקט קיים באותו מפתח) - כשהפונקציה חוזרת, הנתונים שמורים"""
+        raise NotImplementedError
+    
+    def get(self, key: str) -> bytes:
+        """תוכן האובייקט - FileNotFoundError אם אין כזה"""
+        raise NotImplementedError
+    
+    def list_keys(self, prefix: str = ''):
+        """כל המפתחות שמתחילים ב-prefix, ממוינים"""
+        raise NotImplementedError
+    
+    def delete(self, key: str):
+        """מחיקת אובייקט - מפתח שלא קיים לא נחשב שגיאה"""
+        raise NotImplementedError
+    
+    def stat(self, key: str):
+        """{'key', 'size', 'modified'} של האובייקט, או None אם אין כזה"""
+        raise NotImplementedError
+    
+    def list_objects(self, prefix: str = ''):
+        """stat של כל האובייקטים שמתחילים ב-prefix, ממוינים - לזיהוי אובייקטים ששונו ע"י שרת אחר"""
+        return [info for info in (self.stat(key) for key in self.list_keys(prefix)) if info]
+
+
+class LocalStorage(StorageBackend):
+    """אחסון בתיקייה (גם תיקייה משותפת בין שרתים, למשל NFS) - כל אובייקט בקובץ, כתיבה אטומית"""
+    
+    name = 'local'
+    
+    def __init__(self, root='session_store'):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+    
+    def _path(self, key):
+        parts = key.split('/')
+        if not key or any(part in ('', '.', '..') for part in parts):
+            raise ValueError(f"מפתח לא תקין: {key}")
+        return os.path.join(self.root, *parts)
+    
+    def put(self, key, data):
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        temp_file = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            fsync_file(temp_file)
+            os.replace(temp_file, path)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        fsync_directory(folder)
+    
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+    
+    def list_keys(self, prefix=''):
+        return [info['key'] for info in self.list_objects(prefix)]
+    
+    def list_objects(self, prefix=''):
+        # סורקים רק את התיקייה של ה-prefix ולא את כל העץ
+        folder = os.path.join(self.root, *prefix.split('/')[:-1])
+        objects = []
+        for root, dirs, files in os.walk(folder):
+            relative = os.path.relpath(root, self.root)
+            for file in files:
+                if file.endswith('.tmp'):
+                    continue
+                key = file if relative == '.' else '/'.join(relative.split(os.sep) + [file])
+                if key.startswith(prefix):
+                    info = self.stat(key)
+                    if info:
+                        objects.append(info)
+        return sorted(objects, key=lambda info: info['key'])
+    
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+    
+    def stat(self, key):
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return {
+            'key': key,
+            'size': stat.st_size,
+            'modified': datetime.datetime.fromtimestamp(stat.st_mtime).isoformat()
+        }
+
+
+class SQLiteStorage(StorageBackend):
+    """אחסון בטבלת SQLite אחת - קובץ אחד לגיבוי ולהעתקה"""
+    
+    name = 'sqlite'
+    
+    def __init__(self, db_path='session_store.db'):
+        self.db_path = db_path
+        self.init_database()
+    
+    def _connect(self):
+        return connect_db(self.db_path)
+    
+    def init_database(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS objects (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                modified TEXT NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+    
+    def put(self, key, data):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR REPLACE INTO objects (key, data, size, modified) VALUES (?, ?, ?, ?)',
+                       (key, sqlite3.Binary(data), len(data), datetime.datetime.now().isoformat()))
+        conn.commit()
+        conn.close()
+    
+    def get(self, key):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT data FROM objects WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        conn.close()
+        if not row:
+            raise FileNotFoundError(f"אובייקט לא נמצא: {key}")
+        return bytes(row[0])
+    
+    def list_keys(self, prefix=''):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT key FROM objects WHERE substr(key, 1, ?) = ? ORDER BY key', (len(prefix), prefix))
+        keys = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return keys
+    
+    def list_objects(self, prefix=''):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT key, size, modified FROM objects WHERE substr(key, 1, ?) = ? ORDER BY key',
+                       (len(prefix), prefix))
+        objects = [{'key': key, 'size': size, 'modified': modified} for key, size, modified in cursor.fetchall()]
+        conn.close()
+        return objects
+    
+    def delete(self, key):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM objects WHERE key = ?', (key,))
+        conn.commit()
+        conn.close()
+    
+    def stat(self, key):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT size, modified FROM objects WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        conn.close()
+        if not row:
+            return None
+        return {'key': key, 'size': row[0], 'modified': row[1]}
+
+
+class S3Storage(StorageBackend):
+    """אחסון ב-S3 או בשירות תואם (MinIO וכו') - חתימת SigV4, חיבורים ממוחזרים ו-multipart במקביל"""
+    
+    name = 's3'
+    
+    def __init__(self, endpoint, bucket, access_key, secret_key, region='us-east-1',
+                 max_connections=S3_MAX_CONNECTIONS, multipart_threshold=MULTIPART_THRESHOLD,
+                 part_size=MULTIPART_PART_SIZE):
+        if not REQUESTS_AVAILABLE:
+            raise RuntimeError("אחסון S3 דורש את ספריית requests")
+        self.endpoint = endpoint.rstrip('/')
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.max_connections = max_connections
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        
+        # Session אחד לכל התהליך - חיבורי keep-alive נשמרים בין בקשות (ובין החלקים של multipart)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+    
+    # --- חתימה ובקשות ---
+    
+    def _signing_key(self, date):
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (date, self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        return key
+    
+    def _request(self, method, key=None, query=None, data=b'', headers=None, expected=(200,)):
+        """בקשה חתומה (AWS Signature V4) - מחזיר את התשובה, או OSError עם הודעת השרת"""
+        path = f"/{quote(self.bucket, safe='')}"
+        if key is not None:
+            path += '/' + quote(key, safe='/-_.~')
+        canonical_query = '&'.join(f"{quote(name, safe='-_.~')}={quote(str(value), safe='-_.~')}"
+                                   for name, value in sorted((query or {}).items()))
+        
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        payload_hash = hashlib.sha256(data).hexdigest()
+        headers = dict(headers or {})
+        headers.update({
+            'host': urlsplit(self.endpoint).netloc,
+            'x-amz-date': amz_date,
+            'x-amz-content-sha256': payload_hash
+        })
+        signed_headers = ';'.join(sorted(name.lower() for name in headers))
+        canonical_headers = ''.join(f"{name.lower()}:{str(value).strip()}\n"
+                                    for name, value in sorted(headers.items(), key=lambda item: item[0].lower()))
+        canonical_request = '\n'.join([method, path, canonical_query, canonical_headers, signed_headers,
+                                       payload_hash])
+        
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                    hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()])
+        signature = hmac.new(self._signing_key(amz_date[:8]), string_to_sign.encode('utf-8'),
+                             hashlib.sha256).hexdigest()
+        headers['Authorization'] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={signed_headers}, Signature={signature}")
+        
+        url = self.endpoint + path + (f"?{canonical_query}" if canonical_query else '')
+        response = self._session.request(method, url, data=data or None, headers=headers,
+                                         timeout=S3_TIMEOUT_SECONDS)
+        if response.status_code == 404 and 404 not in expected:
+            raise FileNotFoundError(f"אובייקט לא נמצא: {key}")
+        if response.status_code not in expected:
+            raise OSError(f"S3 {method} {key or self.bucket}: {response.status_code} {_s3_error(response.content)}")
+        return response
+    
+    def ensure_bucket(self):
+        """יצירת ה-bucket אם עוד לא קיים"""
+        self._request('PUT', expected=(200, 409))
+    
+    # --- הממשק ---
+    
+    def put(self, key, data):
+        if len(data) >= self.multipart_threshold:
+            self._put_multipart(key, data)
+        else:
+            self._request('PUT', key, data=bytes(data))
+    
+    def _put_multipart(self, key, data):
+        """העלאה בחלקים במקביל - אם חלק נכשל, ההעלאה מבוטלת ולא נשאר אובייקט חלקי"""
+        response = self._request('POST', key, query={'uploads': ''})
+        upload_id = ET.fromstring(response.content).findtext(f'{{{S3_XML_NAMESPACE}}}UploadId')
+        if not upload_id:
+            raise OSError(f"S3 לא החזיר מזהה העלאה עבור {key}")
+        
+        view = memoryview(data)
+        offsets = range(0, len(data), self.part_size)
+        
+        def upload_part(numbered):
+            number, offset = numbered
+            part = bytes(view[offset:offset + self.part_size])
+            part_response = self._request('PUT', key, query={'partNumber': number, 'uploadId': upload_id}, data=part)
+            return number, part_response.headers.get('ETag', '')
+        
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+                parts = list(executor.map(upload_part, enumerate(offsets, start=1)))
+            
+            body = ''.join(f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                           for number, etag in parts)
+            self._request('POST', key, query={'uploadId': upload_id},
+                          data=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode('utf-8'))
+        except Exception:
+            try:
+                self._request('DELETE', key, query={'uploadId': upload_id}, expected=(200, 204, 404))
+            except OSError as e:
+                print(f"⚠️ לא ניתן לבטל העלאה חלקית של {key}: {e}")
+            raise
+    
+    def get(self, key):
+        return self._request('GET', key).content
+    
+    def list_keys(self, prefix=''):
+        return [info['key'] for info in self.list_objects(prefix)]
+    
+    def list_objects(self, prefix=''):
+        # ListObjectsV2 מחזיר גודל, זמן שינוי ו-ETag לכל מפתח - בלי HEAD לכל אובייקט
+        objects = []
+        token = None
+        ns = f'{{{S3_XML_NAMESPACE}}}'
+        while True:
+            query = {'list-type': 2, 'prefix': prefix, 'max-keys': S3_LIST_PAGE_SIZE}
+            if token:
+                query['continuation-token'] = token
+            root = ET.fromstring(self._request('GET', query=query).content)
+            for element in root.iter(f'{ns}Contents'):
+                objects.append({
+                    'key': element.findtext(f'{ns}Key'),
+                    'size': int(element.findtext(f'{ns}Size') or 0),
+                    'modified': element.findtext(f'{ns}LastModified') or '',
+                    'etag': element.findtext(f'{ns}ETag') or ''
+                })
+            token = root.findtext(f'{ns}NextContinuationToken')
+            if root.findtext(f'{ns}IsTruncated') != 'true' or not token:
+                return objects
+    
+    def delete(self, key):
+        self._request('DELETE', key, expected=(200, 204, 404))
+    
+    def stat(self, key):
+        response = self._request('HEAD', key, expected=(200, 404))
+        if response.status_code == 404:
+            return None
+        return {
+            'key': key,
+            'size': int(response.headers.get('Content-Length', 0)),
+            'modified': response.headers.get('Last-Modified', '')
+        }
+
+
+def _s3_error(content):
+    """הודעת השגיאה מתוך תשובת XML של S3"""
+    match = re.search(rb'<Message>(.*?)</Message>', content or b'')
+    return match.group(1).decode('utf-8', errors='replace') if match else ''
+
+
+class FakeS3Server:
+    """שרת S3 מקומי בזיכרון (בתוך התהליך) - לפיתוח ולבדיקות בלי ענן. לא בודק חתימות"""
+    
+    def __init__(self, host='127.0.0.1', port=0):
+        self.buckets = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _FakeS3Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+    
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name='fake-s3')
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _FakeS3Handler(BaseHTTPRequestHandler):
+    # keep-alive - כמו שרת S3 אמיתי, כדי שמאגר החיבורים של הלקוח ימוחזר
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _parse(self):
+        parts = urlsplit(self.path)
+        path = parts.path.lstrip('/')
+        bucket, _, key = path.partition('/')
+        query = {name: values[0] for name, values in parse_qs(parts.query, keep_blank_values=True).items()}
+        return unquote(bucket), unquote(key), query
+    
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+    
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def _error(self, status, code, message):
+        body = f"<Error><Code>{code}</Code><Message>{message}</Message></Error>".encode('utf-8')
+        self._send(status, body, {'Content-Type': 'application/xml'})
+    
+    def _objects(self, bucket):
+        objects = self.server.fake.buckets.get(bucket)
+        if objects is None:
+            self._error(404, 'NoSuchBucket', 'The specified bucket does not exist')
+        return objects
+    
+    def do_PUT(self):
+        fake = self.server.fake
+        bucket, key, query = self._parse()
+        data = self._body()
+        with fake.lock:
+            if not key:
+                if bucket in fake.buckets:
+                    return self._error(409, 'BucketAlreadyOwnedByYou', 'Bucket exists')
+                fake.buckets[bucket] = {}
+                return self._send(200)
+            objects = self._objects(bucket)
+            if objects is None:
+                return
+            etag = f'"{hashlib.md5(data).hexdigest()}"'
+            if 'uploadId' in query:
+                upload = fake.uploads.get(query['uploadId'])
+                if upload is None:
+                    return self._error(404, 'NoSuchUpload', 'The specified upload does not exist')
+                upload['parts'][int(query['partNumber'])] = data
+            else:
+                objects[key] = (data, datetime.datetime.now(datetime.timezone.utc))
+        self._send(200, headers={'ETag': etag})
+    
+    def do_POST(self):
+        fake = self.server.fake
+        bucket, key, query = self._parse()
+        body = self._body()
+        with fake.lock:
+            objects = self._objects(bucket)
+            if objects is None:
+                return
+            if 'uploads' in query:
+                upload_id = uuid.uuid4().hex
+                fake.uploads[upload_id] = {'key': key, 'parts': {}}
+                result = (f'<InitiateMultipartUploadResult xmlns="{S3_XML_NAMESPACE}"><Bucket>{bucket}</Bucket>'
+                          f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+                return self._send(200, result.encode('utf-8'), {'Content-Type': 'application/xml'})
+            
+            upload = fake.uploads.pop(query.get('uploadId'), None)
+            if upload is None:
+                return self._error(404, 'NoSuchUpload', 'The specified upload does not exist')
+            numbers = [int(number) for number in re.findall(rb'<PartNumber>(\d+)</PartNumber>', body)]
+            if any(number not in upload['parts'] for number in numbers):
+                return self._error(400, 'InvalidPart', 'One or more parts could not be found')
+            objects[key] = (b''.join(upload['parts'][number] for number in numbers),
+                            datetime.datetime.now(datetime.timezone.utc))
+        result = f'<CompleteMultipartUploadResult xmlns="{S3_XML_NAMESPACE}"><Key>{key}</Key></CompleteMultipartUploadResult>'
+        self._send(200, result.encode('utf-8'), {'Content-Type': 'application/xml'})
+    
+    def do_GET(self):
+        fake = self.server.fake
+        bucket, key, query = self._parse()
+        with fake.lock:
+            objects = self._objects(bucket)
+            if objects is None:
+                return
+            if key:
+                if key not in objects:
+                    return self._error(404, 'NoSuchKey', 'The specified key does not exist')
+                data, modified = objects[key]
+                return self._send(200, data, {'Last-Modified': modified.strftime('%a, %d %b %Y %H:%M:%S GMT')})
+            
+            prefix = query.get('prefix', '')
+            max_keys = int(query.get('max-keys') or S3_LIST_PAGE_SIZE)
+            start = query.get('continuation-token', '')
+            keys = sorted(name for name in objects if name.startswith(prefix) and name > start)
+            page = [(name, *objects[name]) for name in keys[:max_keys]]
+        
+        truncated = len(keys) > max_keys
+        contents = ''.join(
+            f"<Contents><Key>{_xml_escape(name)}</Key><Size>{len(data)}</Size>"
+            f"<LastModified>{modified.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]}Z</LastModified>"
+            f"<ETag>&quot;{hashlib.md5(data).hexdigest()}&quot;</ETag></Contents>"
+            for name, data, modified in page)
+        token = f"<NextContinuationToken>{_xml_escape(page[-1][0])}</NextContinuationToken>" if truncated else ''
+        result = (f'<ListBucketResult xmlns="{S3_XML_NAMESPACE}"><Name>{bucket}</Name>'
+                  f'<KeyCount>{len(page)}</KeyCount><IsTruncated>{"true" if truncated else "false"}</IsTruncated>'
+                  f'{contents}{token}</ListBucketResult>')
+        self._send(200, result.encode('utf-8'), {'Content-Type': 'application/xml'})
+    
+    def do_HEAD(self):
+        fake = self.server.fake
+        bucket, key, _ = self._parse()
+        with fake.lock:
+            entry = fake.buckets.get(bucket, {}).get(key)
+        if entry is None:
+            return self._send(404)
+        data, modified = entry
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Last-Modified', modified.strftime('%a, %d %b %Y %H:%M:%S GMT'))
+        self.end_headers()
+    
+    def do_DELETE(self):
+        fake = self.server.fake
+        bucket, key, query = self._parse()
+        with fake.lock:
+            if 'uploadId' in query:
+                fake.uploads.pop(query['uploadId'], None)
+            else:
+                fake.buckets.get(bucket, {}).pop(key, None)
+        self._send(204)
+
+
+def _xml_escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+# שרת ה-S3 המקומי (S3_ENDPOINT=fake) - אחד לכל תהליך
+_fake_s3 = None
+_fake_s3_lock = threading.Lock()
+
+
+def fake_s3_endpoint():
+    """הכתובת של שרת S3 מקומי בתוך התהליך - מופעל בקריאה הראשונה"""
+    global _fake_s3
+    with _fake_s3_lock:
+        if _fake_s3 is None:
+            _fake_s3 = FakeS3Server().start()
+            print(f"🧪 שרת S3 מקומי (בזיכרון) פועל ב-{_fake_s3.endpoint}")
+        return _fake_s3.endpoint
+
+
+def create_storage(name):
+    """אחסון לפי שם, עם ההגדרות ממשתני הסביבה:
+    local - SESSION_STORE_PATH, sqlite - SESSION_STORE_DB,
+    s3 - S3_ENDPOINT (או fake לשרת מקומי), S3_BUCKET, S3_ACCESS_KEY, S3_SECRET_KEY, S3_REGION"""
+    if name == 'local':
+        return LocalStorage(os.getenv('SESSION_STORE_PATH', 'session_store'))
+    if name == 'sqlite':
+        return SQLiteStorage(os.getenv('SESSION_STORE_DB', 'session_store.db'))
+    if name == 's3':
+        endpoint = os.getenv('S3_ENDPOINT', '')
+        fake = endpoint == 'fake'
+        if fake:
+            endpoint = fake_s3_endpoint()
+        elif not endpoint:
+            raise ValueError("חסר S3_ENDPOINT")
+        storage = S3Storage(endpoint, os.getenv('S3_BUCKET', 'sessions'), os.getenv('S3_ACCESS_KEY', ''),
+                            os.getenv('S3_SECRET_KEY', ''), os.getenv('S3_REGION', 'us-east-1'),
+                            max_connections=int(os.getenv('S3_MAX_CONNECTIONS', str(S3_MAX_CONNECTIONS))))
+        if fake:
+            storage.ensure_bucket()
+        return storage
+    raise ValueError(f"אחסון לא מוכר: {name}")
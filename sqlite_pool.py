@@ -0,0 +1,82 @@
+# sqlite_pool.py - חיבורי SQLite משותפים לכל המודולים: חיבור פתוח לכל thread ולכל קובץ, WAL ו-busy_timeout
+import os
+import sqlite3
+import threading
+
+# המתנה לנעילת כתיבה לפני "database is locked" (שניות)
+BUSY_TIMEOUT_SECONDS = 30
+
+# החיבור הפנוי של כל thread לכל קובץ מסד נתונים
+_local = threading.local()
+# חיבורים שעברו fork מתהליך האב - לא נסגרים בתהליך הבן (סגירה משחררת נעילות ששייכות לאב)
+_inherited = []
+
+
+class PooledConnection(sqlite3.Connection):
+    """חיבור ש-close שלו מחזיר אותו ל-thread במקום לסגור - הקוד הקיים (connect ... close) לא משתנה"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pid = os.getpid()
+        self.db_key = None
+        self.in_use = False
+    
+    def close(self):
+        if not self.in_use:
+            return
+        self.in_use = False
+        _release(self)
+    
+    def discard(self):
+        """סגירה אמיתית"""
+        sqlite3.Connection.close(self)
+
+
+def _idle_connections():
+    idle = getattr(_local, 'idle', None)
+    if idle is None:
+        idle = _local.idle = {}
+    return idle
+
+
+def connect_db(db_path, timeout=BUSY_TIMEOUT_SECONDS):
+    """חיבור למסד הנתונים - החיבור הפנוי של ה-thread אם יש, אחרת חדש עם WAL, synchronous=NORMAL ו-busy_timeout"""
+    key = os.path.abspath(db_path)
+    conn = _idle_connections().pop(key, None)
+    
+    # אחרי fork (gunicorn עם preload_app) החיבור שייך לתהליך האב - פותחים חדש
+    if conn is not None and conn.pid != os.getpid():
+        _inherited.append(conn)
+        conn = None
+    
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=timeout, factory=PooledConnection)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(timeout * 1000)}')
+        conn.db_key = key
+    
+    conn.in_use = True
+    return conn
+
+
+def _release(conn):
+    """החזרת חיבור אחרי close - טרנזקציה שלא נשמרה מבוטלת, כמו בסגירה רגילה"""
+    if conn.pid != os.getpid():
+        _inherited.append(conn)
+        return
+    
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+    except sqlite3.Error:
+        conn.discard()
+        return
+    
+    idle = _idle_connections()
+    # חיבור מקונן לאותו קובץ באותו thread - נשמר רק אחד פנוי
+    if conn.db_key in idle:
+        conn.discard()
+    else:
+        idle[conn.db_key] = conn
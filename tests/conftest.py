@@ -0,0 +1,5 @@
+# conftest.py - הרצת הבדיקות מתיקיית הפרויקט: המודולים נמצאים בשורש ולא בחבילה
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,122 @@
+# test_access_tokens.py - טוקני גישה חתומים: אימות, תפוגה וביטולים (גם בין תהליכים)
+import time
+import sqlite3
+
+import pytest
+
+import access_tokens
+from access_tokens import AccessTokens
+
+
+@pytest.fixture(autouse=True)
+def no_secret_from_env(monkeypatch):
+    monkeypatch.delenv('AUTH_TOKEN_SECRET', raising=False)
+
+
+def make_tokens(tmp_path, audience='users.db', **kwargs):
+    return AccessTokens(str(tmp_path / 'tokens.db'), audience,
+                        secret_key_path=str(tmp_path / 'auth_secret.key'), **kwargs)
+
+
+def test_verify_returns_claims(tmp_path):
+    tokens = make_tokens(tmp_path)
+    ok, claims = tokens.verify(tokens.create_access_token(7, 'free'))
+    assert ok
+    assert claims['sub'] == 7
+    assert claims['tier'] == 'free'
+
+
+def test_tampered_token_rejected(tmp_path):
+    tokens = make_tokens(tmp_path)
+    token = tokens.create_access_token(7, 'free')
+    payload, _, signature = token.rpartition('.')
+    forged = tokens.create_access_token(8, 'premium').rpartition('.')[0]
+    
+    assert tokens.verify(f"{forged}.{signature}") == (False, 'טוקן לא תקין')
+    assert tokens.verify(payload + '.' + signature[:-2]) == (False, 'טוקן לא תקין')
+    assert tokens.verify('not-a-token') == (False, 'טוקן לא תקין')
+
+
+def test_token_of_other_audience_rejected(tmp_path):
+    # אותו מפתח חתימה, מערכת משתמשים אחרת
+    token = make_tokens(tmp_path, audience='simple_users.db').create_access_token(1, 'free')
+    assert make_tokens(tmp_path, audience='users.db').verify(token) == (False, 'טוקן לא תקין')
+
+
+def test_expired_token_rejected(tmp_path):
+    tokens = make_tokens(tmp_path, access_ttl_seconds=-1)
+    assert tokens.verify(tokens.create_access_token(7, 'free')) == (False, 'טוקן פג תוקף')
+
+
+def test_revoke_only_affects_that_token(tmp_path):
+    tokens = make_tokens(tmp_path)
+    revoked = tokens.create_access_token(7, 'free')
+    other = tokens.create_access_token(7, 'free')
+    
+    tokens.revoke(tokens.verify(revoked)[1])
+    
+    assert tokens.verify(revoked) == (False, 'טוקן בוטל')
+    assert tokens.verify(other)[0]
+
+
+def test_revoke_user_affects_only_earlier_tokens(tmp_path):
+    tokens = make_tokens(tmp_path)
+    before = tokens.create_access_token(7, 'free')
+    other_user = tokens.create_access_token(8, 'free')
+    
+    tokens.revoke_user(7)
+    time.sleep(0.01)
+    after = tokens.create_access_token(7, 'free')
+    
+    assert tokens.verify(before) == (False, 'טוקן בוטל')
+    assert tokens.verify(other_user)[0]
+    # כניסה מחדש אחרי איפוס סיסמה
+    assert tokens.verify(after)[0]
+
+
+def test_revocation_reaches_other_process(tmp_path, monkeypatch):
+    # שני מופעים על אותו מסד נתונים - כמו שני workers של gunicorn
+    first, second = make_tokens(tmp_path), make_tokens(tmp_path)
+    token = first.create_access_token(7, 'free')
+    assert second.verify(token)[0]
+    
+    first.revoke(first.verify(token)[1])
+    monkeypatch.setattr(access_tokens, 'REVOCATION_SYNC_SECONDS', 0)
+    assert second.verify(token) == (False, 'טוקן בוטל')
+
+
+def refresh_token_count(tokens, user_id):
+    conn = sqlite3.connect(tokens.db_path)
+    count = conn.execute('SELECT COUNT(*) FROM refresh_tokens WHERE user_id = ?', (user_id,)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_refresh_token_is_single_use(tmp_path):
+    tokens = make_tokens(tmp_path)
+    refresh_token = tokens.issue(7, 'free')['refresh_token']
+    assert tokens.use_refresh_token(refresh_token) == (True, 7)
+    assert tokens.use_refresh_token(refresh_token) == (False, 'טוקן רענון לא תקין')
+
+
+def test_logins_per_user_capped_oldest_dropped(tmp_path):
+    tokens = make_tokens(tmp_path, max_tokens_per_user=3)
+    issued = [tokens.issue(7, 'free')['refresh_token'] for _ in range(5)]
+    tokens.issue(8, 'free')
+    
+    assert refresh_token_count(tokens, 7) == 3
+    assert refresh_token_count(tokens, 8) == 1
+    assert tokens.use_refresh_token(issued[0])[0] is False
+    assert tokens.use_refresh_token(issued[-1]) == (True, 7)
+
+
+def test_purge_expired_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(access_tokens, 'PURGE_BATCH_PAUSE_SECONDS', 0)
+    tokens = make_tokens(tmp_path, refresh_ttl_days=-1)
+    for _ in range(7):
+        tokens.issue(7, 'free')
+    live = make_tokens(tmp_path).issue(8, 'free')['refresh_token']
+    
+    assert tokens.purge_expired(batch_size=2) == 7
+    assert refresh_token_count(tokens, 7) == 0
+    assert tokens.use_refresh_token(live) == (True, 8)
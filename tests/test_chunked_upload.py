@@ -0,0 +1,103 @@
+# test_chunked_upload.py - העלאה בחלקים: אימות חלקים, המשך אחרי ניתוק, ושייכות ההעלאה למשתמש שפתח אותה
+import os
+import hashlib
+import importlib
+
+import pytest
+
+from chunked_upload import ChunkedUploadManager
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    return ChunkedUploadManager(str(tmp_path / 'spool'), str(tmp_path / 'uploads.db'))
+
+
+def test_chunks_in_any_order_finalize(uploads, tmp_path):
+    data = b'0123456789abcdefghij'
+    _, upload = uploads.init_upload('rec.wav', len(data), chunk_size=8, file_sha256=sha256(data), user_id=7)
+    upload_id = upload['upload_id']
+    assert upload['total_chunks'] == 3
+    
+    for index in (2, 0):
+        chunk = data[index * 8:(index + 1) * 8]
+        assert uploads.write_chunk(upload_id, index, chunk, sha256(chunk))[0]
+    status = uploads.get_status(upload_id)
+    assert status['user_id'] == 7
+    assert status['missing_chunks'] == [1]
+    assert uploads.finalize(upload_id, str(tmp_path / 'out.wav')) == (False, 'חסרים 1 חלקים')
+    
+    assert uploads.write_chunk(upload_id, 1, data[8:16], sha256(data[8:16]))[0]
+    assert uploads.finalize(upload_id, str(tmp_path / 'out.wav'))[0]
+    with open(tmp_path / 'out.wav', 'rb') as f:
+        assert f.read() == data
+
+
+def test_bad_chunk_checksum_rejected(uploads):
+    _, upload = uploads.init_upload('rec.wav', 4, chunk_size=4)
+    success, error = uploads.write_chunk(upload['upload_id'], 0, b'abcd', sha256(b'abce'))
+    assert not success
+    assert 'checksum' in error
+
+
+# --- הנתיבים ב-app.py ---
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    # app.py יוצר את מסדי הנתונים והתיקיות שלו בתיקייה הנוכחית
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    env = {'PASSWORD_HASH_COST': '10', 'ENABLE_LOCAL_BACKEND': 'True'}
+    saved = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        app_module = importlib.import_module('app')
+        yield app_module.app.test_client()
+    finally:
+        os.chdir(cwd)
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def login(client, email):
+    client.post('/auth/register', json={'email': email, 'password': '123456', 'full_name': 'בדיקה'})
+    token = client.post('/auth/login', json={'email': email, 'password': '123456'}).json['session_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_upload_routes_scoped_to_owner(client):
+    owner, other = login(client, 'owner@example.com'), login(client, 'other@example.com')
+    data = b'RIFF-audio'
+    upload_id = client.post('/uploads', headers=owner,
+                            json={'filename': 'rec.wav', 'total_size': len(data)}).json['upload_id']
+    chunk_url = f'/uploads/{upload_id}/chunks/0'
+    checksum = {'X-Chunk-SHA256': sha256(data)}
+    
+    assert client.put(chunk_url, headers={**other, **checksum}, data=data).status_code == 404
+    assert client.get(f'/uploads/{upload_id}', headers=other).status_code == 404
+    assert client.delete(f'/uploads/{upload_id}', headers=other).status_code == 404
+    assert client.post(f'/uploads/{upload_id}/finalize', headers=other,
+                       json={'patient_name': 'דני', 'quality_mode': 'local'}).status_code == 404
+    
+    assert client.put(chunk_url, headers={**owner, **checksum}, data=data).status_code == 200
+    assert client.get(f'/uploads/{upload_id}', headers=owner).json['missing_chunks'] == []
+    assert client.delete(f'/uploads/{upload_id}', headers=owner).status_code == 200
+
+
+def test_upload_routes_require_token(client):
+    owner = login(client, 'owner@example.com')
+    upload_id = client.post('/uploads', headers=owner, json={'filename': 'rec.wav', 'total_size': 4}).json['upload_id']
+    
+    assert client.post('/uploads', headers={'Authorization': 'Bearer x'},
+                       json={'filename': 'rec.wav', 'total_size': 4}).status_code == 401
+    assert client.get(f'/uploads/{upload_id}').status_code == 401
+    assert client.get(f'/uploads/{upload_id}', headers={'Authorization': 'Bearer x'}).status_code == 401
+    assert client.delete(f'/uploads/{upload_id}').status_code == 401
+    assert client.put(f'/uploads/{upload_id}/chunks/0', data=b'abcd').status_code == 401
@@ -0,0 +1,164 @@
+# test_job_queue.py - תור העבודות: לקיחה אטומית, תוצאות, סודות זמניים וניקוי
+import threading
+
+import pytest
+
+import job_queue
+from job_queue import JobQueue, JobWorkerPool, JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.delenv('JOB_SECRET_KEY', raising=False)
+    return JobQueue(str(tmp_path / 'jobs.db'), str(tmp_path / 'jobs_secret.key'))
+
+
+def test_jobs_claimed_in_order(queue):
+    first = queue.enqueue('transcribe', {'n': 1})
+    second = queue.enqueue('transcribe', {'n': 2})
+    assert queue.queue_position(second) == 1
+    
+    job = queue.claim_next('w1')
+    assert job['job_id'] == first
+    assert job['status'] == JOB_RUNNING
+    assert job['attempts'] == 1
+    assert job['payload'] == {'n': 1}
+    assert queue.claim_next('w2')['job_id'] == second
+    assert queue.claim_next('w3') is None
+
+
+def test_each_job_claimed_once(queue):
+    for n in range(20):
+        queue.enqueue('transcribe', {'n': n})
+    
+    claimed = []
+    claimed_lock = threading.Lock()
+    
+    def worker(worker_id):
+        # חיבור נפרד לכל worker - כמו תהליכים שונים
+        own_queue = JobQueue(queue.db_path, queue.secret_key_path)
+        while True:
+            job = own_queue.claim_next(worker_id)
+            if not job:
+                return
+            with claimed_lock:
+                claimed.append(job['job_id'])
+    
+    threads = [threading.Thread(target=worker, args=(f'w{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(claimed) == 20
+    assert len(set(claimed)) == 20
+
+
+def test_complete_and_fail(queue):
+    done = queue.enqueue('transcribe', {})
+    failed = queue.enqueue('transcribe', {})
+    queue.claim_next('w')
+    queue.claim_next('w')
+    
+    queue.complete(done, {'success': True, 'session_id': 'abc'})
+    queue.fail(failed, 'שגיאה')
+    
+    assert queue.get_job(done)['status'] == JOB_COMPLETED
+    assert queue.get_job(done)['result'] == {'success': True, 'session_id': 'abc'}
+    assert queue.get_job(failed)['status'] == JOB_FAILED
+    assert queue.get_job(failed)['error'] == 'שגיאה'
+    # אירוע סיום לכל עבודה - סוגר את שידור ה-SSE
+    assert [event['stage'] for event in queue.get_events(done)][-1] == JOB_COMPLETED
+    assert [event['stage'] for event in queue.get_events(failed)][-1] == JOB_FAILED
+
+
+def test_sealed_secret_cleared_after_job(queue):
+    sealed = queue.seal_secret('סיסמת-הצפנה')
+    assert 'סיסמת-הצפנה' not in sealed
+    job_id = queue.enqueue('transcribe-secure', {'patient_name': 'דני', 'sealed_encryption_password': sealed})
+    
+    pool = JobWorkerPool(queue, {'transcribe-secure': lambda job_id, payload: (
+        True, {'password': queue.unseal_secret(payload['sealed_encryption_password'])})})
+    pool._process(queue.claim_next('w'))
+    
+    job = queue.get_job(job_id, include_payload=True)
+    assert job['status'] == JOB_COMPLETED
+    assert job['result'] == {'password': 'סיסמת-הצפנה'}
+    assert job['payload'] == {'patient_name': 'דני'}
+
+
+def test_cleanup_runs_after_result_saved(queue):
+    cleaned = []
+    pool = JobWorkerPool(queue, {'transcribe': lambda job_id, payload: (False, {'error': 'שגיאה בתמלול'})},
+                         cleanup=lambda job: cleaned.append(queue.get_job(job['job_id'])['status']))
+    queue.enqueue('transcribe', {})
+    pool._process(queue.claim_next('w'))
+    assert cleaned == [JOB_FAILED]
+
+
+def test_unknown_job_type_fails(queue):
+    job_id = queue.enqueue('unknown', {})
+    JobWorkerPool(queue, {})._process(queue.claim_next('w'))
+    assert queue.get_job(job_id)['status'] == JOB_FAILED
+
+
+# --- חידוש עבודות שנקטעו ---
+
+def test_expired_lease_reclaimed_with_provider_ref(queue, monkeypatch):
+    job_id = queue.enqueue('transcribe', {})
+    queue.claim_next('w1')
+    queue.set_provider_ref(job_id, 'provider-123')
+    assert queue.claim_next('w2') is None
+    
+    # ה-worker הראשון מת בלי heartbeat - ה-lease פג
+    monkeypatch.setattr(job_queue, 'LEASE_SECONDS', -1)
+    job = queue.claim_next('w2')
+    assert job['job_id'] == job_id
+    assert job['attempts'] == 2
+    # ממשיכים את התמלול שכבר נשלח, בלי לשלוח שוב
+    assert job['provider_ref'] == 'provider-123'
+
+
+def test_heartbeat_keeps_lease(queue, monkeypatch):
+    job_id = queue.enqueue('transcribe', {})
+    queue.claim_next('w1')
+    monkeypatch.setattr(job_queue, 'LEASE_SECONDS', 60)
+    queue.heartbeat([job_id])
+    assert queue.claim_next('w2') is None
+
+
+def test_release_returns_job_to_queue(queue):
+    job_id = queue.enqueue('transcribe', {})
+    queue.claim_next('w1')
+    # רק ה-worker שמחזיק בעבודה משחרר אותה
+    queue.release(job_id, 'w2')
+    assert queue.get_job(job_id)['status'] == JOB_RUNNING
+    
+    queue.release(job_id, 'w1')
+    assert queue.get_job(job_id)['status'] == JOB_QUEUED
+    assert queue.claim_next('w2')['job_id'] == job_id
+
+
+def test_exhausted_job_failed_and_cleaned(queue, monkeypatch):
+    job_id = queue.enqueue('transcribe-secure', {'sealed_encryption_password': queue.seal_secret('x')})
+    monkeypatch.setattr(job_queue, 'LEASE_SECONDS', -1)
+    for attempt in range(job_queue.MAX_ATTEMPTS):
+        assert queue.claim_next(f'w{attempt}')['job_id'] == job_id
+    assert queue.claim_next('w') is None
+    
+    cleaned = []
+    pool = JobWorkerPool(queue, {}, poll_interval=0.01, cleanup=cleaned.append)
+    worker = threading.Thread(target=pool._run, args=(0,))
+    worker.start()
+    for _ in range(500):
+        if cleaned:
+            break
+        pool._stop_event.wait(0.01)
+    pool._stop_event.set()
+    worker.join()
+    
+    job = queue.get_job(job_id, include_payload=True)
+    assert job['status'] == JOB_FAILED
+    assert job['payload'] == {}
+    assert [job['job_id'] for job in cleaned] == [job_id]
+    assert [event['stage'] for event in queue.get_events(job_id)][-1] == JOB_FAILED
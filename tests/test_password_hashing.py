@@ -0,0 +1,55 @@
+# test_password_hashing.py - בדיקת סיסמאות בכל הפורמטים, וגיבוב מחדש רק לגיבוב חלש יותר
+import hashlib
+
+import pytest
+
+from password_hashing import (ALGORITHM_BCRYPT, ALGORITHM_PBKDF2, BCRYPT_AVAILABLE, MIN_PBKDF2_ITERATIONS,
+                              PasswordHasher, identify)
+
+
+def pbkdf2(cost=MIN_PBKDF2_ITERATIONS):
+    return PasswordHasher(algorithm=ALGORITHM_PBKDF2, cost=cost)
+
+
+def test_hash_and_verify_round_trip():
+    hasher = pbkdf2()
+    password_hash = hasher.hash('סיסמה-סודית')
+    assert identify(password_hash) == (ALGORITHM_PBKDF2, MIN_PBKDF2_ITERATIONS)
+    assert hasher.verify('סיסמה-סודית', password_hash)
+    assert not hasher.verify('סיסמה-אחרת', password_hash)
+
+
+def test_legacy_sha256_verified_and_rehashed():
+    legacy_hash = hashlib.sha256('123456'.encode()).hexdigest()
+    hasher = pbkdf2()
+    assert hasher.verify('123456', legacy_hash)
+    assert hasher.needs_rehash(legacy_hash)
+
+
+def test_lower_cost_rehashed():
+    weaker = pbkdf2().hash('123456')
+    assert pbkdf2(cost=MIN_PBKDF2_ITERATIONS * 2).needs_rehash(weaker)
+
+
+def test_same_cost_not_rehashed():
+    hasher = pbkdf2()
+    assert not hasher.needs_rehash(hasher.hash('123456'))
+
+
+def test_higher_cost_not_downgraded():
+    # גובב בשרת מהיר יותר - לא מחליפים אותו בגיבוב חלש יותר
+    stronger = pbkdf2(cost=MIN_PBKDF2_ITERATIONS * 2).hash('123456')
+    assert not pbkdf2().needs_rehash(stronger)
+
+
+def test_unknown_hash_rehashed():
+    assert pbkdf2().needs_rehash('')
+    assert pbkdf2().needs_rehash('not-a-hash')
+
+
+@pytest.mark.skipif(not BCRYPT_AVAILABLE, reason='bcrypt לא מותקן')
+def test_other_algorithm_rehashed():
+    bcrypt_hash = PasswordHasher(algorithm=ALGORITHM_BCRYPT, cost=10).hash('123456')
+    hasher = pbkdf2()
+    assert hasher.verify('123456', bcrypt_hash)
+    assert hasher.needs_rehash(bcrypt_hash)
@@ -0,0 +1,74 @@
+# test_segment_store.py - סשנים במקטעים: סריקה ובנייה מחדש, רשומה קטועה, ודחיסת מקטעים שרובם נמחקו
+import os
+
+import pytest
+
+import session_index
+from session_format import new_session_file
+from session_index import SessionIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SessionIndex(str(tmp_path / 'transcripts'), str(tmp_path / 'index.db'), storage='segments')
+    # כל שמירה פותחת מקטע חדש - כך יש מקטעים סגורים לדחיסה
+    index.segments.max_segment_bytes = 1
+    return index
+
+
+def save(index, patient_name, text):
+    patient_folder = os.path.join(index.transcripts_folder, 'user_1', patient_name)
+    os.makedirs(patient_folder, exist_ok=True)
+    session_file, session_id = new_session_file(patient_folder)
+    index.save_session(session_file, {'session_id': session_id, 'patient_name': patient_name,
+                                      'corrected_transcript': text})
+    return session_file
+
+
+def reopen(index, tmp_path):
+    # אינדקס חדש על אותה תיקייה - נבנה רק מסריקת המקטעים
+    return SessionIndex(index.transcripts_folder, str(tmp_path / 'rebuilt.db'), storage='segments')
+
+
+def test_rebuild_from_segments_skips_deleted(index, tmp_path):
+    kept = save(index, 'דני', 'שיחה ראשונה')
+    deleted = save(index, 'דני', 'שיחה שנייה')
+    index.delete_session(deleted)
+    assert not os.path.exists(kept)
+    
+    rebuilt = reopen(index, tmp_path)
+    assert rebuilt.count_sessions() == 1
+    assert rebuilt.read_session(kept)['corrected_transcript'] == 'שיחה ראשונה'
+    assert not rebuilt.session_exists(deleted)
+
+
+def test_torn_record_skipped(index, tmp_path):
+    first = save(index, 'דני', 'שיחה ראשונה')
+    second = save(index, 'דני', 'שיחה שנייה')
+    # קריסה באמצע כתיבה - שארית רשומה בסוף המקטע הראשון
+    with open(index.segments.segment_path(index.segments.segments('user_1')[0]), 'ab') as f:
+        f.write(b'TSR1\x00\x00\x00')
+    
+    rebuilt = reopen(index, tmp_path)
+    assert rebuilt.count_sessions() == 2
+    assert rebuilt.read_session(first)['corrected_transcript'] == 'שיחה ראשונה'
+    assert rebuilt.read_session(second)['corrected_transcript'] == 'שיחה שנייה'
+
+
+def test_compaction_frees_deleted_and_keeps_live(index, tmp_path, monkeypatch):
+    sessions = [save(index, 'דני', f'שיחה {n}') for n in range(4)]
+    for session_file in sessions[:3]:
+        index.delete_session(session_file)
+    segments_before = index.segments.segments('user_1')
+    
+    # המקטעים עדיין צעירים - לא נדחסים
+    assert index.compact_segments() == 0
+    monkeypatch.setattr(session_index, 'COMPACT_MIN_AGE_SECONDS', -1)
+    assert index.compact_segments() > 0
+    
+    assert len(index.segments.segments('user_1')) < len(segments_before)
+    assert index.read_session(sessions[3])['corrected_transcript'] == 'שיחה 3'
+    # רשומות המחיקה שנשמרו מונעות מהסשנים שנמחקו לחזור בבנייה מחדש
+    rebuilt = reopen(index, tmp_path)
+    assert rebuilt.count_sessions() == 1
+    assert rebuilt.read_session(sessions[3])['corrected_transcript'] == 'שיחה 3'
@@ -0,0 +1,42 @@
+# test_segmented_transcription.py - חיבור טקסטים של חלקים חופפים
+from segmented_transcription import stitch_transcripts
+
+
+def test_overlap_words_kept_once():
+    first = "המטופל סיפר על קשיי שינה בשבועות האחרונים"
+    second = "בשבועות האחרונים ועל עייפות במהלך היום"
+    assert stitch_transcripts([first, second]) == (
+        "המטופל סיפר על קשיי שינה בשבועות האחרונים ועל עייפות במהלך היום")
+
+
+def test_overlap_ignores_punctuation():
+    first = "we talked about sleep. It has been hard,"
+    second = "Been hard lately. Mostly at night"
+    assert stitch_transcripts([first, second], max_overlap_words=4) == (
+        "we talked about sleep. It has been hard, lately. Mostly at night")
+
+
+def test_repeated_phrase_not_treated_as_overlap():
+    # "אני לא יודע" חוזר בתחילת החלק הבא, אבל לא בסוף החלק הקודם - אין כפילות להסיר
+    first = "אני לא יודע מה קרה אז והיא שאלה אותי שוב"
+    second = "אני לא יודע אם אני רוצה לדבר על זה"
+    assert stitch_transcripts([first, second]) == first + ' ' + second
+
+
+def test_repeated_phrase_beyond_overlap_window_kept():
+    # ההתאמה נוגעת בשני הקצוות אבל ארוכה מאזור החפיפה האפשרי - הדובר באמת חזר על עצמו
+    first = "תגיד לי שוב מה אמרת לה אחר כך"
+    second = "מה אמרת לה אחר כך והיא לא ענתה"
+    assert stitch_transcripts([first, second], max_overlap_words=3) == first + ' ' + second
+
+
+def test_no_overlap_concatenates():
+    assert stitch_transcripts(["שלום לך", "מה שלומך היום"]) == "שלום לך מה שלומך היום"
+
+
+def test_single_shared_word_not_stitched():
+    assert stitch_transcripts(["הלכנו הביתה", "הביתה מוקדם"]) == "הלכנו הביתה הביתה מוקדם"
+
+
+def test_empty_segments():
+    assert stitch_transcripts(["", "טקסט", None, "נוסף"]) == "טקסט נוסף"
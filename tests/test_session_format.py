@@ -0,0 +1,61 @@
+# test_session_format.py - פורמט סשן v2: הלוך-חזור, קריאת כותרת בלבד, וקריאה והמרה של קבצי JSON ישנים
+import os
+import json
+
+from session_format import (SESSION_MAGIC, SESSION_EXTENSION, decode_session, encode_session, migrate_file,
+                            read_session, read_session_header, write_session)
+
+SESSION = {
+    'session_id': 'abc123',
+    'patient_name': 'דני כהן',
+    'session_date': '2024-01-01',
+    'word_count': 3,
+    'quality_mode': 'local',
+    'original_transcript': 'שלום מה שלומך',
+    'corrected_transcript': 'שלום מה שלומך',
+}
+
+
+def test_v2_round_trip(tmp_path):
+    session_file = str(tmp_path / f'session{SESSION_EXTENSION}')
+    write_session(session_file, SESSION)
+    
+    with open(session_file, 'rb') as f:
+        assert f.read(len(SESSION_MAGIC)) == SESSION_MAGIC
+    assert read_session(session_file) == SESSION
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_corrected_transcript_stored_once_unless_changed():
+    assert decode_session(encode_session(SESSION)) == SESSION
+    corrected = dict(SESSION, corrected_transcript='שלום, מה שלומך?')
+    assert decode_session(encode_session(corrected)) == corrected
+
+
+def test_header_read_without_body(tmp_path):
+    session_file = str(tmp_path / f'session{SESSION_EXTENSION}')
+    write_session(session_file, SESSION)
+    header = read_session_header(session_file)
+    assert header == {'session_id': 'abc123', 'patient_name': 'דני כהן', 'session_date': '2024-01-01',
+                      'word_count': 3, 'quality_mode': 'local'}
+
+
+def test_legacy_json_read(tmp_path):
+    legacy_file = tmp_path / 'session.json'
+    legacy_file.write_text(json.dumps(SESSION, ensure_ascii=False), encoding='utf-8')
+    assert read_session(str(legacy_file)) == SESSION
+    assert read_session_header(str(legacy_file))['patient_name'] == 'דני כהן'
+
+
+def test_legacy_json_migrated(tmp_path):
+    legacy_session = {key: value for key, value in SESSION.items() if key != 'session_id'}
+    legacy_file = tmp_path / 'session.json'
+    legacy_file.write_text(json.dumps(legacy_session, ensure_ascii=False), encoding='utf-8')
+    
+    new_file, _, _, session_data = migrate_file(str(legacy_file), session_id='old-path-id')
+    
+    assert new_file == str(tmp_path / f'session{SESSION_EXTENSION}')
+    assert not legacy_file.exists()
+    # המזהה מהנתיב הישן נשמר - קישורים קיימים ממשיכים לעבוד
+    assert read_session(new_file) == dict(legacy_session, session_id='old-path-id') == session_data
+    assert migrate_file(new_file) is None
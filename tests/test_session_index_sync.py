@@ -0,0 +1,108 @@
+# test_session_index_sync.py - שני שרתים עם אינדקס משלהם ואחסון S3 משותף (FakeS3Server)
+import os
+import sys
+
+import pytest
+
+import session_index
+from session_format import new_session_file
+from session_index import SessionIndex
+from session_storage import FakeS3Server, S3Storage
+
+
+@pytest.fixture
+def s3_server():
+    server = FakeS3Server().start()
+    yield server
+    server.stop()
+
+
+def make_node(tmp_path, name, endpoint):
+    storage = S3Storage(endpoint, 'sessions', 'key', 'secret')
+    (tmp_path / name).mkdir()
+    return SessionIndex(str(tmp_path / name / 'transcripts'), str(tmp_path / name / 'index.db'),
+                        storage='s3', object_store=storage)
+
+
+def save(index, patient_name, text):
+    patient_folder = os.path.join(index.transcripts_folder, 'user_1', patient_name)
+    os.makedirs(patient_folder, exist_ok=True)
+    session_file, session_id = new_session_file(patient_folder)
+    index.save_session(session_file, {'session_id': session_id, 'patient_name': patient_name,
+                                      'corrected_transcript': text})
+    return session_file, session_id
+
+
+@pytest.fixture
+def nodes(tmp_path, s3_server):
+    S3Storage(s3_server.endpoint, 'sessions', 'key', 'secret').ensure_bucket()
+    return make_node(tmp_path, 'a', s3_server.endpoint), make_node(tmp_path, 'b', s3_server.endpoint)
+
+
+def test_sync_adds_sessions_saved_by_other_node(nodes):
+    a, b = nodes
+    save(a, 'דני', 'שיחה ראשונה')
+    save(a, 'רות', 'שיחה שנייה')
+    assert b.count_sessions() == 0
+    
+    assert b.sync_object_store() == (2, 0)
+    assert b.count_sessions() == 2
+    assert b.count_patients() == 2
+    # הסנכרון השני לא קורא שוב את מה שלא השתנה
+    assert b.sync_object_store() == (0, 0)
+
+
+def test_sync_removes_sessions_deleted_by_other_node(nodes):
+    a, b = nodes
+    session_file, _ = save(a, 'דני', 'שיחה')
+    b.sync_object_store()
+    
+    a.delete_session(session_file)
+    assert b.sync_object_store() == (0, 1)
+    assert b.count_sessions() == 0
+    # למטופל אין תיקייה בשרת b - הוא נמחק איתו
+    assert b.count_patients() == 0
+
+
+def test_sync_picks_up_changed_session(nodes):
+    a, b = nodes
+    session_file, session_id = save(a, 'דני', 'טקסט ישן')
+    b.sync_object_store()
+    
+    a.save_session(session_file, {'session_id': session_id, 'patient_name': 'דני',
+                                  'corrected_transcript': 'טקסט חדש לגמרי', 'word_count': 3})
+    assert b.sync_object_store() == (1, 0)
+    location = b.resolve(session_id)
+    assert b.read_session(location['path'])['corrected_transcript'] == 'טקסט חדש לגמרי'
+
+
+def test_own_saves_are_not_read_back(nodes):
+    a, _ = nodes
+    save(a, 'דני', 'שיחה')
+    # הסשן נשמר מהשרת הזה - הסנכרון רק רושם את הגרסה
+    assert a.sync_object_store() == (0, 0)
+    assert a.count_sessions() == 1
+
+
+def test_resolve_miss_syncs(nodes):
+    a, b = nodes
+    _, session_id = save(a, 'דני', 'שיחה')
+    location = b.resolve(session_id)
+    assert location is not None
+    assert b.read_session(location['path'])['corrected_transcript'] == 'שיחה'
+
+
+def test_cli_rebuild_lists_the_configured_store(tmp_path, monkeypatch):
+    monkeypatch.setenv('SESSION_STORAGE', 'sqlite')
+    monkeypatch.setenv('SESSION_STORE_DB', str(tmp_path / 'store.db'))
+    transcripts, db_path = str(tmp_path / 'transcripts'), str(tmp_path / 'index.db')
+    index = SessionIndex(transcripts, db_path, storage='sqlite')
+    save(index, 'דני', 'שיחה ראשונה')
+    assert index.count_sessions() == 1
+    
+    monkeypatch.setattr(sys, 'argv', ['session_index.py', 'rebuild', transcripts, db_path])
+    session_index.main()
+    
+    rebuilt = SessionIndex(transcripts, db_path, storage='sqlite')
+    assert rebuilt.count_sessions() == 1
+    assert rebuilt.count_patients() == 1
@@ -0,0 +1,66 @@
+# test_transcript_cache.py - מטמון התמלולים: מפתח לפי שמע + מנוע + הגדרות, הצפנה ופינוי LRU
+import sqlite3
+import hashlib
+
+import pytest
+
+from transcript_cache import TranscriptCache, CRYPTO_AVAILABLE
+from transcription_backends import LocalStandInBackend, IvritAIBackend
+
+pytestmark = pytest.mark.skipif(not CRYPTO_AVAILABLE, reason='cryptography לא מותקן')
+
+AUDIO = hashlib.sha256(b'recording-1').hexdigest()
+OTHER_AUDIO = hashlib.sha256(b'recording-2').hexdigest()
+
+
+class EnglishBackend(LocalStandInBackend):
+    def cache_params(self):
+        return {'language_code': 'en'}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TranscriptCache(str(tmp_path / 'cache.db'))
+
+
+def test_hit_for_same_audio_and_backend(cache):
+    cache.put(AUDIO, LocalStandInBackend(), 'שלום עולם')
+    assert cache.get(AUDIO, LocalStandInBackend()) == 'שלום עולם'
+
+
+def test_key_isolated_by_audio_backend_and_params(cache):
+    cache.put(AUDIO, LocalStandInBackend(), 'שלום עולם')
+    assert cache.get(OTHER_AUDIO, LocalStandInBackend()) is None
+    assert cache.get(AUDIO, IvritAIBackend()) is None
+    assert cache.get(AUDIO, EnglishBackend()) is None
+    assert cache.get(None, LocalStandInBackend()) is None
+
+
+def test_text_stored_encrypted(cache):
+    cache.put(AUDIO, LocalStandInBackend(), 'שלום עולם')
+    conn = sqlite3.connect(cache.db_path)
+    rows = conn.execute('SELECT cache_key, encrypted_text FROM transcript_cache').fetchall()
+    conn.close()
+    assert len(rows) == 1
+    cache_key, encrypted_text = rows[0]
+    assert AUDIO not in cache_key
+    assert 'שלום עולם'.encode('utf-8') not in encrypted_text
+
+
+def test_least_recently_used_evicted(tmp_path):
+    backend = LocalStandInBackend()
+    probe = TranscriptCache(str(tmp_path / 'probe.db'))
+    probe.put(AUDIO, backend, 'א' * 100)
+    entry_size = sqlite3.connect(probe.db_path).execute('SELECT size FROM transcript_cache').fetchone()[0]
+    
+    cache = TranscriptCache(str(tmp_path / 'cache.db'), max_size_bytes=entry_size * 2)
+    audio = [hashlib.sha256(f'recording-{n}'.encode()).hexdigest() for n in range(3)]
+    cache.put(audio[0], backend, 'א' * 100)
+    cache.put(audio[1], backend, 'ב' * 100)
+    # שימוש ברשומה הראשונה - השנייה הופכת לוותיקה ביותר
+    assert cache.get(audio[0], backend) is not None
+    cache.put(audio[2], backend, 'ג' * 100)
+    
+    assert cache.get(audio[0], backend) == 'א' * 100
+    assert cache.get(audio[1], backend) is None
+    assert cache.get(audio[2], backend) == 'ג' * 100
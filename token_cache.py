@@ -0,0 +1,65 @@
+# token_cache.py - מטמון טוקנים מאומתים בזיכרון: LRU עם תוקף, כדי שבקשה מאומתת לא תפנה למסד הנתונים
+import time
+import threading
+from collections import OrderedDict
+
+# כמה זמן טוקן מאומת נשמר - גם הזמן המקסימלי שבו שינוי מתהליך אחר (יציאה, השבתה) עוד לא נראה
+TOKEN_CACHE_TTL_SECONDS = 30
+TOKEN_CACHE_MAX_ENTRIES = 10000
+
+
+class TokenCache:
+    """טוקן -> פרטי המשתמש שאומתו, בתוך התהליך. ביטול לפי טוקן (יציאה) או לפי משתמש (סיסמה, השבתה, מנוי)"""
+    
+    def __init__(self, ttl_seconds=TOKEN_CACHE_TTL_SECONDS, max_entries=TOKEN_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, token):
+        """פרטי המשתמש אם הטוקן במטמון ובתוקף, אחרת None"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires, user_data = entry
+            if expires <= time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return dict(user_data)
+    
+    def put(self, token, user_data, expires_in=None):
+        """expires_in - כמה שניות נשאר לטוקן עצמו, אם פחות מ-TTL"""
+        ttl = self.ttl_seconds if expires_in is None else max(0, min(self.ttl_seconds, expires_in))
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (time.monotonic() + ttl, dict(user_data))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def update_user(self, user_id, **changes):
+        """עדכון שדות (מונים) בכל הטוקנים של המשתמש שבמטמון - בלי לאמת מחדש"""
+        with self._lock:
+            for _, user_data in self._entries.values():
+                if user_data.get('user_id') == user_id:
+                    for field, change in changes.items():
+                        user_data[field] = change(user_data.get(field)) if callable(change) else change
+    
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+    
+    def invalidate_user(self, user_id):
+        """הסרת כל הטוקנים של משתמש מהמטמון"""
+        with self._lock:
+            for token in [token for token, (_, user_data) in self._entries.items()
+                          if user_data.get('user_id') == user_id]:
+                del self._entries[token]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,141 @@
+# transcript_cache.py - מטמון תמלולים לפי תוכן הקובץ (אותה הקלטה לא מתומללת ומחויבת פעמיים)
+import time
+import json
+import base64
+import hashlib
+from sqlite_pool import connect_db
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    CRYPTO_AVAILABLE = True
+except ImportError:
+    CRYPTO_AVAILABLE = False
+
+# גודל בלוק לחישוב hash של קובץ שמע
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def sha256_file(file_path):
+    """hash של קובץ בבלוקים - בלי לטעון את כולו לזיכרון"""
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class TranscriptCache:
+    """מטמון תמלולים מוצפן: מפתח = hash השמע + הגדרות התמלול + המנוע, פינוי LRU לפי גודל"""
+    
+    def __init__(self, db_path='transcript_cache.db', max_size_bytes=100 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_size_bytes = max_size_bytes
+        self.enabled = CRYPTO_AVAILABLE
+        if not self.enabled:
+            print("⚠️ מטמון תמלולים כבוי - חסרה ספריית cryptography")
+            return
+        self.init_database()
+    
+    def _connect(self):
+        return connect_db(self.db_path)
+    
+    def init_database(self):
+        """יצירת טבלת המטמון"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transcript_cache (
+                cache_key TEXT PRIMARY KEY,
+                backend TEXT NOT NULL,
+                encrypted_text BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transcript_cache_last_accessed
+            ON transcript_cache (last_accessed)
+        ''')
+        
+        conn.commit()
+        conn.close()
+    
+    def _keys(self, audio_sha256, backend):
+        """מפתח חיפוש ומפתח הצפנה - שניהם נגזרים מתוכן השמע, ואחד לא מגלה את השני"""
+        material = json.dumps({
+            'audio_sha256': audio_sha256,
+            'backend': backend.name,
+            'params': backend.cache_params()
+        }, sort_keys=True).encode('utf-8')
+        
+        cache_key = hashlib.sha256(b'lookup:' + material).hexdigest()
+        # בלי קובץ השמע המקורי אי אפשר לפענח את הרשומה - גם לא עם גישה למסד
+        fernet_key = base64.urlsafe_b64encode(hashlib.sha256(b'encrypt:' + material).digest())
+        return cache_key, Fernet(fernet_key)
+    
+    def get(self, audio_sha256, backend):
+        """תמלול שמור לקובץ הזה, או None"""
+        if not self.enabled or not audio_sha256 or backend is None:
+            return None
+        
+        cache_key, fernet = self._keys(audio_sha256, backend)
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT encrypted_text FROM transcript_cache WHERE cache_key = ?', (cache_key,))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('UPDATE transcript_cache SET last_accessed = ? WHERE cache_key = ?',
+                           (time.time(), cache_key))
+            conn.commit()
+        conn.close()
+        
+        if not row:
+            return None
+        
+        try:
+            return fernet.decrypt(row[0]).decode('utf-8')
+        except InvalidToken:
+            print(f"⚠️ רשומת מטמון פגומה: {cache_key[:12]}")
+            return None
+    
+    def put(self, audio_sha256, backend, text):
+        """שמירת תמלול במטמון ופינוי הרשומות הישנות ביותר אם עברנו את הגודל המותר"""
+        if not self.enabled or not audio_sha256 or backend is None or text is None:
+            return
+        
+        cache_key, fernet = self._keys(audio_sha256, backend)
+        encrypted_text = fernet.encrypt(text.encode('utf-8'))
+        now = time.time()
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO transcript_cache
+            (cache_key, backend, encrypted_text, size, created_at, last_accessed)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (cache_key, backend.name, encrypted_text, len(encrypted_text), now, now))
+        
+        cursor.execute('SELECT COALESCE(SUM(size), 0) FROM transcript_cache')
+        total_size = cursor.fetchone()[0]
+        
+        evicted = 0
+        if total_size > self.max_size_bytes:
+            cursor.execute('SELECT cache_key, size FROM transcript_cache ORDER BY last_accessed')
+            for old_key, size in cursor.fetchall():
+                if total_size <= self.max_size_bytes:
+                    break
+                cursor.execute('DELETE FROM transcript_cache WHERE cache_key = ?', (old_key,))
+                total_size -= size
+                evicted += 1
+        
+        conn.commit()
+        conn.close()
+        
+        if evicted:
+            print(f"🧹 פונו {evicted} תמלולים ישנים מהמטמון")
@@ -0,0 +1,194 @@
+# transcription_backends.py - ממשק אחיד למנועי תמלול ורישום מנועים לפי שם
+import abc
+import time
+import hashlib
+import threading
+import assemblyai as aai
+
+# מצבי תמלול אצל המנוע
+BACKEND_QUEUED = 'queued'
+BACKEND_PROCESSING = 'processing'
+BACKEND_COMPLETED = 'completed'
+BACKEND_ERROR = 'error'
+
+# גודל בלוק לקריאת קובץ שמע מהדיסק
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class TranscriptionBackend(abc.ABC):
+    """ממשק בסיס למנוע תמלול: submit, poll, cancel ו-result"""
+    
+    name = None
+    poll_interval = 3.0
+    # מנוע דמה - הטקסט לא תמלול של השמע, והסשן מסומן ולא נכנס לחיפוש
+    stand_in = False
+    
+    @abc.abstractmethod
+    def submit(self, audio) -> str:
+        """שליחת שמע לתמלול - נתיב לקובץ או איטרטור של בלוקים. מחזיר מזהה תמלול אצל המנוע"""
+    
+    @abc.abstractmethod
+    def poll(self, ref: str) -> str:
+        """מצב התמלול - אחד מ-BACKEND_QUEUED/PROCESSING/COMPLETED/ERROR"""
+    
+    @abc.abstractmethod
+    def cancel(self, ref: str):
+        """ביטול תמלול ומחיקת הנתונים שלו אצל המנוע"""
+    
+    @abc.abstractmethod
+    def result(self, ref: str):
+        """תוצאת תמלול שהסתיים - מחזיר (הצלחה, טקסט או הודעת שגיאה)"""
+    
+    def cache_params(self) -> dict:
+        """הגדרות שמשפיעות על הטקסט - חלק ממפתח מטמון התמלולים"""
+        return {}
+    
+    def wait(self, ref: str):
+        """המתנה עד שהתמלול מסתיים - מחזיר את המצב הסופי"""
+        while True:
+            status = self.poll(ref)
+            if status in (BACKEND_COMPLETED, BACKEND_ERROR):
+                return status
+            time.sleep(self.poll_interval)
+
+
+class AssemblyAIBackend(TranscriptionBackend):
+    """תמלול בענן עם AssemblyAI"""
+    
+    name = 'assemblyai'
+    
+    def __init__(self, api_key, language_code='he', punctuate=True, format_text=True):
+        self.api_key = api_key
+        aai.settings.api_key = api_key
+        self.config = aai.TranscriptionConfig(
+            language_code=language_code,
+            punctuate=punctuate,
+            format_text=format_text
+        )
+    
+    def cache_params(self) -> dict:
+        return {
+            'language_code': self.config.language_code,
+            'punctuate': self.config.punctuate,
+            'format_text': self.config.format_text
+        }
+    
+    def _http_client(self):
+        return aai.Client.get_default().http_client
+    
+    def submit(self, audio) -> str:
+        # העלאה בזרימה - קובץ פתוח או בלוקים, בלי לטעון את כל השמע לזיכרון
+        if isinstance(audio, str):
+            with open(audio, 'rb') as audio_file:
+                upload_url = aai.api.upload_file(self._http_client(), audio_file)
+        else:
+            upload_url = aai.api.upload_file(self._http_client(), audio)
+        
+        transcript = aai.Transcriber(config=self.config).submit(upload_url)
+        return transcript.id
+    
+    def poll(self, ref: str) -> str:
+        response = aai.api.get_transcript(self._http_client(), ref)
+        return response.status.value
+    
+    def cancel(self, ref: str):
+        # AssemblyAI לא מאפשר לעצור תמלול באמצע - מחיקה מסירה את השמע והטקסט מהשרת שלהם
+        aai.api.delete_transcript(self._http_client(), ref)
+    
+    def result(self, ref: str):
+        response = aai.api.get_transcript(self._http_client(), ref)
+        if response.status == aai.TranscriptStatus.error:
+            return False, response.error
+        return True, response.text or ''
+
+
+class LocalStandInBackend(TranscriptionBackend):
+    """מנוע מקומי דטרמיניסטי - לבדיקות עומס ולפיתוח בלי רשת. מחזיר טקסט דמה קבוע, לא תמלול"""
+    # התוצאה נגזרת מהמזהה בלבד - כך גם עבודה שממשיכה אחרי הפעלה מחדש של ה-worker מקבלת את אותה תוצאה
+    
+    name = 'local'
+    poll_interval = 0.05
+    stand_in = True
+    text_prefix = 'תמלול מקומי'
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._submitted = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, audio) -> str:
+        audio_hash = hashlib.sha256()
+        size = 0
+        if isinstance(audio, str):
+            with open(audio, 'rb') as audio_file:
+                for block in iter(lambda: audio_file.read(READ_BLOCK_SIZE), b''):
+                    audio_hash.update(block)
+                    size += len(block)
+        else:
+            for block in audio:
+                audio_hash.update(block)
+                size += len(block)
+        
+        ref = f"{self.name}-{audio_hash.hexdigest()[:32]}-{size}"
+        with self._lock:
+            self._submitted[ref] = time.monotonic()
+        return ref
+    
+    def poll(self, ref: str) -> str:
+        with self._lock:
+            submitted_at = self._submitted.get(ref)
+        if submitted_at is not None and time.monotonic() - submitted_at < self.latency:
+            return BACKEND_PROCESSING
+        return BACKEND_COMPLETED
+    
+    def cancel(self, ref: str):
+        with self._lock:
+            self._submitted.pop(ref, None)
+    
+    def result(self, ref: str):
+        try:
+            _, _, size = ref.rsplit('-', 2)
+            int(size)
+        except ValueError:
+            return False, f'מזהה תמלול לא תקין: {ref}'
+        return True, self.text_prefix
+
+
+class IvritAIBackend(LocalStandInBackend):
+    """ivrit.ai - כרגע סימולציה, בעתיד יש להוסיף API אמיתי של ivrit.ai"""
+    
+    name = 'ivrit-ai'
+    text_prefix = 'תמלול דמה עם ivrit.ai'
+
+
+# רישום מנועים - כל מנוע נוצר פעם אחת בתהליך ומשותף לכל ה-workers
+_backend_factories = {}
+_backend_instances = {}
+_registry_lock = threading.Lock()
+
+
+def register_backend(name, factory):
+    """רישום מנוע תמלול לפי שם (factory - מחלקה או פונקציה שיוצרת את המנוע)"""
+    # מחלקה שחסרה בה אחת מפעולות הממשק נכשלת כבר ברישום, לא בעבודת התמלול הראשונה
+    missing = getattr(factory, '__abstractmethods__', None)
+    if missing:
+        raise TypeError(f"מנוע התמלול {name} לא מממש: {', '.join(sorted(missing))}")
+    with _registry_lock:
+        _backend_factories[name] = factory
+        _backend_instances.pop(name, None)
+
+
+def get_backend(name):
+    """המנוע הרשום בשם זה, או None אם אין כזה"""
+    with _registry_lock:
+        if name not in _backend_factories:
+            return None
+        if name not in _backend_instances:
+            _backend_instances[name] = _backend_factories[name]()
+        return _backend_instances[name]
+
+
+def available_backends():
+    """שמות כל המנועים הרשומים"""
+    with _registry_lock:
+        return sorted(_backend_factories)
@@ -1,20 +1,20 @@
 #!/usr/bin/env python3
 # user_management.py - כלי לניהול משתמשים
 import sqlite3
-import bcrypt
+from sqlite_pool import connect_db
 import datetime
 import secrets
-from auth_manager import AuthManager
+from auth_manager import get_auth_manager
 
 class UserManagement:
     def __init__(self):
-        self.auth_manager = AuthManager()
+        self.auth_manager = get_auth_manager()
         self.db_path = 'users.db'
     
     def list_users(self):
         """הצגת כל המשתמשים"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -47,16 +47,23 @@ class UserManagement:
     def list_sessions(self):
         """הצגת כל הסשנים הפעילים"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
+            # session tokens ישנים + כניסות עם טוקן רענון (ID שמתחיל ב-r, הטוקן עצמו לא נשמר - מוצג ה-hash)
+            now = datetime.datetime.now().isoformat()
             cursor.execute('''
                 SELECT s.id, s.user_id, u.email, s.session_token, s.expires_at, s.created_at
                 FROM sessions s
                 JOIN users u ON s.user_id = u.id
                 WHERE s.expires_at > ?
-                ORDER BY s.created_at DESC
-            ''', (datetime.datetime.now().isoformat(),))
+                UNION ALL
+                SELECT 'r' || r.rowid, r.user_id, u.email, r.token_hash, r.expires_at, r.created_at
+                FROM refresh_tokens r
+                JOIN users u ON r.user_id = u.id
+                WHERE r.expires_at > ?
+                ORDER BY 6 DESC
+            ''', (now, now))
             
             sessions = cursor.fetchall()
             conn.close()
@@ -95,7 +102,7 @@ class UserManagement:
     def delete_user(self, user_id):
         """מחיקת משתמש"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # קבלת פרטי המשתמש לפני המחיקה
@@ -116,6 +123,7 @@ class UserManagement:
             
             conn.commit()
             conn.close()
+            self.auth_manager.revoke_user_tokens(user_id)
             
             print(f"✅ משתמש {email} נמחק בהצלחה")
             return True
@@ -127,7 +135,7 @@ class UserManagement:
     def reset_user_password(self, email, new_password):
         """איפוס סיסמת משתמש"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             # בדיקה אם המשתמש קיים
@@ -139,13 +147,14 @@ class UserManagement:
                 return False
             
             # הצפנת הסיסמה החדשה
-            password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            password_hash = self.auth_manager.hash_password(new_password)
             
             # עדכון הסיסמה
             cursor.execute('UPDATE users SET password_hash = ? WHERE email = ?', (password_hash, email))
             
             conn.commit()
             conn.close()
+            self.auth_manager.revoke_user_tokens(user[0])
             
             print(f"✅ סיסמה אופסה בהצלחה עבור {email}")
             return True
@@ -157,7 +166,7 @@ class UserManagement:
     def activate_user(self, user_id):
         """הפעלת משתמש"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('UPDATE users SET is_active = 1 WHERE id = ?', (user_id,))
@@ -179,7 +188,7 @@ class UserManagement:
     def deactivate_user(self, user_id):
         """השבתת משתמש"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = connect_db(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('UPDATE users SET is_active = 0 WHERE id = ?', (user_id,))
@@ -193,6 +202,7 @@ class UserManagement:
             
             conn.commit()
             conn.close()
+            self.auth_manager.revoke_user_tokens(user_id)
             
             print(f"✅ משתמש {user_id} הושבת בהצלחה")
             return True
@@ -202,16 +212,9 @@ class UserManagement:
             return False
     
     def clear_expired_sessions(self):
-        """ניקוי סשנים שפג תוקפם"""
+        """ניקוי סשנים, טוקני רענון וטוקני איפוס שפג תוקפם (בקבוצות קטנות)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM sessions WHERE expires_at < ?', (datetime.datetime.now().isoformat(),))
-            deleted_count = cursor.rowcount
-            
-            conn.commit()
-            conn.close()
+            deleted_count = self.auth_manager.access_tokens.purge_expired()
             
             print(f"✅ נוקו {deleted_count} סשנים שפג תוקפם")
             return True